@@ -6,90 +6,647 @@ import importlib.util
 import os
 import logging
 import time
-import ast
 import math
+import glob
+import argparse
+import json
+import signal
+from enum import Enum
+from functools import lru_cache
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import instrumentation
+from ingest import LineIndex, join_lines, read_source
+from invariants import hoist, hoistable, loop_invariants, taken_names
+from symbols import Marker, SymbolTable
+
+# Bump whenever detector output changes so cached results are invalidated
+RULESET_VERSION = "6"
+
+def unparse(node: ast.AST) -> str:
+    """ast.unparse, timed as its own phase when instrumentation is enabled"""
+    active = instrumentation.active()
+    if active is None:
+        return ast.unparse(node)
+    start = time.perf_counter()
+    text = ast.unparse(node)
+    active.record_phase('unparse', time.perf_counter() - start)
+    return text
+
+def assigned_target(node: ast.AST) -> ast.expr:
+    """The target of an Assign's first target list, or of an AugAssign"""
+    return node.targets[0] if isinstance(node, ast.Assign) else node.target
+
+def render(text):
+    """Text as given, or produced by calling it when it is a lazy renderer"""
+    return text() if callable(text) else text
+
+class IssueKind(str, Enum):
+    """Titles of the built-in issues, each with the recommendation it is usually reported with"""
+    NESTED_LOOP_APPEND = ("Nested loops with conditional append", "Use list comprehension")
+    RANGE_LEN = ("range(len()) antipattern", "Use enumerate() or direct iteration")
+    LIST_COPY = ("Inefficient list copy", "Use list.copy() method")
+    STRING_CONCAT = ("Multiple string concatenations", "Use str.join()")
+    IF_CHAIN = ("Long if-elif chain", "Use dictionary mapping")
+    REDUNDANT_SORT = ("Redundant sort operation", "Use single sort with reverse=True")
+    APPEND_RUN = ("Multiple list append operations", "Use list.extend()")
+    LOOP_INVARIANT = ("Loop-invariant computation", "Hoist invariant work out of the loop")
+    UNUSED_VARIABLE = ("Unused variable", None)
+
+    def __new__(cls, title: str, recommendation: str):
+        member = str.__new__(cls, title)
+        member._value_ = title
+        member.recommendation = recommendation
+        return member
+
+def issue_kind(title: str):
+    """The IssueKind for a title, or the interned title itself for custom rules"""
+    try:
+        return IssueKind(title)
+    except ValueError:
+        return sys.intern(title)
+
+class Issue:
+    """
+    A single finding, kept compact for repo-wide runs: slots instead of a
+    dict, a shared kind instead of a title string, no recommendation when
+    it is the kind's usual one, and optimization text rendered on first
+    read. Reads like the dict it replaces (issue["line"], dict(issue),
+    .get) and to_dict() gives that shape for JSON.
+    """
+    __slots__ = ('line', 'kind', 'span', '_recommendation', '_optimization')
+    FIELDS = ('line', 'issue', 'recommendation', 'optimization')
+
+    def __init__(self, line: int, kind, recommendation: str = None, optimization=None,
+                 span: Tuple[int, int] = None):
+        self.line = line
+        self.kind = kind if isinstance(kind, IssueKind) else issue_kind(kind)
+        default = getattr(self.kind, 'recommendation', None)
+        self._recommendation = None if recommendation == default else recommendation
+        self._optimization = optimization
+        self.span = span
+
+    @property
+    def issue(self) -> str:
+        return self.kind.value if isinstance(self.kind, IssueKind) else self.kind
+
+    @property
+    def recommendation(self) -> str:
+        if self._recommendation is None:
+            return getattr(self.kind, 'recommendation', None)
+        return self._recommendation
+
+    @property
+    def optimization(self):
+        if callable(self._optimization):
+            self._optimization = self._optimization()
+        return self._optimization
+
+    def keys(self):
+        return self.FIELDS if self._optimization is not None else self.FIELDS[:3]
+
+    def __getitem__(self, key):
+        if key in self.keys():
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def to_dict(self) -> Dict:
+        return {key: self[key] for key in self.keys()}
+
+    def moved(self, offset: int) -> 'Issue':
+        """The same finding shifted down by offset lines, sharing its renderer"""
+        span = (self.span[0] + offset, self.span[1] + offset) if self.span else None
+        return Issue(self.line + offset, self.kind, self._recommendation, self._optimization, span)
+
+    def without_optimization(self) -> 'Issue':
+        return Issue(self.line, self.kind, self._recommendation, None, self.span)
+
+    def __eq__(self, other):
+        if isinstance(other, (Issue, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Issue({self.to_dict()!r})"
+
+    def __reduce__(self):
+        # Renderers close over AST nodes, so pickle the rendered text
+        return Issue, (self.line, self.kind, self._recommendation, self.optimization, self.span)
+
+# AST node types counted by the emission metrics, keyed to the metric they feed
+METRIC_NODE_TYPES = {
+    ast.For: 'loop_count',
+    ast.While: 'loop_count',
+    ast.BinOp: 'operation_count',
+    ast.List: 'memory_operations',
+    ast.Call: 'function_calls',
+}
+
+# Weight of each metric in the complexity score. Work a loop repeats on
+# every iteration although its inputs never change weighs the most.
+COMPLEXITY_WEIGHTS = {
+    'loop_count': 2.5,
+    'operation_count': 1.0,
+    'memory_operations': 1.5,
+    'function_calls': 1.2,
+    'invariant_computations': 3.0,
+}
+
+# Version of the metric counts and weights above, bumped only when they would change a stored
+# count or score; stored scores from another version are recomputed
+METRICS_VERSION = "2"
+
+# Base emission factor (kg CO2 per complexity unit)
+BASE_EMISSION_FACTOR = 0.0001
+
+# Optimized code should have lower emissions due to better efficiency
+OPTIMIZATION_FACTOR = 0.6  # 40% reduction for optimized code
+
+# Node fields that never lead to a counted node: contexts, operators and plain names
+LEAF_FIELDS = frozenset({'ctx', 'op', 'id', 'attr', 'arg', 'name', 'names', 'asname', 'module', 'level',
+                         'kind', 'type_comment', 'conversion', 'is_async', 'simple', 'kwd_attrs', 'rest'})
+
+# Fields worth descending into, per node type; filled in as types are first seen
+_CHILD_FIELDS = {type(None): ()}
+
+def _child_fields(node_type: type) -> Tuple[str, ...]:
+    if issubclass(node_type, ast.AST) and node_type is not ast.Constant:
+        fields = tuple(field for field in node_type._fields if field not in LEAF_FIELDS)
+    else:
+        fields = ()
+    _CHILD_FIELDS[node_type] = fields
+    return fields
 
-logging.basicConfig(level=logging.DEBUG)
+def count_metrics(tree: ast.AST) -> Dict[str, int]:
+    """
+    Count loops, operations, list literals and calls in a single tree walk.
+    Only fields that can hold such nodes are visited, which skips the
+    context, operator and constant leaves that make up much of any tree.
+    Loop-invariant computations need the symbol table, which only the
+    analyzer walk builds, so they are left at 0 here (see scan_metrics).
+    """
+    counts = {'loop_count': 0, 'operation_count': 0, 'memory_operations': 0, 'function_calls': 0,
+              'invariant_computations': 0}
+    metric_for = METRIC_NODE_TYPES.get
+    fields_for = _CHILD_FIELDS.get
+    stack = [tree]
+    push, extend, pop = stack.append, stack.extend, stack.pop
+    while stack:
+        node = pop()
+        node_type = type(node)
+        metric = metric_for(node_type)
+        if metric is not None:
+            counts[metric] += 1
+        fields = fields_for(node_type)
+        if fields is None:
+            fields = _child_fields(node_type)
+        for field in fields:
+            value = getattr(node, field, None)
+            if type(value) is list:
+                extend(value)
+            elif value is not None:
+                push(value)
+    return counts
+
+def walk_metrics(tree: ast.AST) -> Dict[str, int]:
+    """All metric counts, loop-invariant computations included, from one analyzer walk without rules"""
+    return CodeAnalyzer('', rules=[]).run_rules(tree)
+
+def scan_metrics(code: str) -> Dict[str, int]:
+    """
+    Metric counts for source that only needs an emission estimate, the same
+    as a full analysis gives. The tree is dropped as soon as it is counted.
+    Only trees with loops can hold loop-invariant computations, and only
+    those take the analyzer walk that finds them.
+    """
+    with instrumentation.phase('scan'):
+        tree = ast.parse(code)
+        counts = count_metrics(tree)
+        if counts['loop_count']:
+            counts = walk_metrics(tree)
+        return counts
+
+# Fields holding only expression contexts and operators, which rules read off their parent node
+OPERATOR_FIELDS = frozenset({'ctx', 'op', 'ops'})
+OPERATOR_TYPES = (ast.expr_context, ast.operator, ast.unaryop, ast.cmpop, ast.boolop)
+
+def _walk_fields(node_type: type, prune: bool) -> Tuple[str, ...]:
+    if prune:
+        return tuple(field for field in node_type._fields if field not in OPERATOR_FIELDS)
+    return node_type._fields
+
+class ParsedModule:
+    """Source parsed once and shared by the analyzer, metrics and emission steps"""
+    def __init__(self, code: str, metrics: Dict[str, int] = None):
+        self.code = code
+        self.lines = LineIndex(code)
+        self._tree = None
+        self._metrics = metrics
+
+    @classmethod
+    def from_file(cls, path: str) -> 'ParsedModule':
+        return cls(read_source(path))
+
+    @property
+    def tree(self) -> ast.Module:
+        """Module AST, parsed on first access and reused afterwards"""
+        if self._tree is None:
+            with instrumentation.phase('parse'):
+                self._tree = ast.parse(self.code)
+        return self._tree
+
+    @property
+    def line_count(self) -> int:
+        return len(self.lines)
+
+    @property
+    def metrics(self) -> Dict[str, int]:
+        """Metric counts, computed on first access and reused afterwards"""
+        if self._metrics is None:
+            self._metrics = walk_metrics(self.tree)
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, counts: Dict[str, int]):
+        self._metrics = counts
+
+    @property
+    def metrics_pending(self) -> bool:
+        """True until metric counts have been computed or supplied"""
+        return self._metrics is None
 
 class CodeMetricsCalculator:
     """Calculate code complexity and efficiency metrics for emission estimation"""
-    def __init__(self, code: str):
+    def __init__(self, code: str, parsed: ParsedModule = None):
         self.code = code
-        self.ast_tree = ast.parse(code)
+        self.parsed = parsed if parsed is not None else ParsedModule(code)
+
+    @property
+    def ast_tree(self) -> ast.Module:
+        return self.parsed.tree
         
     def calculate_complexity_score(self) -> float:
         """Calculate complexity score based on code structure"""
-        self.loop_count = 0
-        self.operation_count = 0
-        self.memory_operations = 0
-        self.function_calls = 0
-        
-        class MetricsVisitor(ast.NodeVisitor):
-            def __init__(self, calculator):
-                self.calc = calculator
-                
-            def visit_For(self, node):
-                self.calc.loop_count += 1
-                self.generic_visit(node)
-                
-            def visit_While(self, node):
-                self.calc.loop_count += 1
-                self.generic_visit(node)
-                
-            def visit_BinOp(self, node):
-                self.calc.operation_count += 1
-                self.generic_visit(node)
-                
-            def visit_List(self, node):
-                self.calc.memory_operations += 1
-                self.generic_visit(node)
-                
-            def visit_Call(self, node):
-                self.calc.function_calls += 1
-                self.generic_visit(node)
-        
-        MetricsVisitor(self).visit(self.ast_tree)
+        metrics = self.parsed.metrics
+        self.loop_count = metrics['loop_count']
+        self.operation_count = metrics['operation_count']
+        self.memory_operations = metrics['memory_operations']
+        self.function_calls = metrics['function_calls']
+        self.invariant_computations = metrics['invariant_computations']
         
         # Calculate weighted complexity score
         complexity_score = (
-            self.loop_count * 2.5 +
-            self.operation_count * 1.0 +
-            self.memory_operations * 1.5 +
-            self.function_calls * 1.2
+            self.loop_count * COMPLEXITY_WEIGHTS['loop_count'] +
+            self.operation_count * COMPLEXITY_WEIGHTS['operation_count'] +
+            self.memory_operations * COMPLEXITY_WEIGHTS['memory_operations'] +
+            self.function_calls * COMPLEXITY_WEIGHTS['function_calls'] +
+            self.invariant_computations * COMPLEXITY_WEIGHTS['invariant_computations']
         )
         
         return complexity_score
     
-    def calculate_emission_factor(self) -> float:
+    def calculate_emission_factor(self, complexity_score: float = None) -> float:
         """Calculate emission factor based on code metrics"""
-        complexity_score = self.calculate_complexity_score()
-        
-        # Base emission factor (kg CO2 per complexity unit)
-        BASE_EMISSION_FACTOR = 0.0001
+        if complexity_score is None:
+            complexity_score = self.calculate_complexity_score()
         
         # Calculate emission factor with exponential scaling
         emission_factor = BASE_EMISSION_FACTOR * math.exp(complexity_score / 100)
         
         return emission_factor
 
-class CodeAnalyzer(ast.NodeVisitor):
-    def __init__(self, code: str):
+def resolve_edits(optimizations: Dict[int, List[Dict]], line_count: int):
+    """
+    Turn recorded optimizations, lists of edits keyed by the line they were
+    reported on, into a sorted, non-overlapping edit list of (start, end,
+    new_code) line spans. Conflicts are resolved the same way every time:
+    the edit starting first wins, and for equal starts the one covering more
+    lines, so an outer rewrite beats the nested ones it contains; among
+    edits of the same span the one recorded first wins.
+    Lazily recorded replacement code is rendered here.
+    """
+    candidates = sorted(
+        ((opt['start'], opt['end'], line, opt['new_code']) for line, opts in optimizations.items() for opt in opts),
+        key=lambda edit: (edit[0], -edit[1], edit[2]))
+    accepted, skipped = [], []
+    last_end = 0
+    for start, end, _, new_code in candidates:
+        new_code = render(new_code)
+        if start < 1 or end < start or end > line_count or start <= last_end:
+            skipped.append({'start': start, 'end': end, 'new_code': new_code})
+            continue
+        accepted.append((start, end, new_code))
+        last_end = end
+    return accepted, skipped
+
+def reindent(new_code: str, original_line: str) -> str:
+    """Indent unindented replacement code to match the first line it replaces"""
+    indent = original_line[:len(original_line) - len(original_line.lstrip())]
+    if not indent or new_code[:1].isspace():
+        return new_code
+    return '\n'.join(indent + line if line else line for line in new_code.split('\n'))
+
+def splice(lines, edits) -> str:
+    """
+    Apply sorted, non-overlapping edits with a single forward pass and join.
+    Unchanged stretches of a LineIndex are copied as whole slices.
+    """
+    out = []
+    position = 0
+    for start, end, new_code in edits:
+        if position < start - 1:
+            out.append(join_lines(lines, position, start - 1))
+        out.append(new_code)
+        position = end
+    if position < len(lines):
+        out.append(join_lines(lines, position, len(lines)))
+    return '\n'.join(out)
+
+def _unified_range(start: int, length: int) -> str:
+    # Same range notation as difflib: a bare line number when length is 1
+    return str(start) if length == 1 else f"{start},{length}"
+
+def unified_diff(lines: List[str], edits, fromfile: str = "original.py", tofile: str = "optimized.py",
+                 context: int = 3) -> str:
+    """
+    Unified diff built directly from the edit list, so it costs time in
+    proportion to the edits and their context rather than a full-file diff.
+    """
+    if not edits:
+        return ""
+    # Group edits whose context windows touch into shared hunks
+    groups = [[edits[0]]]
+    for edit in edits[1:]:
+        if edit[0] - 1 - groups[-1][-1][1] <= 2 * context:
+            groups[-1].append(edit)
+        else:
+            groups.append([edit])
+
+    out = [f"--- {fromfile}", f"+++ {tofile}"]
+    offset = 0
+    position = 0
+    for group in groups:
+        hunk_start = max(position, group[0][0] - 1 - context)
+        hunk_end = min(len(lines), group[-1][1] + context)
+        body = []
+        cursor = hunk_start
+        for start, end, new_code in group:
+            body.extend(' ' + line for line in lines[cursor:start - 1])
+            body.extend('-' + line for line in lines[start - 1:end])
+            body.extend('+' + line for line in new_code.split('\n'))
+            cursor = end
+        body.extend(' ' + line for line in lines[cursor:hunk_end])
+
+        old_length = hunk_end - hunk_start
+        new_length = sum(1 for line in body if line[0] != '-')
+        out.append(f"@@ -{_unified_range(hunk_start + 1, old_length)} "
+                   f"+{_unified_range(hunk_start + 1 + offset, new_length)} @@")
+        out.extend(body)
+        offset += new_length - old_length
+        position = hunk_end
+    return '\n'.join(out) + '\n'
+
+class Rule:
+    """
+    A detector run by CodeAnalyzer's single dispatcher walk. Subclasses list
+    the AST node types they inspect in node_types; check() is called for each
+    such node in source order, and finalize() once after the walk for rules
+    that report on state gathered across the whole module.
+    """
+    node_types: Tuple[type, ...] = ()
+
+    def check(self, node: ast.AST, analyzer: 'CodeAnalyzer'):
+        raise NotImplementedError
+
+    def finalize(self, analyzer: 'CodeAnalyzer'):
+        pass
+
+# Rule classes run by every CodeAnalyzer unless a rule list is passed explicitly
+RULE_REGISTRY: List[type] = []
+
+def register_rule(rule_class: type) -> type:
+    """Class decorator adding a Rule subclass to the default rule set"""
+    RULE_REGISTRY.append(rule_class)
+    return rule_class
+
+def build_dispatch_table(rules) -> Dict[type, List]:
+    """Map each AST node type to the bound check methods interested in it"""
+    table = {}
+    for rule in rules:
+        for node_type in rule.node_types:
+            table.setdefault(node_type, []).append(rule.check)
+    return table
+
+class CodeAnalyzer:
+    def __init__(self, code: str, parsed: ParsedModule = None, rules: List[Rule] = None):
         self.code = code
+        self.parsed = parsed
+        self.rules = rules if rules is not None else [rule_class() for rule_class in RULE_REGISTRY]
+        self._dispatch = build_dispatch_table(self.rules)
         self.issues = []
         self.optimizations = {}
         self.sorted_vars = set()
         self.string_concats = {}
-        self.list_appends = {}
+        self.concat_initial = {}
         self.list_copies = {}
-        self.variable_declarations = {}
-        self.unused_variables = set()
-        self.loop_variables = set()
+        self.symbols = None
+        self.invariants = {}
+        self.skipped_optimizations = []
+        self.optimization_diff = ""
+        self.rewrite = True
+
+    @staticmethod
+    def _target_key(target) -> str:
+        # Plain names are by far the common case; other expressions are keyed by
+        # structure and only unparsed if a rewrite is rendered
+        if isinstance(target, ast.Name):
+            return target.id
+        return ast.dump(target)
+
+    def report(self, line: int, issue: str, recommendation: str, optimization,
+               span: Tuple[int, int] = None, new_code=None):
+        """
+        Record an issue, plus a source rewrite when a line span is given.
+        optimization and new_code may be zero-argument renderers, called at
+        most once and only when the text is read or the rewrite applied.
+        """
+        if callable(optimization):
+            optimization = lru_cache(maxsize=None)(optimization)
+        if span is not None and self.rewrite:
+            self.optimizations.setdefault(line, []).append({
+                'start': span[0],
+                'end': span[1],
+                'new_code': optimization if new_code is None else new_code
+            })
 
-    def visit_For(self, node):
-        # Track loop variables
-        if isinstance(node.target, ast.Name):
-            self.loop_variables.add(node.target.id)
+        self.issues.append(Issue(line, issue, recommendation, optimization, span))
+
+    def run_rules(self, tree: ast.AST):
+        """
+        Walk the tree once in source order, feeding every node to the rules
+        registered for its type, filling in self.symbols and counting
+        emission metrics as it goes. Loop invariants are found from the
+        resolved symbol table once the walk is done.
+        """
+        dispatch = self._dispatch
+        active = instrumentation.active()
+        if active is not None:
+            dispatch, rule_stats = active.wrap_dispatch(dispatch)
+            started = time.perf_counter()
+        self.symbols = SymbolTable(tree)
+        symbol_handlers = self.symbols.handlers
+        # Context and operator nodes are only visited when a rule asks for them
+        prune = not any(issubclass(node_type, OPERATOR_TYPES) for node_type in dispatch)
+        # Rule checks, metric, symbol handler and child fields of each node type, looked up once per type
+        plans = {}
+        counts = {'loop_count': 0, 'operation_count': 0, 'memory_operations': 0, 'function_calls': 0,
+                  'invariant_computations': 0}
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            node_type = type(node)
+            if node_type is Marker:
+                node.action(node.value)
+                continue
+            plan = plans.get(node_type)
+            if plan is None:
+                plan = plans[node_type] = (dispatch.get(node_type, ()), METRIC_NODE_TYPES.get(node_type),
+                                           symbol_handlers.get(node_type), _walk_fields(node_type, prune))
+            checks, metric, handler, fields = plan
+            for check in checks:
+                check(node, self)
+            if metric is not None:
+                counts[metric] += 1
+            children = []
+            for field in fields:
+                value = getattr(node, field, None)
+                if isinstance(value, ast.AST):
+                    children.append(value)
+                elif type(value) is list:
+                    children.extend(item for item in value if isinstance(item, ast.AST))
+            children.reverse()
+            if handler is not None:
+                handler(node, children)
+            stack.extend(children)
+        self.symbols.resolve()
+        self.invariants = loop_invariants(self.symbols)
+        counts['invariant_computations'] = sum(len(found) for found in self.invariants.values())
+
+        if active is not None:
+            active.record_phase('walk', time.perf_counter() - started)
+            active.record_rules(rule_stats)
+        return counts
+
+    def finalize_rules(self):
+        active = instrumentation.active()
+        for rule in self.rules:
+            if active is None:
+                rule.finalize(self)
+                continue
+            before = len(self.issues)
+            start = time.perf_counter()
+            rule.finalize(self)
+            active.record_rule(type(rule).__name__, 0, time.perf_counter() - start, len(self.issues) - before)
+
+    def _track_concat(self, target: str, node: ast.AST):
+        if target not in self.string_concats:
+            self.string_concats[target] = []
+        self.string_concats[target].append(node)
+
+    def check_string_concats(self):
+        for target, concats in self.string_concats.items():
+            augmented = [n for n in concats if isinstance(n, ast.AugAssign)]
+            if len(concats) < 3 or not augmented:
+                continue
+
+            initial = self.concat_initial.get(target)
+            values = ([initial] if initial is not None else []) + augmented
+            self._report_string_concat(lambda node=concats[0]: unparse(assigned_target(node)),
+                                       [n.lineno for n in concats],
+                                       lambda values=values: [unparse(n.value) for n in values])
+
+    def _report_string_concat(self, target, lines: List[int], pieces):
+        # target and the list of joined expressions are text, or renderers producing it
+        start_line = min(lines)
+        end_line = max(lines)
+        optimization = lambda: f'{render(target)} = "".join([{", ".join(render(pieces))}])'
+        self.report(start_line, "Multiple string concatenations", "Use str.join()", optimization,
+                    span=(start_line, end_line))
+
+    def _check_sorted(self, value: ast.expr, line: int):
+        key = self._target_key(value)
+        if key in self.sorted_vars:
+            self.report(line, "Redundant sort operation", "Use single sort with reverse=True",
+                        lambda: f"{unparse(value)}.sort(reverse=True)")
+        self.sorted_vars.add(key)
+
+    def check_unused_variables(self, symbols=None):
+        for symbol in self.symbols.unused() if symbols is None else symbols:
+            self._report_unused(symbol.name, symbol.declared_line)
+
+    def _report_unused(self, var: str, line: int):
+        self.report(line, "Unused variable", f"Remove unused variable '{var}'", f"# Remove declaration of '{var}'")
+
+    def check_loop_invariants(self):
+        symbols = self.symbols
+        for loop, found in self.invariants.items():
+            info = symbols.loops[loop]
+            # Invariants whose hoisted value could be shared mutable state are reported but stay put
+            found = [node for node in found if hoistable(node, info, symbols)]
+            optimization = None
+            if found:
+                optimization = lambda info=info, found=found: hoist(info, found, taken_names(symbols, info))
+            # A new module-level name could collide with one bound in another chunk of an
+            # incrementally analyzed module, and another rewrite of the same loop comes first
+            rewritable = bool(found) and info.scope.parent is not None and loop.lineno not in self.optimizations
+            self.report(loop.lineno, "Loop-invariant computation", "Hoist invariant work out of the loop",
+                        optimization, span=(loop.lineno, loop.end_lineno) if rewritable else None)
 
+    def apply_optimizations(self):
+        """
+        Splice every accepted rewrite into the source in one forward pass.
+        Rewrites that overlap an earlier accepted one are left out and listed
+        in self.skipped_optimizations; the matching unified diff is kept in
+        self.optimization_diff.
+        """
+        with instrumentation.phase('apply'):
+            lines = self.parsed.lines
+            edits, self.skipped_optimizations = resolve_edits(self.optimizations, len(lines))
+            edits = [(start, end, reindent(new_code, lines[start - 1])) for start, end, new_code in edits]
+            self.optimization_diff = unified_diff(lines, edits)
+            return splice(lines, edits)
+
+    def analyze(self, rewrite: bool = True):
+        """
+        Return the issues and the optimized source. With rewrite=False no
+        rewrites are recorded or applied and None is returned in place of
+        the source, which suits lint-only runs.
+        """
+        if self.parsed is None:
+            self.parsed = ParsedModule(self.code)
+        self.rewrite = rewrite
+        counts = self.run_rules(self.parsed.tree)
+        if self.parsed.metrics_pending:
+            self.parsed.metrics = counts
+        self.finalize_rules()
+        if not rewrite:
+            return self.issues, None
+        return self.issues, self.apply_optimizations()
+
+@register_rule
+class LoopRule(Rule):
+    """Nested loops with conditional append, and range(len()) loops"""
+    node_types = (ast.For,)
+
+    def check(self, node, analyzer):
         # Check for nested loops with conditions that can be converted to list comprehension
         if isinstance(node.body[0], ast.For):
             inner_loop = node.body[0]
@@ -103,26 +660,18 @@ class CodeAnalyzer(ast.NodeVisitor):
                     # Extract components for list comprehension
                     outer_var = node.target.id
                     inner_var = inner_loop.target.id
-                    outer_iter = ast.unparse(node.iter)
-                    inner_iter = ast.unparse(inner_loop.iter)
-                    conditions = ast.unparse(if_node.test)
-                    value = ast.unparse(if_node.body[0].value.args[0])
 
                     # Create list comprehension
-                    list_comp = f"result = [{value} for {outer_var} in {outer_iter} for {inner_var} in {inner_iter} if {conditions}]"
-
-                    self.optimizations[node.lineno] = {
-                        'start': node.lineno - 1,
-                        'end': node.end_lineno,
-                        'new_code': list_comp
-                    }
+                    def list_comp():
+                        outer_iter = unparse(node.iter)
+                        inner_iter = unparse(inner_loop.iter)
+                        conditions = unparse(if_node.test)
+                        value = unparse(if_node.body[0].value.args[0])
+                        return f"result = [{value} for {outer_var} in {outer_iter} for {inner_var} in {inner_iter} if {conditions}]"
 
-                    self.issues.append({
-                        "line": node.lineno,
-                        "issue": "Nested loops with conditional append",
-                        "recommendation": "Use list comprehension",
-                        "optimization": list_comp
-                    })
+                    analyzer.report(node.lineno, "Nested loops with conditional append",
+                                    "Use list comprehension", list_comp,
+                                    span=(node.lineno, node.end_lineno))
 
         # New: Check for range(len()) antipattern
         if isinstance(node.iter, ast.Call) and isinstance(node.iter.func, ast.Name) and \
@@ -130,255 +679,272 @@ class CodeAnalyzer(ast.NodeVisitor):
            isinstance(node.iter.args[0], ast.Call) and \
            isinstance(node.iter.args[0].func, ast.Name) and node.iter.args[0].func.id == 'len':
 
-            iterable = ast.unparse(node.iter.args[0].args[0])
             var_name = node.target.id
-            body = '\n'.join(ast.unparse(stmt) for stmt in node.body)
 
-            # Create enumeration-based loop if index is used
-            if any(var_name in ast.unparse(stmt) for stmt in node.body):
-                optimization = f"for i, {var_name} in enumerate({iterable}):\n    {body}"
-            else:
-                optimization = f"for {var_name} in {iterable}:\n    {body}"
-
-            self.optimizations[node.lineno] = {
-                'start': node.lineno,
-                'end': node.end_lineno,
-                'new_code': optimization
-            }
-
-            self.issues.append({
-                "line": node.lineno,
-                "issue": "range(len()) antipattern",
-                "recommendation": "Use enumerate() or direct iteration",
-                "optimization": optimization
-            })
+            def optimization():
+                iterable = unparse(node.iter.args[0].args[0])
+                statements = [unparse(stmt) for stmt in node.body]
+                body = '\n'.join(statements)
+
+                # Create enumeration-based loop if index is used
+                if any(var_name in text for text in statements):
+                    return f"for i, {var_name} in enumerate({iterable}):\n    {body}"
+                return f"for {var_name} in {iterable}:\n    {body}"
+
+            analyzer.report(node.lineno, "range(len()) antipattern", "Use enumerate() or direct iteration",
+                            optimization, span=(node.lineno, node.end_lineno))
 
-        self.generic_visit(node)
+@register_rule
+class AssignRule(Rule):
+    """Concatenation seeds and list copies"""
+    node_types = (ast.Assign,)
 
-    def visit_Assign(self, node):
-        # Track variable declarations
-        if isinstance(node.targets[0], ast.Name):
-            var_name = node.targets[0].id
-            if var_name not in self.variable_declarations:
-                self.variable_declarations[var_name] = node.lineno
-                if var_name not in self.loop_variables:
-                    self.unused_variables.add(var_name)
+    def check(self, node, analyzer):
+        # Remember the first assignment of each target as the seed of a concat chain
+        target = analyzer._target_key(node.targets[0])
+        if target not in analyzer.concat_initial:
+            analyzer.concat_initial[target] = node
 
         # Track string concatenations
         if isinstance(node.value, ast.BinOp) and isinstance(node.value.op, ast.Add):
-            target = ast.unparse(node.targets[0])
-            if target not in self.string_concats:
-                self.string_concats[target] = []
-            self.string_concats[target].append(node)
+            analyzer._track_concat(target, node)
 
         # Track list copies
         if isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name) and \
-           node.value.func.id == 'list':
-            orig_list = ast.unparse(node.value.args[0])
-            target = ast.unparse(node.targets[0])
-            optimization = f"{target} = {orig_list}.copy()"
-
-            self.optimizations[node.lineno] = {
-                'start': node.lineno,
-                'end': node.lineno,
-                'new_code': optimization
-            }
-
-            self.issues.append({
-                "line": node.lineno,
-                "issue": "Inefficient list copy",
-                "recommendation": "Use list.copy() method",
-                "optimization": optimization
-            })
+           node.value.func.id == 'list' and node.value.args:
+            optimization = lambda: f"{unparse(node.targets[0])} = {unparse(node.value.args[0])}.copy()"
+
+            analyzer.report(node.lineno, "Inefficient list copy", "Use list.copy() method",
+                            optimization, span=(node.lineno, node.lineno))
+
+@register_rule
+class UnusedVariableRule(Rule):
+    """Assigned names never read in their scope or the scopes nested in it, from the symbol table"""
 
-        self.generic_visit(node)
+    def finalize(self, analyzer):
+        analyzer.check_unused_variables()
 
-    def visit_Name(self, node):
-        # Remove variables that are used from unused_variables set
-        if isinstance(node.ctx, ast.Load) and node.id in self.unused_variables:
-            self.unused_variables.remove(node.id)
-        self.generic_visit(node)
+@register_rule
+class LoopInvariantRule(Rule):
+    """Work repeated on every iteration of a loop whose inputs the loop never changes"""
 
-    def visit_AugAssign(self, node):
-        # Track string concatenations with +=
+    def finalize(self, analyzer):
+        analyzer.check_loop_invariants()
+
+@register_rule
+class StringConcatRule(Rule):
+    """Repeated += on one target, reported once per target after the walk"""
+    node_types = (ast.AugAssign,)
+
+    def check(self, node, analyzer):
         if isinstance(node.op, ast.Add):
-            target = ast.unparse(node.target)
-            if target not in self.string_concats:
-                self.string_concats[target] = []
-            self.string_concats[target].append(node)
-
-            # Check if we have multiple string concatenations for this target
-            concats = self.string_concats[target]
-            if len(concats) >= 3:
-                pieces = []
-                start_line = min(n.lineno for n in concats)
-                end_line = max(n.lineno for n in concats)
-
-                # Find the initial assignment
-                for stmt in ast.walk(ast.parse(self.code)):
-                    if isinstance(stmt, ast.Assign) and ast.unparse(stmt.targets[0]) == target:
-                        pieces.append(ast.unparse(stmt.value))
-                        break
-
-                # Collect all concatenated values
-                for concat in concats:
-                    if isinstance(concat, ast.AugAssign):
-                        pieces.append(ast.unparse(concat.value))
-
-                optimization = f'{target} = "".join([{", ".join(pieces)}])'
-
-                self.optimizations[start_line] = {
-                    'start': start_line,
-                    'end': end_line,
-                    'new_code': optimization
-                }
-
-                self.issues.append({
-                    "line": start_line,
-                    "issue": "Multiple string concatenations",
-                    "recommendation": "Use str.join()",
-                    "optimization": optimization
-                })
-
-        self.generic_visit(node)
-
-    def visit_If(self, node):
-        # Check for long if-elif chains
-        if hasattr(node, 'orelse') and node.orelse:
-            chain_length = 1
-            current = node
-            conditions = []
-            actions = []
-
-            # Collect all conditions and actions in the chain
-            while current and isinstance(current, ast.If):
-                test = ast.unparse(current.test)
-                body = ast.unparse(current.body[0]).strip()
-                conditions.append(test)
-                actions.append(body)
-
-                if current.orelse and len(current.orelse) == 1 and isinstance(current.orelse[0], ast.If):
-                    current = current.orelse[0]
-                    chain_length += 1
-                else:
-                    current = None
-
-            if chain_length >= 4:
-                # Create dictionary-based switch
-                cases = [f"    {cond}: {action}" for cond, action in zip(conditions, actions)]
-
-                optimization = "switch_dict = {\n" + ",\n".join(cases) + "\n}\n"
-                optimization += "result = switch_dict.get(True, 'default_value')"
-
-                self.optimizations[node.lineno] = {
-                    'start': node.lineno,
-                    'end': node.end_lineno,
-                    'new_code': optimization
-                }
-
-                self.issues.append({
-                    "line": node.lineno,
-                    "issue": "Long if-elif chain",
-                    "recommendation": "Use dictionary mapping",
-                    "optimization": optimization
-                })
-
-        self.generic_visit(node)
-
-    def visit_Call(self, node):
-        # Track list append operations
-        if isinstance(node.func, ast.Attribute) and node.func.attr == 'append':
-            list_name = ast.unparse(node.func.value)
-            if list_name not in self.list_appends:
-                self.list_appends[list_name] = []
-            self.list_appends[list_name].append(node)
-
-            # If we have multiple consecutive appends, optimize them
-            appends = self.list_appends[list_name]
-            if len(appends) >= 3:
-                values = [ast.unparse(n.args[0]) for n in appends]
-                start_line = appends[0].lineno
-                end_line = appends[-1].lineno
-
-                optimization = f"{list_name}.extend([{', '.join(values)}])"
-
-                self.optimizations[start_line] = {
-                    'start': start_line,
-                    'end': end_line,
-                    'new_code': optimization
-                }
-
-                self.issues.append({
-                    "line": start_line,
-                    "issue": "Multiple list append operations",
-                    "recommendation": "Use list.extend()",
-                    "optimization": optimization
-                })
-
-        # Check for redundant sort operations
-        elif isinstance(node.func, ast.Name) and node.func.id == 'sorted':
-            var_name = ast.unparse(node.args[0])
-            if var_name in self.sorted_vars:
-                self.issues.append({
-                    "line": node.lineno,
-                    "issue": "Redundant sort operation",
-                    "recommendation": "Use single sort with reverse=True",
-                    "optimization": f"{var_name}.sort(reverse=True)"
-                })
-            self.sorted_vars.add(var_name)
-
-        self.generic_visit(node)
-
-    def check_unused_variables(self):
-        for var in self.unused_variables:
-            self.issues.append({
-                "line": self.variable_declarations[var],
-                "issue": "Unused variable",
-                "recommendation": f"Remove unused variable '{var}'",
-                "optimization": f"# Remove declaration of '{var}'"
-            })
+            analyzer._track_concat(analyzer._target_key(node.target), node)
 
-    def apply_optimizations(self):
-        lines = self.code.splitlines()
-        # Sort optimizations by line number in reverse order to avoid line number shifts
-        sorted_lines = sorted(self.optimizations.items(), reverse=True)
+    def finalize(self, analyzer):
+        analyzer.check_string_concats()
 
-        for _, opt in sorted_lines:
-            start, end = opt['start'], opt['end']
-            new_code = opt['new_code']
-            lines[start-1:end] = [new_code]
+@register_rule
+class IfChainRule(Rule):
+    """Long if-elif chains that could be a dictionary lookup"""
+    node_types = (ast.If,)
 
-        return '\n'.join(lines)
+    def check(self, node, analyzer):
+        if not node.orelse:
+            return
 
-    def analyze(self):
-        tree = ast.parse(self.code)
-        self.visit(tree)
-        self.check_unused_variables()
-        return self.issues, self.apply_optimizations()
+        chain_length = 1
+        current = node
+        links = []
+
+        # Collect every link in the chain
+        while current and isinstance(current, ast.If):
+            links.append(current)
+
+            if current.orelse and len(current.orelse) == 1 and isinstance(current.orelse[0], ast.If):
+                current = current.orelse[0]
+                chain_length += 1
+            else:
+                current = None
 
-def calculate_emissions(code: str, is_optimized: bool = False) -> float:
+        if chain_length >= 4:
+            def optimization():
+                # Create dictionary-based switch
+                cases = [f"    {unparse(link.test)}: {unparse(link.body[0]).strip()}" for link in links]
+                return "switch_dict = {\n" + ",\n".join(cases) + "\n}\n" + \
+                    "result = switch_dict.get(True, 'default_value')"
+
+            analyzer.report(node.lineno, "Long if-elif chain", "Use dictionary mapping",
+                            optimization, span=(node.lineno, node.end_lineno))
+
+@register_rule
+class SortedCallRule(Rule):
+    """Repeated sorted() calls on the same value"""
+    node_types = (ast.Call,)
+
+    def check(self, node, analyzer):
+        if isinstance(node.func, ast.Name) and node.func.id == 'sorted':
+            analyzer._check_sorted(node.args[0], node.lineno)
+
+@register_rule
+class AppendRunRule(Rule):
+    """Runs of three or more consecutive appends to one list"""
+    node_types = (ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.For,
+                  ast.AsyncFor, ast.While, ast.If, ast.With, ast.AsyncWith, ast.Try,
+                  ast.ExceptHandler, ast.match_case) + ((ast.TryStar,) if hasattr(ast, 'TryStar') else ())
+
+    @staticmethod
+    def _append_target(stmt, analyzer):
+        # Key of the list expression of a single-argument `x.append(v)` statement
+        if isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call):
+            call = stmt.value
+            if isinstance(call.func, ast.Attribute) and call.func.attr == 'append' and \
+               len(call.args) == 1 and not call.keywords:
+                return analyzer._target_key(call.func.value)
+        return None
+
+    def check(self, node, analyzer):
+        # Group consecutive sibling statements that append to the same list
+        for field in ('body', 'orelse', 'finalbody'):
+            block = getattr(node, field, None)
+            if not isinstance(block, list):
+                continue
+            run, run_target = [], None
+            for stmt in block + [None]:
+                target = self._append_target(stmt, analyzer) if stmt is not None else None
+                if target is not None and target == run_target:
+                    run.append(stmt)
+                    continue
+                if len(run) >= 3:
+                    self._report(analyzer, run)
+                run, run_target = ([stmt], target) if target is not None else ([], None)
+
+    def _report(self, analyzer, run):
+        optimization = lambda: f"{unparse(run[0].value.func.value)}.extend([{', '.join(unparse(stmt.value.args[0]) for stmt in run)}])"
+        analyzer.report(run[0].lineno, "Multiple list append operations", "Use list.extend()", optimization,
+                        span=(run[0].lineno, run[-1].end_lineno))
+
+def calculate_emissions(code: str, is_optimized: bool = False, parsed: ParsedModule = None) -> float:
     """
     Calculate emissions based on code complexity and efficiency metrics
-    rather than actual hardware measurements
+    rather than actual hardware measurements. Pass ``parsed`` to reuse a
+    ParsedModule that was already built for the same source.
     """
-    calculator = CodeMetricsCalculator(code)
-    emission_factor = calculator.calculate_emission_factor()
+    with instrumentation.phase('emission'):
+        calculator = CodeMetricsCalculator(code, parsed)
+        complexity_score = calculator.calculate_complexity_score()
+        emission_factor = calculator.calculate_emission_factor(complexity_score)
     
-    # Apply optimization factor if code is optimized
-    if is_optimized:
-        # Optimized code should have lower emissions due to better efficiency
-        optimization_factor = 0.6  # 40% reduction for optimized code
-        emission_factor *= optimization_factor
+        # Apply optimization factor if code is optimized
+        if is_optimized:
+            emission_factor *= OPTIMIZATION_FACTOR
     
-    # Calculate final emissions
-    code_lines = len(code.splitlines())
-    base_emissions = code_lines * emission_factor
+        # Calculate final emissions
+        code_lines = calculator.parsed.line_count
+        base_emissions = code_lines * emission_factor
     
-    # Add complexity-based emissions
-    complexity_score = calculator.calculate_complexity_score()
-    total_emissions = base_emissions * (1 + complexity_score / 1000)
+        # Add complexity-based emissions
+        total_emissions = base_emissions * (1 + complexity_score / 1000)
     
-    return total_emissions
+        return total_emissions
+
+def score_optimized(optimized_code: str) -> float:
+    """
+    Emissions of rewritten source. Some rewrites do not parse; those score
+    0.0, as the original file-based scoring did, instead of failing the
+    analysis of a valid original.
+    """
+    try:
+        return calculate_emissions(optimized_code, True)
+    except (SyntaxError, ValueError) as e:
+        logging.warning("Could not score optimized code: %s", e)
+        return 0.0
+
+def _analyze_original(code: str) -> Dict:
+    """analyze_source up to, but not including, scoring the optimized version"""
+    parsed = ParsedModule(code)
+    analyzer = CodeAnalyzer(code, parsed)
+    issues, optimized_code = analyzer.analyze()
+    return {
+        "issues": sorted(issues, key=lambda x: x['line']),
+        "optimized_code": optimized_code,
+        "diff": analyzer.optimization_diff,
+        # The original is scored from the counts the analysis walk already took
+        "original_emissions": calculate_emissions(code, parsed=parsed),
+    }
+
+def analyze_source(code: str, executor: Executor = None) -> Dict:
+    """
+    Analyze source and score the original and optimized versions.
+    This is the unit of work shared by the CLI, the web app and the result cache.
+    With an executor, both stages run there instead of in the calling thread.
+    """
+    if executor is not None:
+        return next(schedule_analyses([code], executor))[1].result()
+    result = _analyze_original(code)
+    result["optimized_emissions"] = score_optimized(result["optimized_code"])
+    return result
+
+def schedule_analyses(codes: List[str], executor: Executor):
+    """
+    Run analyze_source for many sources through one executor. Each source is
+    split into an analysis task and a task scoring its optimized version, so
+    scoring of finished files interleaves with analysis of the rest instead of
+    waiting behind it. Yields (index, future) pairs in completion order; the
+    future holds the analyze_source result or the exception analysis raised.
+    """
+    analyses = {executor.submit(_analyze_original, code): index for index, code in enumerate(codes)}
+    scorings = {}
+    while analyses or scorings:
+        done, _ = wait([*analyses, *scorings], return_when=FIRST_COMPLETED)
+        for future in done:
+            if future in analyses:
+                index = analyses.pop(future)
+                if future.exception() is not None:
+                    yield index, future
+                    continue
+                result = future.result()
+                scorings[executor.submit(score_optimized, result["optimized_code"])] = (index, result)
+                continue
+            index, result = scorings.pop(future)
+            joined = Future()
+            if future.exception() is not None:
+                joined.set_exception(future.exception())
+            else:
+                result["optimized_emissions"] = future.result()
+                joined.set_result(result)
+            yield index, joined
+
+def estimate_emissions(code: str) -> float:
+    """Emissions of source as written, from a metrics-only scan"""
+    return calculate_emissions(code, parsed=ParsedModule(code, scan_metrics(code)))
+
+def lint_source(code: str) -> Dict:
+    """
+    Issues and original emissions only, for lint-only runs. No rewrites are
+    generated and issues carry no optimization text, so no expression is
+    unparsed: rules key what they track by name or AST structure and only
+    unparse when a rewrite is rendered.
+    """
+    parsed = ParsedModule(code)
+    issues, _ = CodeAnalyzer(code, parsed).analyze(rewrite=False)
+    original_emissions = calculate_emissions(code, parsed=parsed)
+    return {
+        "issues": [issue.without_optimization() for issue in sorted(issues, key=lambda x: x.line)],
+        "original_emissions": original_emissions,
+        "optimized_emissions": original_emissions,
+    }
+
+def run_source_with_tracking(code: str, is_optimized: bool = False, source_name: str = "<source>") -> float:
+    """
+    Calculate emissions for in-memory source without depending on hardware measurements
+    """
+    try:
+        # Calculate emissions based on code metrics
+        return calculate_emissions(code, is_optimized)
+        
+    except Exception as e:
+        print(f"Error calculating emissions for '{source_name}': {str(e)}")
+        return 0.0
 
 def run_code_with_tracking(file_path: str, is_optimized: bool = False) -> float:
     """
@@ -388,17 +954,13 @@ def run_code_with_tracking(file_path: str, is_optimized: bool = False) -> float:
         raise FileNotFoundError(f"File '{file_path}' does not exist.")
     
     try:
-        with open(file_path, 'r') as f:
-            code = f.read()
-        
-        # Calculate emissions based on code metrics
-        emissions = calculate_emissions(code, is_optimized)
-        return emissions
-        
+        code = read_source(file_path)
     except Exception as e:
         print(f"Error calculating emissions for '{file_path}': {str(e)}")
         return 0.0
 
+    return run_source_with_tracking(code, is_optimized, file_path)
+
 def calculate_emission_reduction(original: float, optimized: float) -> float:
     """
     Calculate emission reduction percentage with proper handling of edge cases.
@@ -410,14 +972,258 @@ def calculate_emission_reduction(original: float, optimized: float) -> float:
     else:
         return ((original - optimized) / original) * 100
 
-def main():
+# Directories that never contain project sources worth analyzing
+SKIPPED_DIRS = {'__pycache__', 'venv', 'node_modules'}
+
+def available_cores() -> int:
+    """Number of CPU cores this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def iter_source_files(target: str):
+    """Yield Python files under a directory, matching a glob, or the file itself"""
+    if os.path.isdir(target):
+        for root, dirs, files in os.walk(target):
+            dirs[:] = sorted(d for d in dirs if d not in SKIPPED_DIRS and not d.startswith('.'))
+            for name in sorted(files):
+                if name.endswith('.py'):
+                    yield os.path.join(root, name)
+    elif glob.has_magic(target):
+        for path in sorted(glob.iglob(target, recursive=True)):
+            if os.path.isfile(path) and path.endswith('.py'):
+                yield path
+    elif os.path.isfile(target):
+        yield target
+    else:
+        raise FileNotFoundError(f"File '{target}' does not exist.")
+
+def check_targets(targets: List[str]):
+    """Raise FileNotFoundError for the first target that is neither a path that exists nor a glob"""
+    for target in targets:
+        if not os.path.exists(target) and not glob.has_magic(target):
+            raise FileNotFoundError(f"File '{target}' does not exist.")
+
+# One result-cache connection per worker process, reused across files
+_worker_caches = {}
+
+def _worker_cache(cache_path: str):
+    if cache_path not in _worker_caches:
+        from result_cache import ResultCache
+        _worker_caches[cache_path] = ResultCache(cache_path)
+    return _worker_caches[cache_path]
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError("analysis timed out")
+
+def analyze_file(file_path: str, timeout: float = None, cache_path: str = None,
+                 profile: bool = False, mode: str = "full") -> Dict:
+    """
+    Analyze one file and score the original and optimized emissions.
+    Runs inside batch workers, so failures are reported in the result
+    instead of being raised. In "lint" mode no rewrite is generated, and
+    in "metrics" mode only a metrics scan runs; either way the optimized
+    emissions equal the original ones.
+    """
+    started = time.perf_counter()
+    result = {"path": file_path, "issues": [], "original_emissions": 0.0,
+              "optimized_emissions": 0.0, "improvement": 0.0, "cached": False, "error": None}
+
+    # Each file gets its own instrumentation so the parent can merge the reports
+    if profile:
+        file_instrumentation = instrumentation.enable()
+
+    # SIGALRM lets a worker abandon one slow file and keep serving the pool
+    use_alarm = timeout and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
     try:
-        # Read input file
-        with open("code.py", "r") as f:
-            code = f.read()
+        code = read_source(file_path)
+        # Cached results are full analyses, so only full mode reads or writes them
+        cache = _worker_cache(cache_path) if cache_path and mode == "full" else None
+        analysis = cache.get(code) if cache else None
+        result["cached"] = analysis is not None
+        if mode == "metrics":
+            emissions = estimate_emissions(code)
+            analysis = {"issues": [], "original_emissions": emissions, "optimized_emissions": emissions}
+        elif mode == "lint":
+            analysis = lint_source(code)
+        elif analysis is None:
+            analysis = analyze_source(code)
+            if cache:
+                cache.put(code, analysis)
+        result["issues"] = analysis["issues"]
+        result["original_emissions"] = analysis["original_emissions"]
+        result["optimized_emissions"] = analysis["optimized_emissions"]
+        result["improvement"] = calculate_emission_reduction(
+            result["original_emissions"], result["optimized_emissions"])
+    except TimeoutError:
+        result["error"] = f"timed out after {timeout}s"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+        if profile:
+            instrumentation.disable()
+            result["profile"] = file_instrumentation.report()
+
+    result["elapsed"] = time.perf_counter() - started
+    return result
+
+def analyze_batch(targets: List[str], max_workers: int = None, timeout: float = None,
+                  cache_path: str = None, profile: bool = False, mode: str = "full"):
+    """
+    Analyze every Python file under the given directories or globs across a
+    process pool, yielding per-file results in completion order.
+    """
+    # Fail before any worker starts rather than partway through the pool loop
+    check_targets(targets)
+    max_workers = max_workers or available_cores()
+    # Cap in-flight work so huge trees do not queue every path up front
+    max_pending = max_workers * 4
+    paths = (path for target in targets for path in iter_source_files(target))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for path in paths:
+            pending.add(executor.submit(analyze_file, path, timeout, cache_path, profile, mode))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+def summarize_batch(results) -> Dict:
+    """Aggregate per-file batch results into repository totals"""
+    summary = {"files": 0, "failed": 0, "cached": 0, "issues": 0,
+               "original_emissions": 0.0, "optimized_emissions": 0.0}
+    for result in results:
+        summary["files"] += 1
+        if result["error"]:
+            summary["failed"] += 1
+            continue
+        summary["cached"] += result["cached"]
+        summary["issues"] += len(result["issues"])
+        summary["original_emissions"] += result["original_emissions"]
+        summary["optimized_emissions"] += result["optimized_emissions"]
+    summary["improvement"] = calculate_emission_reduction(
+        summary["original_emissions"], summary["optimized_emissions"])
+    return summary
+
+def ndjson_records(result: Dict):
+    """Yield one record per issue followed by one record for the file itself"""
+    emissions = {"original_emissions": result["original_emissions"],
+                 "optimized_emissions": result["optimized_emissions"]}
+    for issue in result["issues"]:
+        yield {"type": "issue", "path": result["path"], "line": issue["line"],
+               "issue": issue["issue"], "recommendation": issue["recommendation"],
+               "optimization": issue.get("optimization"), **emissions}
+    yield {"type": "file", "path": result["path"], "issues": len(result["issues"]), **emissions,
+           "improvement": result["improvement"], "cached": result["cached"],
+           "error": result["error"], "elapsed": result["elapsed"]}
+
+def write_ndjson(record: Dict, out=None):
+    out = out or sys.stdout
+    out.write(json.dumps(record) + "\n")
+    # Flush per record so downstream consumers see results as they are produced
+    out.flush()
+
+def run_batch(targets: List[str], max_workers: int = None, timeout: float = None,
+              cache_path: str = None, output_format: str = "text", profile: bool = False,
+              mode: str = "full") -> Dict:
+    """Report per-file results as they complete, then the aggregate summary"""
+    totals = instrumentation.Instrumentation() if profile else None
+
+    def stream():
+        for result in analyze_batch(targets, max_workers, timeout, cache_path, profile, mode):
+            if totals is not None and "profile" in result:
+                totals.merge(result["profile"])
+            if output_format == "ndjson":
+                for record in ndjson_records(result):
+                    write_ndjson(record)
+            elif result["error"]:
+                print(f"{result['path']}: failed ({result['error']})")
+            else:
+                print(f"{result['path']}: {len(result['issues'])} issues, "
+                      f"{result['original_emissions']:.6f} -> {result['optimized_emissions']:.6f} kg CO2")
+            yield result
+
+    summary = summarize_batch(stream())
+
+    if output_format == "ndjson":
+        write_ndjson({"type": "summary", **summary})
+        if totals is not None:
+            write_ndjson({"type": "profile", **totals.report()})
+        return summary
+
+    print("\nBatch Summary:")
+    print(f"Files analyzed: {summary['files']} ({summary['failed']} failed, {summary['cached']} from cache)")
+    print(f"Issues found: {summary['issues']}")
+    print(f"Original Code Emissions: {summary['original_emissions']:.6f} kg CO2")
+    print(f"Optimized Code Emissions: {summary['optimized_emissions']:.6f} kg CO2")
+    print(f"Emission Reduction: {summary['improvement']:.2f}%")
+    if totals is not None:
+        print("\n" + instrumentation.format_report(totals.report()))
+    return summary
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Static code analysis and emission estimation")
+    parser.add_argument("targets", nargs="*",
+                        help="directories, globs or files to analyze in batch mode (default: code.py)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: available cores)")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="per-file analysis timeout in seconds")
+    parser.add_argument("--cache", default=None, metavar="PATH",
+                        help="SQLite result cache shared across runs")
+    parser.add_argument("--format", choices=("text", "ndjson"), default="text",
+                        help="report format; ndjson streams one record per issue and per file")
+    parser.add_argument("--profile", action="store_true",
+                        help="report wall time, calls and issues per detector rule and pipeline phase")
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument("--lint-only", dest="mode", action="store_const", const="lint",
+                       help="report issues without generating rewrites or optimized emissions")
+    modes.add_argument("--metrics-only", dest="mode", action="store_const", const="metrics",
+                       help="estimate emissions from a metrics scan, without detectors or rewrites")
+    parser.set_defaults(mode="full")
+    parser.add_argument("--changed", metavar="REVISIONS",
+                        help="analyze only Python files changed in BASE..HEAD, BASE...HEAD, "
+                             "or between BASE and the working tree")
+    parser.add_argument("--repo", default=".", help="git repository for --changed (default: .)")
+    parser.add_argument("--log-level", default="WARNING",
+                        choices=("DEBUG", "INFO", "WARNING", "ERROR"), help="logging verbosity")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level))
+    if args.changed:
+        from git_changes import run_changes
+        report = run_changes(args.repo, args.changed, args.format)
+        sys.exit(1 if any(result["error"] for result in report["files"]) else 0)
+    if args.targets:
+        try:
+            check_targets(args.targets)
+        except FileNotFoundError as e:
+            print(f"Analysis failed: {str(e)}")
+            sys.exit(1)
+        summary = run_batch(args.targets, args.workers, args.timeout, args.cache, args.format, args.profile,
+                            args.mode)
+        sys.exit(1 if summary["failed"] else 0)
+    if args.profile:
+        instrumentation.enable()
 
-        # Create analyzer and run analysis
-        analyzer = CodeAnalyzer(code)
+    try:
+        # Read input file, sharing one parse and line index with the emission step
+        parsed = ParsedModule.from_file("code.py")
+        code = parsed.code
+        analyzer = CodeAnalyzer(code, parsed)
         issues, optimized_code = analyzer.analyze()
 
         # Print issues
@@ -436,11 +1242,11 @@ def main():
 
         # Calculate emissions using the new metric-based approach
         print("Calculating original code emissions...")
-        original_emissions = run_code_with_tracking("code.py")
+        original_emissions = calculate_emissions(code, parsed=parsed)
         print(f"Original code emissions calculated: {original_emissions:.6f} kg CO2")
 
         print("\nCalculating optimized code emissions...")
-        optimized_emissions = run_code_with_tracking("optimized_code.py", True)
+        optimized_emissions = score_optimized(optimized_code)
         print(f"Optimized code emissions calculated: {optimized_emissions:.6f} kg CO2")
 
         # Calculate improvement
@@ -460,6 +1266,9 @@ def main():
             f.write(f"Optimized Code Emissions: {optimized_emissions:.6f} kg CO2\n")
             f.write(f"Emission Reduction: {improvement:.2f}%\n")
 
+        if args.profile:
+            print("\n" + instrumentation.format_report(instrumentation.active().report()))
+
         import matplotlib.pyplot as plt
         labels = ['Original Code', 'Optimized Code']
         values = [original_emissions, optimized_emissions]
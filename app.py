@@ -1,51 +1,58 @@
 import os
 import io
-import base64
-import matplotlib
-# Set the backend before importing pyplot
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-from flask import Flask, request, render_template, redirect, url_for, send_file
-from CodeAnalyzer import CodeAnalyzer, run_code_with_tracking, calculate_emission_reduction
+from flask import Flask, request, render_template, redirect, url_for, send_file, jsonify, Response
+import instrumentation
+from CodeAnalyzer import available_cores, calculate_emission_reduction
+from result_cache import ResultCache
+from jobs import JobQueue, QueueFullError
+from charts import emissions_svg_data_url, emissions_png
+from downloads import DownloadStore
+from ingest import decode_source
 
 app = Flask(__name__)
 
 # Configurations
-UPLOAD_FOLDER = 'uploads'
 OPTIMIZED_FOLDER = 'optimized'
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OPTIMIZED_FOLDER'] = OPTIMIZED_FOLDER
+app.config['DOWNLOAD_RETENTION_SECONDS'] = int(os.environ.get('DOWNLOAD_RETENTION_SECONDS', 3600))
+app.config['RESULT_CACHE_PATH'] = os.environ.get('RESULT_CACHE_PATH', os.path.join('cache', 'results.sqlite3'))
+app.config['RESULT_CACHE_MAX_ENTRIES'] = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 10000))
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_MAX_PENDING'] = int(os.environ.get('JOB_MAX_PENDING', 32))
+app.config['SCORING_WORKERS'] = int(os.environ.get('SCORING_WORKERS', available_cores()))
+app.config['INSTRUMENTATION'] = os.environ.get('ANALYZER_INSTRUMENTATION', '') == '1'
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(OPTIMIZED_FOLDER, exist_ok=True)
+# Per-rule and per-phase timings are only collected when explicitly enabled
+if app.config['INSTRUMENTATION']:
+    instrumentation.enable()
+
+# Optimized sources stay in memory until a download is requested
+download_store = DownloadStore(OPTIMIZED_FOLDER, retention_seconds=app.config['DOWNLOAD_RETENTION_SECONDS'])
+
+# Repeated uploads of the same source skip analysis and emission scoring entirely
+result_cache = ResultCache(app.config['RESULT_CACHE_PATH'], app.config['RESULT_CACHE_MAX_ENTRIES'])
+
+# Background analysis jobs run here instead of in the request thread
+job_queue = JobQueue(app.config['JOB_WORKERS'], app.config['JOB_MAX_PENDING'])
+
+# Analysis and emission scoring for every request and job share one process
+# pool, so CPU-bound work runs in parallel instead of contending for the GIL.
+# Timings recorded in pool workers never reach this process, so analysis stays
+# on threads here while instrumentation is enabled and /metrics sees all of it
+if app.config['INSTRUMENTATION']:
+    scoring_executor = ThreadPoolExecutor(max_workers=app.config['SCORING_WORKERS'], thread_name_prefix="scoring")
+else:
+    scoring_executor = ProcessPoolExecutor(max_workers=app.config['SCORING_WORKERS'])
+
+# PNG charts are rendered on one dedicated thread; matplotlib is only imported there
+chart_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chart-render")
 
 def generate_emissions_graph(original_emissions, optimized_emissions):
     """Generate a bar graph comparing carbon emissions"""
-    plt.figure(figsize=(8, 5))
-    labels = ['Original Code', 'Optimized Code']
-    values = [original_emissions, optimized_emissions]
-    
-    bars = plt.bar(labels, values, color=['red', 'green'], alpha=0.8)
-    for bar in bars:
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width() / 2.0, height, f'{height:.6f}', 
-                ha='center', va='bottom', fontsize=10)
-
-    plt.xlabel('Code Version', fontsize=12)
-    plt.ylabel('Emissions (kg CO2)', fontsize=12)
-    plt.title('Comparison of Carbon Emissions', fontsize=14)
-    plt.tight_layout()
-    
-    # Save plot to a bytes buffer
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    plt.close()
-    
-    # Encode the image to base64
-    graph_url = base64.b64encode(buf.getvalue()).decode('utf-8')
-    return f'data:image/png;base64,{graph_url}'
+    # SVG is built from the two numbers directly, so no plotting library runs per request
+    return emissions_svg_data_url(original_emissions, optimized_emissions)
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -55,86 +62,205 @@ def index():
         if 'file' in request.files:
             file = request.files['file']
             if file.filename.endswith('.py'):
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-                file.save(file_path)
-
-                # Analyze the code
-                with open(file_path, 'r') as f:
-                    original_code = f.read()
-
-                analyzer = CodeAnalyzer(original_code)
-                issues, optimized_code = analyzer.analyze()
-
-                issues = sorted(issues, key=lambda x: x['line'])
-
-                # Save the optimized code
-                optimized_file_path = os.path.join(app.config['OPTIMIZED_FOLDER'], f"optimized_{file.filename}")
-                with open(optimized_file_path, 'w') as f:
-                    f.write(optimized_code)
-
-                # Calculate emissions
-                original_emissions = run_code_with_tracking(file_path, is_optimized=False)
-                optimized_emissions = run_code_with_tracking(optimized_file_path, is_optimized=True)
-                improvement = calculate_emission_reduction(original_emissions, optimized_emissions)
-
-                # Generate emissions graph
-                graph_url = generate_emissions_graph(original_emissions, optimized_emissions)
-
-                return render_template(
-                    "index.html", 
-                    original_code=original_code,
-                    issues=issues, 
-                    optimized_code=optimized_code, 
-                    download_url=url_for('download_file', filename=f"optimized_{file.filename}"),
-                    original_emissions=original_emissions,
-                    optimized_emissions=optimized_emissions,
-                    improvement=improvement,
-                    graph_url=graph_url
-                )
+                original_code = decode_source(file.read())
+                return render_analysis(original_code, f"optimized_{os.path.basename(file.filename)}")
 
         # Handle text input
         elif 'code_input' in request.form:
-            original_code = request.form['code_input']
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], "input_code.py")
-
-            with open(file_path, 'w') as f:
-                f.write(original_code)
-
-            analyzer = CodeAnalyzer(original_code)
-            issues, optimized_code = analyzer.analyze()
-
-            issues = sorted(issues, key=lambda x: x['line'])
-
-            # Save the optimized code
-            optimized_file_path = os.path.join(app.config['OPTIMIZED_FOLDER'], "optimized_input_code.py")
-            with open(optimized_file_path, 'w') as f:
-                f.write(optimized_code)
-
-            # Calculate emissions
-            original_emissions = run_code_with_tracking(file_path, is_optimized=False)
-            optimized_emissions = run_code_with_tracking(optimized_file_path, is_optimized=True)
-            improvement = calculate_emission_reduction(original_emissions, optimized_emissions)
-
-            # Generate emissions graph
-            graph_url = generate_emissions_graph(original_emissions, optimized_emissions)
-
-            return render_template(
-                "index.html", 
-                original_code=original_code,
-                issues=issues, 
-                optimized_code=optimized_code, 
-                download_url=url_for('download_file', filename="optimized_input_code.py"),
-                original_emissions=original_emissions,
-                optimized_emissions=optimized_emissions,
-                improvement=improvement,
-                graph_url=graph_url
-            )
+            original_code = decode_source(request.form['code_input'])
+            return render_analysis(original_code, "optimized_input_code.py")
 
     return render_template("index.html", original_code=original_code)
 
-@app.route('/download/<filename>')
-def download_file(filename):
-    return send_file(os.path.join(app.config['OPTIMIZED_FOLDER'], filename), as_attachment=True)
+def render_analysis(original_code, download_name):
+    """Analyze source held in memory and render the results page"""
+    result = result_cache.get_or_analyze(original_code, scoring_executor)
+    issues = result["issues"]
+    optimized_code = result["optimized_code"]
+
+    # The optimized code is only written to disk if the download link is used
+    digest = download_store.register(optimized_code)
+
+    original_emissions = result["original_emissions"]
+    optimized_emissions = result["optimized_emissions"]
+    improvement = calculate_emission_reduction(original_emissions, optimized_emissions)
+
+    # Generate emissions graph
+    graph_url = generate_emissions_graph(original_emissions, optimized_emissions)
+
+    return render_template(
+        "index.html", 
+        original_code=original_code,
+        issues=issues, 
+        optimized_code=optimized_code, 
+        download_url=url_for('download_file', digest=digest, name=download_name),
+        original_emissions=original_emissions,
+        optimized_emissions=optimized_emissions,
+        improvement=improvement,
+        graph_url=graph_url
+    )
+
+def run_analysis_job(code):
+    """Analyze submitted source and score emissions for both versions"""
+    return serialize_result(result_cache.get_or_analyze(code, scoring_executor))
+
+def serialize_result(result):
+    """JSON-ready copy of an analysis result with the emission improvement"""
+    result = dict(result)
+    result["issues"] = [dict(issue) for issue in result["issues"]]
+    result["improvement"] = calculate_emission_reduction(result["original_emissions"], result["optimized_emissions"])
+    return result
+
+def submitted_source():
+    """
+    Read source from a .py upload, the code_input form field or the raw
+    request body, with line endings normalized to '\\n'
+    """
+    if 'file' in request.files:
+        file = request.files['file']
+        if file.filename.endswith('.py'):
+            return decode_source(file.read())
+        return None
+    if 'code_input' in request.form:
+        return decode_source(request.form['code_input'])
+    return decode_source(request.get_data()) or None
+
+def analyze_named_sources(sources):
+    """Analyze (path, code) pairs, reporting per-file failures instead of aborting the batch"""
+    # CRLF and CR sources analyze and cache the same as their '\\n' form
+    codes = [decode_source(code) for _, code in sources]
+    outcomes = result_cache.get_or_analyze_many(codes, scoring_executor)
+    results = []
+    for (path, _), outcome in zip(sources, outcomes):
+        if isinstance(outcome, Exception):
+            result = {"error": f"{type(outcome).__name__}: {outcome}"}
+        else:
+            result = serialize_result(outcome)
+            result["error"] = None
+        result["path"] = path
+        results.append(result)
+    return results
+
+def json_sources(entries, default_path="file_{}.py"):
+    """(path, code) pairs of JSON source objects, or None unless each is an object of strings"""
+    sources = []
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            return None
+        path, code = entry.get('path', default_path.format(i)), entry.get('code', '')
+        if not isinstance(path, str) or not isinstance(code, str):
+            return None
+        sources.append((path, code))
+    return sources
+
+@app.route('/api/analyze', methods=['POST'])
+def api_analyze():
+    """
+    JSON analysis without HTML or chart rendering. Accepts {"code": ...},
+    a batch {"files": [{"path": ..., "code": ...}, ...]}, multipart uploads
+    under "files", or a raw source body.
+    """
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict) and isinstance(payload.get('files'), list):
+        sources = json_sources(payload['files'])
+        if sources is None:
+            return jsonify(error='each entry of "files" must be an object with string "path" and "code"'), 400
+        return jsonify(results=analyze_named_sources(sources))
+    if isinstance(payload, dict) and 'code' in payload:
+        sources = json_sources([payload], 'input_code.py')
+        if sources is None:
+            return jsonify(error='"path" and "code" must be strings'), 400
+        return single_analysis_response(*sources[0])
+
+    try:
+        uploads = request.files.getlist('files')
+        if uploads:
+            sources = [(f.filename, decode_source(f.read())) for f in uploads if f.filename.endswith('.py')]
+            return jsonify(results=analyze_named_sources(sources))
+        code = submitted_source()
+    except UnicodeDecodeError as e:
+        return jsonify(error=f"source is not valid UTF-8: {e}"), 400
+    if code is None:
+        return jsonify(error="no Python source submitted"), 400
+    return single_analysis_response('input_code.py', code)
+
+def single_analysis_response(path, code):
+    result = analyze_named_sources([(path, code)])[0]
+    return jsonify(result), 422 if result["error"] else 200
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    try:
+        code = submitted_source()
+    except UnicodeDecodeError as e:
+        return jsonify(error=f"source is not valid UTF-8: {e}"), 400
+    if code is None:
+        return jsonify(error="no Python source submitted"), 400
+    try:
+        job_id = job_queue.submit(run_analysis_job, code)
+    except QueueFullError as e:
+        return jsonify(error=f"analysis queue is full: {e}"), 503
+    return jsonify(job_id=job_id, status_url=url_for('job_status', job_id=job_id),
+                   result_url=url_for('job_result', job_id=job_id)), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.status(job_id)
+    if job is None:
+        return jsonify(error="unknown job"), 404
+    job.pop("result")
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = job_queue.status(job_id)
+    if job is None:
+        return jsonify(error="unknown job"), 404
+    if job["status"] == "failed":
+        return jsonify(status=job["status"], error=job["error"]), 500
+    if job["status"] != "finished":
+        return jsonify(status=job["status"]), 409
+    return jsonify(job["result"])
+
+@app.route('/chart.png')
+def chart_png():
+    """PNG fallback for clients that cannot display the inline SVG chart"""
+    original = request.args.get('original', type=float)
+    optimized = request.args.get('optimized', type=float)
+    if original is None or optimized is None:
+        return jsonify(error="original and optimized emissions are required"), 400
+    png = chart_executor.submit(emissions_png, original, optimized).result()
+    return send_file(io.BytesIO(png), mimetype='image/png')
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of analyzer instrumentation and cache counters"""
+    active = instrumentation.active()
+    if active is None:
+        return jsonify(error="instrumentation is disabled; set ANALYZER_INSTRUMENTATION=1"), 404
+    stats = result_cache.stats()
+    cache_lines = [
+        "# HELP analyzer_cache_hits_total Result cache hits",
+        "# TYPE analyzer_cache_hits_total counter",
+        f"analyzer_cache_hits_total {stats['hits']}",
+        "# HELP analyzer_cache_misses_total Result cache misses",
+        "# TYPE analyzer_cache_misses_total counter",
+        f"analyzer_cache_misses_total {stats['misses']}",
+    ]
+    body = active.prometheus() + "\n".join(cache_lines) + "\n"
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/download/<digest>')
+def download_file(digest):
+    path = download_store.path_for(digest)
+    if path is None:
+        return jsonify(error="unknown or expired download"), 404
+    name = os.path.basename(request.args.get('name', 'optimized_code.py'))
+    return send_file(path, as_attachment=True, download_name=name)
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+
+from CodeAnalyzer import CodeAnalyzer, calculate_emissions, scan_metrics
+from result_cache import ResultCache
+
+def if_chain(index: int, length: int) -> List[str]:
+    lines = [f"def dispatch_{index}(x):"]
+    for case in range(length):
+        keyword = "if" if case == 0 else "elif"
+        lines.append(f"    {keyword} x == {case}:")
+        lines.append(f"        return 'case_{case}'")
+    lines.append("    return None")
+    return lines
+
+def append_run(index: int, length: int) -> List[str]:
+    return [f"items_{index} = []"] + [f"items_{index}.append({i})" for i in range(length)]
+
+def concat_run(index: int, length: int) -> List[str]:
+    return [f"text_{index} = ''"] + [f"text_{index} += 'part{i}'" for i in range(length)]
+
+def nested_loops(index: int, depth: int) -> List[str]:
+    lines = [f"total_{index} = 0"]
+    for level in range(depth):
+        lines.append("    " * level + f"for i{level} in range(len(data_{index})):")
+    lines.append("    " * depth + f"total_{index} += i{depth - 1}")
+    return lines
+
+def filler(index: int) -> List[str]:
+    return [f"value_{index} = {index} * 2 + 1", f"print(value_{index})"]
+
+# Pattern generators and the size parameter each receives
+PATTERNS: Dict[str, Callable[[int, int], List[str]]] = {
+    "if_chain": if_chain,
+    "appends": append_run,
+    "concats": concat_run,
+    "nested_loops": nested_loops,
+}
+
+def generate_source(lines: int, density: float = 0.5, patterns: List[str] = None,
+                    pattern_size: int = 6, seed: int = 0) -> str:
+    """
+    Build a synthetic module of roughly `lines` lines. `density` is the share
+    of blocks drawn from the anti-patterns in `patterns`; the rest is filler.
+    """
+    rng = random.Random(seed)
+    patterns = patterns or list(PATTERNS)
+    out = []
+    index = 0
+    while len(out) < lines:
+        if rng.random() < density:
+            out.extend(PATTERNS[rng.choice(patterns)](index, pattern_size))
+        else:
+            out.extend(filler(index))
+        index += 1
+    return "\n".join(out) + "\n"
+
+def generate_corpus(files: int, lines: int, density: float, patterns: List[str] = None,
+                    pattern_size: int = 6, seed: int = 0) -> List[str]:
+    return [generate_source(lines, density, patterns, pattern_size, seed + i) for i in range(files)]
+
+def measure(name: str, corpus: List[str], fn: Callable[[str], object],
+            memory_fn: Callable[[str], object] = None) -> Dict:
+    """
+    Run fn over every source, reporting throughput and peak traced memory.
+    Timing and memory are taken in separate passes because tracemalloc
+    slows allocation-heavy code several-fold; memory_fn, when given, stands
+    in for fn in the memory pass. A target that raises gets an entry with
+    its error instead of stopping the other benchmarks.
+    """
+    memory_fn = memory_fn or fn
+    total_lines = sum(source.count("\n") for source in corpus)
+    try:
+        start = time.perf_counter()
+        for source in corpus:
+            fn(source)
+        elapsed = time.perf_counter() - start
+
+        # Peak memory of the largest single file is what bounds a worker
+        peak = 0
+        for source in corpus:
+            tracemalloc.start()
+            try:
+                memory_fn(source)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+    except Exception as e:
+        return {"name": name, "files": len(corpus), "lines": total_lines, "error": f"{type(e).__name__}: {e}"}
+
+    return {
+        "name": name,
+        "files": len(corpus),
+        "lines": total_lines,
+        "seconds": elapsed,
+        "files_per_sec": len(corpus) / elapsed if elapsed else 0.0,
+        "lines_per_sec": total_lines / elapsed if elapsed else 0.0,
+        "peak_memory_bytes": peak,
+    }
+
+def _import_app():
+    # The result cache app opens on import is swapped out before use, so keep it off disk
+    previous = os.environ.get('RESULT_CACHE_PATH')
+    os.environ['RESULT_CACHE_PATH'] = ':memory:'
+    try:
+        import app
+    finally:
+        if previous is None:
+            del os.environ['RESULT_CACHE_PATH']
+        else:
+            os.environ['RESULT_CACHE_PATH'] = previous
+    return app
+
+@contextmanager
+def flask_index_target(in_process: bool = False):
+    """
+    Yield a callable posting source to the Flask index() route, or None
+    without Flask. The route gets a result cache of its own in a temporary
+    directory, so every post is analyzed instead of answered from an
+    earlier pass, and a scoring pool of its own; with in_process there is
+    no pool and analysis runs in this process, where tracemalloc sees it.
+    The pool is shut down and the directory removed on exit.
+    """
+    try:
+        web = _import_app()
+    except ImportError:
+        yield None
+        return
+    directory = tempfile.mkdtemp(prefix="bench-cache-")
+    executor = None if in_process else ProcessPoolExecutor(max_workers=web.app.config['SCORING_WORKERS'])
+    cache = ResultCache(os.path.join(directory, "results.sqlite3"))
+    client = web.app.test_client()
+
+    def post(source):
+        # Swapped per request, so targets of both passes can be open at once
+        saved = web.result_cache, web.scoring_executor
+        web.result_cache, web.scoring_executor = cache, executor
+        try:
+            response = client.post("/", data={"code_input": source})
+        finally:
+            web.result_cache, web.scoring_executor = saved
+        if response.status_code != 200:
+            raise RuntimeError(f"index() returned {response.status_code}")
+    try:
+        yield post
+    finally:
+        cache.close()
+        if executor is not None:
+            executor.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+
+def run_benchmarks(corpus: List[str], include_flask: bool = True) -> List[Dict]:
+    results = [
+        measure("analyze", corpus, lambda source: CodeAnalyzer(source).analyze()),
+        measure("calculate_emissions", corpus, calculate_emissions),
+        measure("scan_metrics", corpus, scan_metrics),
+    ]
+    if include_flask:
+        # Each pass posts to a fresh cache; peak memory is taken with analysis in this process
+        with flask_index_target() as post, flask_index_target(in_process=True) as post_in_process:
+            if post is not None:
+                results.append(measure("flask_index", corpus, post, post_in_process))
+    return results
+
+def compare_to_baseline(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """List regressions where throughput fell more than `tolerance` below the baseline"""
+    previous = {entry["name"]: entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        old = previous.get(entry["name"])
+        if old is None or not old.get("lines_per_sec"):
+            continue
+        if "error" in entry:
+            regressions.append(f"{entry['name']}: failed with {entry['error']}")
+            continue
+        ratio = entry["lines_per_sec"] / old["lines_per_sec"]
+        if ratio < 1 - tolerance:
+            regressions.append(f"{entry['name']}: {entry['lines_per_sec']:.0f} lines/s is "
+                               f"{(1 - ratio) * 100:.1f}% below baseline {old['lines_per_sec']:.0f} lines/s")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput benchmarks over synthetic Python corpora")
+    parser.add_argument("--files", type=int, default=20, help="number of synthetic files")
+    parser.add_argument("--lines", type=int, default=2000, help="approximate lines per file")
+    parser.add_argument("--density", type=float, default=0.5, help="share of blocks that are anti-patterns")
+    parser.add_argument("--patterns", nargs="+", choices=sorted(PATTERNS), default=None,
+                        help="anti-patterns to generate (default: all)")
+    parser.add_argument("--pattern-size", type=int, default=6,
+                        help="chain length, run length or loop depth of each generated pattern")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-flask", action="store_true", help="skip the Flask index() benchmark")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed fractional throughput drop before flagging a regression")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    corpus = generate_corpus(args.files, args.lines, args.density, args.patterns, args.pattern_size, args.seed)
+    results = run_benchmarks(corpus, include_flask=not args.no_flask)
+
+    for entry in results:
+        if "error" in entry:
+            print(f"{entry['name']:<22}failed: {entry['error']}")
+            continue
+        print(f"{entry['name']:<22}{entry['files_per_sec']:>10.1f} files/s"
+              f"{entry['lines_per_sec']:>14.0f} lines/s"
+              f"{entry['peak_memory_bytes'] / 1024 / 1024:>10.1f} MiB peak")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+    if any("error" in entry for entry in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import io
+import base64
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+# Layout of the emissions comparison chart, in SVG user units
+WIDTH, HEIGHT = 640, 400
+PLOT_LEFT, PLOT_RIGHT, PLOT_TOP, PLOT_BOTTOM = 90, 610, 60, 330
+BAR_WIDTH = 160
+
+@lru_cache(maxsize=256)
+def emissions_svg(original_emissions: float, optimized_emissions: float) -> str:
+    """Bar chart comparing original and optimized emissions as standalone SVG"""
+    bars = [('Original Code', original_emissions, 'red'), ('Optimized Code', optimized_emissions, 'green')]
+    peak = max(original_emissions, optimized_emissions) or 1.0
+    plot_height = PLOT_BOTTOM - PLOT_TOP
+    slot = (PLOT_RIGHT - PLOT_LEFT) / len(bars)
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {WIDTH} {HEIGHT}" '
+        f'font-family="sans-serif">',
+        f'<text x="{WIDTH / 2}" y="32" font-size="18" text-anchor="middle">Comparison of Carbon Emissions</text>',
+        f'<line x1="{PLOT_LEFT}" y1="{PLOT_BOTTOM}" x2="{PLOT_RIGHT}" y2="{PLOT_BOTTOM}" stroke="black"/>',
+        f'<line x1="{PLOT_LEFT}" y1="{PLOT_TOP}" x2="{PLOT_LEFT}" y2="{PLOT_BOTTOM}" stroke="black"/>',
+    ]
+    for i, (label, value, color) in enumerate(bars):
+        height = max(value, 0.0) / peak * plot_height
+        x = PLOT_LEFT + slot * i + (slot - BAR_WIDTH) / 2
+        y = PLOT_BOTTOM - height
+        center = x + BAR_WIDTH / 2
+        parts.append(f'<rect x="{x:.1f}" y="{y:.1f}" width="{BAR_WIDTH}" height="{height:.1f}" '
+                     f'fill="{color}" fill-opacity="0.8"/>')
+        parts.append(f'<text x="{center:.1f}" y="{y - 6:.1f}" font-size="13" text-anchor="middle">{value:.6f}</text>')
+        parts.append(f'<text x="{center:.1f}" y="{PLOT_BOTTOM + 22}" font-size="14" '
+                     f'text-anchor="middle">{escape(label)}</text>')
+    parts.append(f'<text x="{WIDTH / 2}" y="{HEIGHT - 20}" font-size="15" text-anchor="middle">Code Version</text>')
+    parts.append(f'<text x="24" y="{(PLOT_TOP + PLOT_BOTTOM) / 2}" font-size="15" text-anchor="middle" '
+                 f'transform="rotate(-90 24 {(PLOT_TOP + PLOT_BOTTOM) / 2})">Emissions (kg CO2)</text>')
+    parts.append('</svg>')
+    return ''.join(parts)
+
+def emissions_svg_data_url(original_emissions: float, optimized_emissions: float) -> str:
+    svg = emissions_svg(original_emissions, optimized_emissions)
+    return 'data:image/svg+xml;base64,' + base64.b64encode(svg.encode('utf-8')).decode('ascii')
+
+@lru_cache(maxsize=64)
+def emissions_png(original_emissions: float, optimized_emissions: float) -> bytes:
+    """
+    PNG rendering of the same chart for clients that cannot display SVG.
+    Matplotlib is imported on first use and drawn through a Figure object
+    rather than pyplot, so renders do not contend on pyplot's global state.
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 5))
+    ax = fig.subplots()
+    bars = ax.bar(['Original Code', 'Optimized Code'], [original_emissions, optimized_emissions],
+                  color=['red', 'green'], alpha=0.8)
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width() / 2.0, height, f'{height:.6f}',
+                ha='center', va='bottom', fontsize=10)
+    ax.set_xlabel('Code Version', fontsize=12)
+    ax.set_ylabel('Emissions (kg CO2)', fontsize=12)
+    ax.set_title('Comparison of Carbon Emissions', fontsize=14)
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
@@ -0,0 +1,78 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+class DownloadStore:
+    """
+    Optimized sources held in memory until a download asks for them. Only
+    then are they written to disk, under a content-addressed name, so
+    concurrent requests never share a path. A download expires
+    retention_seconds after its source was last registered or written;
+    expired files are no longer served, and are removed whenever a new file
+    is written.
+    """
+    def __init__(self, folder: str, max_pending: int = 256, retention_seconds: float = 3600):
+        # Absolute, since send_file resolves relative paths against the app root rather than the CWD
+        self.folder = os.path.abspath(folder)
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self.folder, exist_ok=True)
+
+    def register(self, code: str) -> str:
+        """Remember an optimized source and return the digest to download it by"""
+        digest = hashlib.sha256(code.encode('utf-8')).hexdigest()
+        with self._lock:
+            self._pending[digest] = (code, time.time())
+            self._pending.move_to_end(digest)
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+        return digest
+
+    def path_for(self, digest: str) -> Optional[str]:
+        """
+        Return the absolute on-disk path for a digest, persisting it first if
+        needed, or None for unknown digests and expired downloads
+        """
+        if not DIGEST_PATTERN.match(digest):
+            return None
+        path = os.path.join(self.folder, f"{digest}.py")
+        cutoff = time.time() - self.retention_seconds
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                return path
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            code, registered = self._pending.get(digest, (None, 0))
+        if code is None or registered < cutoff:
+            return None
+
+        # Write under a temporary name so readers never see a partial file
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(code)
+        os.replace(tmp_path, path)
+        self.cleanup()
+        return path
+
+    def cleanup(self):
+        cutoff = time.time() - self.retention_seconds
+        for name in os.listdir(self.folder):
+            stem, ext = os.path.splitext(name)
+            if ext != '.py' or not DIGEST_PATTERN.match(stem):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
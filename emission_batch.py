@@ -0,0 +1,67 @@
+from typing import Dict, Iterable, Sequence
+
+from CodeAnalyzer import COMPLEXITY_WEIGHTS, BASE_EMISSION_FACTOR, OPTIMIZATION_FACTOR
+
+# Metric columns, each a keyword of score_emissions
+METRIC_NAMES = tuple(COMPLEXITY_WEIGHTS)
+
+def metric_arrays(metrics: Iterable[Dict[str, int]], line_counts: Sequence[int]) -> Dict:
+    """
+    Stack per-file metric counts, such as ParsedModule.metrics, into one
+    NumPy array per metric plus a line_count array, ready for score_emissions.
+    Metrics missing from a row, as invariant_computations is from counts
+    recorded before it existed, are taken as 0.
+    """
+    import numpy as np
+
+    rows = list(metrics)
+    arrays = {name: np.fromiter((row.get(name, 0) for row in rows), dtype=np.float64, count=len(rows))
+              for name in METRIC_NAMES}
+    arrays['line_count'] = np.asarray(line_counts, dtype=np.float64)
+    return arrays
+
+def score_emissions(loop_count, operation_count, memory_operations, function_calls, line_count,
+                    is_optimized=False, weights: Dict[str, float] = None, invariant_computations=0) -> Dict:
+    """
+    calculate_emissions for many files in one vectorized pass. Each count is
+    an array with one entry per file; is_optimized may be a single flag or a
+    boolean array, and invariant_computations may be left at 0 for metrics
+    recorded before it was counted. weights overrides entries of COMPLEXITY_WEIGHTS, so stored
+    metrics can be rescored without re-analyzing any source. Returns the
+    per-file arrays and repository-level aggregates.
+    """
+    import numpy as np
+
+    weights = dict(COMPLEXITY_WEIGHTS, **(weights or {}))
+    loop_count, operation_count, memory_operations, function_calls, invariant_computations, line_count = (
+        np.asarray(values, dtype=np.float64)
+        for values in (loop_count, operation_count, memory_operations, function_calls, invariant_computations,
+                       line_count))
+
+    complexity_score = (
+        loop_count * weights['loop_count'] +
+        operation_count * weights['operation_count'] +
+        memory_operations * weights['memory_operations'] +
+        function_calls * weights['function_calls'] +
+        invariant_computations * weights['invariant_computations']
+    )
+    emission_factor = BASE_EMISSION_FACTOR * np.exp(complexity_score / 100)
+    emission_factor = np.where(np.asarray(is_optimized, dtype=bool),
+                               emission_factor * OPTIMIZATION_FACTOR, emission_factor)
+    emissions = line_count * emission_factor * (1 + complexity_score / 1000)
+
+    return {
+        "complexity_score": complexity_score,
+        "emission_factor": emission_factor,
+        "emissions": emissions,
+        "files": int(emissions.size),
+        "total_emissions": float(emissions.sum()),
+        "mean_emissions": float(emissions.mean()) if emissions.size else 0.0,
+        "max_emissions": float(emissions.max()) if emissions.size else 0.0,
+        "total_complexity": float(complexity_score.sum()),
+    }
+
+def score_metric_arrays(arrays: Dict, is_optimized=False, weights: Dict[str, float] = None) -> Dict:
+    """score_emissions over the output of metric_arrays"""
+    return score_emissions(line_count=arrays['line_count'], is_optimized=is_optimized, weights=weights,
+                           **{name: arrays[name] for name in METRIC_NAMES})
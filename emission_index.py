@@ -0,0 +1,285 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+from typing import Dict, List, Optional
+
+from CodeAnalyzer import METRICS_VERSION, ParsedModule, CodeMetricsCalculator, calculate_emissions, \
+    calculate_emission_reduction, iter_source_files, scan_metrics
+from ingest import file_digest, read_source
+
+# METRICS_VERSION of indexes created before contents were versioned
+LEGACY_METRICS_VERSION = "1"
+
+class EmissionIndex:
+    """
+    Persistent per-repository emission baseline. Metric counts and emissions
+    are stored once per distinct file content, and each snapshot maps paths
+    to content hashes. Updates only re-read files whose size or mtime
+    changed and only scan content not seen before, so nightly snapshots of
+    a large tree cost little more than a directory walk. Contents are keyed
+    by hash and METRICS_VERSION, and each snapshot reads the version it was
+    taken with, so a metrics change rescans content without altering history.
+    Content the change cannot score differently is carried over instead.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = self._columns("contents")
+        legacy = bool(columns) and "version" not in columns
+        if legacy:
+            self._conn.execute("ALTER TABLE contents RENAME TO legacy_contents")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS contents (
+                hash TEXT NOT NULL,
+                version TEXT NOT NULL,
+                loop_count INTEGER NOT NULL,
+                operation_count INTEGER NOT NULL,
+                memory_operations INTEGER NOT NULL,
+                function_calls INTEGER NOT NULL,
+                invariant_computations INTEGER NOT NULL,
+                line_count INTEGER NOT NULL,
+                complexity_score REAL NOT NULL,
+                emissions REAL NOT NULL,
+                PRIMARY KEY (hash, version)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS file_state (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                label TEXT,
+                root TEXT NOT NULL,
+                created REAL NOT NULL,
+                files INTEGER NOT NULL,
+                total_emissions REAL NOT NULL,
+                version TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS snapshot_files (
+                snapshot INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (snapshot, path)
+            ) WITHOUT ROWID;
+        """)
+        if legacy:
+            # Earlier indexes kept no version and no invariant count; their rows stay with their snapshots.
+            # Content without loops has no invariant computations, so it scores the same today
+            for version, condition in ((LEGACY_METRICS_VERSION, ""), (METRICS_VERSION, " WHERE loop_count = 0")):
+                self._conn.execute(
+                    "INSERT INTO contents SELECT hash, ?, loop_count, operation_count, memory_operations, "
+                    "function_calls, 0, line_count, complexity_score, emissions FROM legacy_contents" + condition,
+                    (version,))
+            self._conn.execute("DROP TABLE legacy_contents")
+        if "version" not in self._columns("snapshots"):
+            self._conn.execute(f"ALTER TABLE snapshots ADD COLUMN version TEXT NOT NULL "
+                               f"DEFAULT '{LEGACY_METRICS_VERSION}'")
+        self._conn.commit()
+
+    def _columns(self, table: str) -> List[str]:
+        return [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+
+    def _content_row(self, path: str, digest: str):
+        # scan_metrics counts what a full analysis does, invariant computations included
+        code = read_source(path)
+        metrics = scan_metrics(code)
+        parsed = ParsedModule(code, metrics)
+        complexity_score = CodeMetricsCalculator(code, parsed).calculate_complexity_score()
+        emissions = calculate_emissions(code, parsed=parsed)
+        return (digest, METRICS_VERSION, metrics['loop_count'], metrics['operation_count'],
+                metrics['memory_operations'], metrics['function_calls'], metrics['invariant_computations'],
+                parsed.line_count, complexity_score, emissions)
+
+    def update(self, root: str, label: str = None) -> Dict:
+        """
+        Record a snapshot of every Python file under root. Returns the
+        snapshot id with counts of files scanned, reused and failed.
+        """
+        with self._lock:
+            known_state = {row[0]: row[1:] for row in
+                           self._conn.execute("SELECT path, size, mtime_ns, hash FROM file_state")}
+            known_contents = {row[0] for row in
+                              self._conn.execute("SELECT hash FROM contents WHERE version = ?", (METRICS_VERSION,))}
+        members, state_rows, content_rows, errors = [], [], [], []
+        reused = 0
+        for path in iter_source_files(root):
+            relative = os.path.relpath(path, root)
+            try:
+                stat = os.stat(path)
+                previous = known_state.get(relative)
+                if previous is not None and previous[:2] == (stat.st_size, stat.st_mtime_ns):
+                    digest = previous[2]
+                else:
+                    digest = file_digest(path)
+                    state_rows.append((relative, stat.st_size, stat.st_mtime_ns, digest))
+                if digest in known_contents:
+                    reused += 1
+                else:
+                    content_rows.append(self._content_row(path, digest))
+                    known_contents.add(digest)
+            except (SyntaxError, UnicodeDecodeError, ValueError, OSError) as e:
+                errors.append({"path": relative, "error": f"{type(e).__name__}: {e}"})
+                continue
+            members.append((relative, digest))
+
+        with self._lock:
+            conn = self._conn
+            conn.executemany("INSERT OR REPLACE INTO contents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", content_rows)
+            conn.executemany("INSERT OR REPLACE INTO file_state VALUES (?, ?, ?, ?)", state_rows)
+            snapshot = conn.execute(
+                "INSERT INTO snapshots (label, root, created, files, total_emissions, version) "
+                "VALUES (?, ?, ?, 0, 0, ?)", (label, os.path.abspath(root), time.time(), METRICS_VERSION)).lastrowid
+            conn.executemany("INSERT INTO snapshot_files VALUES (?, ?, ?)",
+                             ((snapshot, path, digest) for path, digest in members))
+            # Forget the stat of files that are gone or failed to scan
+            conn.execute("DELETE FROM file_state WHERE path NOT IN "
+                         "(SELECT path FROM snapshot_files WHERE snapshot = ?)", (snapshot,))
+            files, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(c.emissions), 0) FROM snapshot_files s "
+                "JOIN contents c ON c.hash = s.hash AND c.version = ? WHERE s.snapshot = ?",
+                (METRICS_VERSION, snapshot)).fetchone()
+            conn.execute("UPDATE snapshots SET files = ?, total_emissions = ? WHERE id = ?",
+                         (files, total, snapshot))
+            conn.commit()
+        return {"snapshot": snapshot, "files": files, "scanned": len(content_rows), "reused": reused,
+                "failed": errors, "total_emissions": total}
+
+    def _resolve(self, snapshot: Optional[int]) -> int:
+        if snapshot is not None:
+            return snapshot
+        row = self._conn.execute("SELECT MAX(id) FROM snapshots").fetchone()
+        if row[0] is None:
+            raise LookupError("the index has no snapshots yet")
+        return row[0]
+
+    def _version(self, snapshot: int) -> str:
+        row = self._conn.execute("SELECT version FROM snapshots WHERE id = ?", (snapshot,)).fetchone()
+        if row is None:
+            raise LookupError(f"unknown snapshot {snapshot}")
+        return row[0]
+
+    def snapshots(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, label, root, created, files, total_emissions FROM snapshots ORDER BY id").fetchall()
+        return [{"snapshot": row[0], "label": row[1], "root": row[2], "created": row[3],
+                 "files": row[4], "total_emissions": row[5]} for row in rows]
+
+    def total(self, snapshot: int = None) -> float:
+        """Total repository emissions of a snapshot (default: the latest)"""
+        with self._lock:
+            snapshot = self._resolve(snapshot)
+            row = self._conn.execute("SELECT total_emissions FROM snapshots WHERE id = ?", (snapshot,)).fetchone()
+        if row is None:
+            raise LookupError(f"unknown snapshot {snapshot}")
+        return row[0]
+
+    def top(self, n: int = 10, snapshot: int = None) -> List[Dict]:
+        """The n files with the highest emissions in a snapshot"""
+        with self._lock:
+            snapshot = self._resolve(snapshot)
+            rows = self._conn.execute(
+                "SELECT s.path, c.emissions, c.complexity_score, c.line_count FROM snapshot_files s "
+                "JOIN contents c ON c.hash = s.hash AND c.version = ? WHERE s.snapshot = ? "
+                "ORDER BY c.emissions DESC, s.path LIMIT ?", (self._version(snapshot), snapshot, n)).fetchall()
+        return [{"path": row[0], "emissions": row[1], "complexity_score": row[2], "line_count": row[3]}
+                for row in rows]
+
+    def delta(self, old: int, new: int = None) -> Dict:
+        """Per-file and total emission changes between two snapshots"""
+        with self._lock:
+            new = self._resolve(new)
+            versions = {"old_version": self._version(old), "new_version": self._version(new)}
+            # Unchanged content scored under different metric versions only counts if its score moved
+            rows = self._conn.execute("""
+                SELECT a.path, ca.emissions, cb.emissions FROM snapshot_files a
+                JOIN contents ca ON ca.hash = a.hash AND ca.version = :old_version
+                LEFT JOIN snapshot_files b ON b.snapshot = :new AND b.path = a.path
+                LEFT JOIN contents cb ON cb.hash = b.hash AND cb.version = :new_version
+                WHERE a.snapshot = :old AND (b.hash IS NULL OR b.hash != a.hash OR cb.emissions IS NOT ca.emissions)
+                UNION ALL
+                SELECT b.path, NULL, cb.emissions FROM snapshot_files b
+                JOIN contents cb ON cb.hash = b.hash AND cb.version = :new_version
+                WHERE b.snapshot = :new AND NOT EXISTS
+                    (SELECT 1 FROM snapshot_files a WHERE a.snapshot = :old AND a.path = b.path)
+            """, {"old": old, "new": new, **versions}).fetchall()
+            totals = dict(self._conn.execute(
+                "SELECT id, total_emissions FROM snapshots WHERE id IN (?, ?)", (old, new)).fetchall())
+        changes = [{"path": path, "old_emissions": before or 0.0, "new_emissions": after or 0.0,
+                    "delta": (after or 0.0) - (before or 0.0),
+                    "status": "added" if before is None else "removed" if after is None else "modified"}
+                   for path, before, after in rows]
+        changes.sort(key=lambda change: -abs(change["delta"]))
+        return {"old": old, "new": new, "old_emissions": totals[old], "new_emissions": totals[new],
+                "delta": totals[new] - totals[old],
+                "reduction": calculate_emission_reduction(totals[old], totals[new]), "files": changes}
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Persistent per-repository emission baseline")
+    parser.add_argument("--db", default=os.path.join("cache", "emissions.sqlite3"), help="index database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    update = commands.add_parser("update", help="record a snapshot of a source tree")
+    update.add_argument("root")
+    update.add_argument("--label")
+    commands.add_parser("snapshots", help="list recorded snapshots")
+    total = commands.add_parser("total", help="total emissions of a snapshot")
+    total.add_argument("--snapshot", type=int)
+    top = commands.add_parser("top", help="heaviest files of a snapshot")
+    top.add_argument("n", type=int, nargs="?", default=10)
+    top.add_argument("--snapshot", type=int)
+    delta = commands.add_parser("delta", help="emission changes between two snapshots")
+    delta.add_argument("old", type=int)
+    delta.add_argument("new", type=int, nargs="?")
+    delta.add_argument("--limit", type=int, default=20, help="number of changed files to list")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    with EmissionIndex(args.db) as index:
+        try:
+            if args.command == "update":
+                result = index.update(args.root, args.label)
+                print(f"Snapshot {result['snapshot']}: {result['files']} files "
+                      f"({result['scanned']} scanned, {result['reused']} reused, {len(result['failed'])} failed)")
+                print(f"Total emissions: {result['total_emissions']:.6f} kg CO2")
+            elif args.command == "snapshots":
+                for entry in index.snapshots():
+                    print(f"{entry['snapshot']:>5}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['created']))}"
+                          f"  {entry['files']:>7} files  {entry['total_emissions']:.6f} kg CO2  {entry['label'] or ''}")
+            elif args.command == "total":
+                print(f"{index.total(args.snapshot):.6f} kg CO2")
+            elif args.command == "top":
+                for entry in index.top(args.n, args.snapshot):
+                    print(f"{entry['emissions']:>14.6f}  {entry['path']}")
+            else:
+                result = index.delta(args.old, args.new)
+                print(f"Snapshot {result['old']} -> {result['new']}: {result['old_emissions']:.6f} -> "
+                      f"{result['new_emissions']:.6f} kg CO2 ({result['delta']:+.6f})")
+                for change in result["files"][:args.limit]:
+                    print(f"{change['delta']:>+14.6f}  {change['status']:<9} {change['path']}")
+        except LookupError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import os
+import re
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+from CodeAnalyzer import CodeAnalyzer, ParsedModule, calculate_emissions, calculate_emission_reduction
+from ingest import decode_source, read_source
+
+HUNK_HEADER = re.compile(rb'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+class GitError(RuntimeError):
+    """Raised when a git command fails"""
+
+def git(repo: str, *args: str, input: bytes = None) -> bytes:
+    """Run a git command in repo and return its raw stdout"""
+    try:
+        completed = subprocess.run(["git", "-C", repo, *args], input=input, capture_output=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise GitError(f"git {args[0]} failed: {e.stderr.decode('utf-8', 'replace').strip()}") from e
+    return completed.stdout
+
+def resolve_revisions(repo: str, revisions: str) -> Tuple[str, Optional[str]]:
+    """
+    Split BASE..HEAD, BASE...HEAD (diff from the merge base) or a lone BASE
+    (diff against the working tree) into base and head commits; head is
+    None for the working tree.
+    """
+    def commit(rev):
+        return git(repo, "rev-parse", "--verify", f"{rev or 'HEAD'}^{{commit}}").decode().strip()
+
+    if '...' in revisions:
+        left, right = revisions.split('...', 1)
+        head = commit(right)
+        return git(repo, "merge-base", commit(left), head).decode().strip(), head
+    if '..' in revisions:
+        left, right = revisions.split('..', 1)
+        return commit(left), commit(right)
+    return commit(revisions), None
+
+def _diff_args(base: str, head: Optional[str]) -> List[str]:
+    return [base] if head is None else [base, head]
+
+def changed_python_files(repo: str, base: str, head: Optional[str]) -> List[Tuple[str, str, Optional[str]]]:
+    """(status, path, base path) for every changed .py file, following renames"""
+    out = git(repo, "diff", "--name-status", "-z", "-M", "--no-ext-diff", *_diff_args(base, head), "--", "*.py")
+    fields = out.decode('utf-8').split('\0')
+    changes = []
+    i = 0
+    while i < len(fields) - 1:
+        status = fields[i][0]
+        if status in "RC":
+            old_path, path = fields[i + 1], fields[i + 2]
+            i += 3
+        else:
+            path = fields[i + 1]
+            old_path = None if status == "A" else path
+            i += 2
+        if path.endswith(".py"):
+            changes.append((status, path, old_path))
+    return changes
+
+def _unquote(path: bytes) -> str:
+    # git C-quotes paths with unusual characters, escaping non-ASCII bytes in octal
+    if path.startswith(b'"') and path.endswith(b'"'):
+        path = path[1:-1].decode('unicode_escape').encode('latin-1')
+    return path.decode('utf-8')
+
+def changed_lines(repo: str, base: str, head: Optional[str]) -> Dict[str, List[Tuple[int, int]]]:
+    """New-side (first, last) line ranges of every hunk, keyed by path"""
+    # Explicit prefixes override diff.noprefix and diff.mnemonicPrefix, so new paths always start with b/
+    out = git(repo, "diff", "-U0", "-M", "--no-color", "--no-ext-diff", "--src-prefix=a/", "--dst-prefix=b/",
+              *_diff_args(base, head), "--", "*.py")
+    hunks = {}
+    path = None
+    for line in out.split(b'\n'):
+        if line.startswith(b'+++ '):
+            # git ends the header with a tab when the path holds a space
+            target = line[4:].rstrip(b'\t')
+            path = None if target == b'/dev/null' else _unquote(target)
+            if path is not None and path.startswith('b/'):
+                path = path[2:]
+            continue
+        match = HUNK_HEADER.match(line)
+        if match and path is not None:
+            start = int(match.group(1))
+            count = int(match.group(2)) if match.group(2) is not None else 1
+            if count:
+                hunks.setdefault(path, []).append((start, start + count - 1))
+    return hunks
+
+def read_blobs(repo: str, specs: List[str]) -> List[Optional[bytes]]:
+    """Contents of rev:path blob specs from a single git cat-file process"""
+    if not specs:
+        return []
+    out = git(repo, "cat-file", "--batch", input=''.join(f"{spec}\n" for spec in specs).encode('utf-8'))
+    blobs = []
+    position = 0
+    for _ in specs:
+        header_end = out.index(b'\n', position)
+        header = out[position:header_end].split()
+        position = header_end + 1
+        if header[-1] == b'missing':
+            blobs.append(None)
+            continue
+        size = int(header[2])
+        blobs.append(out[position:position + size])
+        position += size + 1
+    return blobs
+
+def in_hunks(issue, hunks: List[Tuple[int, int]]) -> bool:
+    """Whether an issue's rewrite span, or its line, overlaps a changed range"""
+    first, last = issue.span or (issue.line, issue.line)
+    return any(first <= end and start <= last for start, end in hunks)
+
+def analyze_changes(repo: str, revisions: str) -> Dict:
+    """
+    Analyze only the Python files changed in a revision range. Issues are
+    kept when they touch a changed hunk, and emissions are scored for the
+    base and changed versions of each touched file.
+    """
+    base, head = resolve_revisions(repo, revisions)
+    changes = changed_python_files(repo, base, head)
+    hunks = changed_lines(repo, base, head)
+
+    specs = [f"{base}:{old_path}" for _, _, old_path in changes if old_path is not None]
+    if head is not None:
+        specs += [f"{head}:{path}" for status, path, _ in changes if status != "D"]
+    blobs = iter(read_blobs(repo, specs))
+    base_blobs = {old_path: next(blobs) for _, _, old_path in changes if old_path is not None}
+
+    files = []
+    for status, path, old_path in changes:
+        result = {"path": path, "status": status, "issues": [], "base_emissions": 0.0,
+                  "changed_emissions": 0.0, "delta": 0.0, "error": None}
+        try:
+            if old_path is not None and base_blobs[old_path] is not None:
+                result["base_emissions"] = calculate_emissions(decode_source(base_blobs[old_path]))
+            if status != "D":
+                code = decode_source(next(blobs)) if head is not None else read_source(os.path.join(repo, path))
+                parsed = ParsedModule(code)
+                issues, _ = CodeAnalyzer(code, parsed).analyze(rewrite=False)
+                file_hunks = hunks.get(path, [])
+                result["issues"] = sorted((issue for issue in issues if in_hunks(issue, file_hunks)),
+                                          key=lambda issue: issue.line)
+                result["changed_emissions"] = calculate_emissions(code, parsed=parsed)
+        except Exception as e:
+            # One file that cannot be analyzed is reported, not fatal to the rest
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["delta"] = result["changed_emissions"] - result["base_emissions"]
+        files.append(result)
+
+    base_total = sum(f["base_emissions"] for f in files)
+    changed_total = sum(f["changed_emissions"] for f in files)
+    return {
+        "base": base,
+        "head": head,
+        "files": files,
+        "issues": sum(len(f["issues"]) for f in files),
+        "base_emissions": base_total,
+        "changed_emissions": changed_total,
+        "delta": changed_total - base_total,
+        "reduction": calculate_emission_reduction(base_total, changed_total),
+    }
+
+def run_changes(repo: str, revisions: str, output_format: str = "text") -> Dict:
+    """Report issues in changed lines and the emission delta of the touched files"""
+    from CodeAnalyzer import write_ndjson
+
+    report = analyze_changes(repo, revisions)
+    if output_format == "ndjson":
+        for result in report["files"]:
+            for issue in result["issues"]:
+                write_ndjson({"type": "issue", "path": result["path"], **issue.to_dict()})
+            write_ndjson({"type": "file", **{key: value for key, value in result.items() if key != "issues"},
+                          "issues": len(result["issues"])})
+        write_ndjson({"type": "summary", **{key: value for key, value in report.items() if key != "files"},
+                      "files": len(report["files"])})
+        return report
+
+    for result in report["files"]:
+        if result["error"]:
+            print(f"{result['path']}: failed ({result['error']})")
+            continue
+        print(f"{result['path']} [{result['status']}]: {len(result['issues'])} issues in changed lines, "
+              f"{result['base_emissions']:.6f} -> {result['changed_emissions']:.6f} kg CO2")
+        for issue in result["issues"]:
+            print(f"  Line {issue.line}: {issue.issue}")
+            print(f"  Recommendation: {issue.recommendation}")
+
+    print("\nChanged Files Summary:")
+    print(f"Files changed: {len(report['files'])}")
+    print(f"Issues in changed lines: {report['issues']}")
+    print(f"Emissions: {report['base_emissions']:.6f} -> {report['changed_emissions']:.6f} kg CO2 "
+          f"({report['delta']:+.6f})")
+    return report
@@ -0,0 +1,160 @@
+import ast
+import hashlib
+from typing import Dict, List, Tuple
+
+from CodeAnalyzer import CodeAnalyzer, ParsedModule, assigned_target
+from ingest import LineIndex, join_lines
+
+# Column-0 lines that open a top-level definition chunk
+DEFINITION_PREFIXES = ('def ', 'async def ', 'class ', '@')
+# Column-0 lines that continue the previous top-level statement
+CONTINUATION_PREFIXES = (')', ']', '}', '#', 'else', 'elif', 'except', 'finally')
+
+def split_chunks(lines: List[str]) -> List[Tuple[int, str]]:
+    """
+    Split module lines into top-level function/class chunks and the runs of
+    module-level statements between them. Returns (first line number, text)
+    pairs. The split is a cheap line scan; a chunk that does not parse on its
+    own makes the caller fall back to whole-file analysis.
+    """
+    starts = []
+    in_definition = False
+    after_decorator = False
+    for i, line in enumerate(lines):
+        if not line or line[0] in ' \t' or line.startswith(CONTINUATION_PREFIXES):
+            continue
+        is_definition = line.startswith(DEFINITION_PREFIXES)
+        if not starts or (is_definition and not after_decorator) or \
+           (in_definition and not is_definition):
+            starts.append(i)
+        in_definition = is_definition
+        after_decorator = line.startswith('@')
+
+    # Leading blank and comment lines belong to the first chunk
+    starts[:1] = [0]
+    bounds = starts[1:] + [len(lines)]
+    return [(start + 1, join_lines(lines, start, end)) for start, end in zip(starts, bounds)]
+
+class _ChunkAnalyzer(CodeAnalyzer):
+    """
+    Analyzer for a single chunk. Detectors local to a statement run as usual;
+    module-wide state is recorded as compact events for later recombination.
+    """
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.sort_events = []
+
+    def _check_sorted(self, value: ast.expr, line: int):
+        self.sort_events.append((line, value))
+
+    def summarize(self) -> Dict:
+        # Module-wide rule finalization happens once the chunks are recombined
+        self.parsed = ParsedModule(self.code)
+        self.parsed.metrics = self.run_rules(self.parsed.tree)
+        # Names local to a function or class are settled within the chunk
+        module = self.symbols.module
+        self.check_unused_variables([symbol for symbol in self.symbols.unused() if symbol.scope is not module])
+        self.check_loop_invariants()
+        return {
+            "issues": self.issues,
+            "optimizations": self.optimizations,
+            "metrics": self.parsed.metrics,
+            "declared": {name: symbol.declared_line for name, symbol in module.symbols.items()
+                         if symbol.declared_line is not None},
+            "loop_bound": {name for name, symbol in module.symbols.items() if symbol.loop_bound},
+            "global_uses": self.symbols.global_uses(),
+            "sort_events": self.sort_events,
+            # Keyed by target source, the form _report_string_concat renders
+            "concat_initial": {ast.unparse(assigned_target(node)): ast.unparse(node.value)
+                               for node in self.concat_initial.values()},
+            "concats": {ast.unparse(assigned_target(nodes[0])):
+                            [(n.lineno, ast.unparse(n.value) if isinstance(n, ast.AugAssign) else None)
+                             for n in nodes]
+                        for nodes in self.string_concats.values()},
+        }
+
+class IncrementalAnalyzer:
+    """
+    Re-analyze a file after edits by re-visiting only the top-level chunks
+    whose text changed. Chunk summaries are cached by content hash with line
+    numbers relative to the chunk, so unchanged chunks that merely moved are
+    reused as well.
+    """
+    def __init__(self):
+        self._summaries = {}
+        self.parsed = None
+        self.chunks_analyzed = 0
+        self.chunks_reused = 0
+
+    def analyze(self, code: str):
+        lines = LineIndex(code)
+        chunks = split_chunks(lines)
+
+        keys = [hashlib.sha256(text.encode('utf-8')).hexdigest() for _, text in chunks]
+        summaries = {}
+        self.chunks_analyzed = self.chunks_reused = 0
+        try:
+            for key, (_, text) in zip(keys, chunks):
+                if key in summaries:
+                    continue
+                if key in self._summaries:
+                    summaries[key] = self._summaries[key]
+                    self.chunks_reused += 1
+                else:
+                    summaries[key] = _ChunkAnalyzer(text).summarize()
+                    self.chunks_analyzed += 1
+        except SyntaxError:
+            # The line scan split a multi-line construct; analyze the file whole
+            self._summaries = {}
+            self.parsed = ParsedModule(code)
+            analyzer = CodeAnalyzer(code, self.parsed)
+            return analyzer.analyze()
+
+        # Keep only the chunks present in this version of the file
+        self._summaries = summaries
+        ordered = [(start, summaries[key]) for key, (start, _) in zip(keys, chunks)]
+        return self._combine(code, ordered)
+
+    def _combine(self, code: str, ordered):
+        metrics = {}
+        for _, summary in ordered:
+            for metric, count in summary["metrics"].items():
+                metrics[metric] = metrics.get(metric, 0) + count
+        self.parsed = ParsedModule(code, metrics)
+
+        merged = CodeAnalyzer(code, self.parsed)
+        concat_lines, concat_initial, concat_values = {}, {}, {}
+        declared, loop_bound, global_uses = {}, set(), set()
+        for start, summary in ordered:
+            offset = start - 1
+            for issue in summary["issues"]:
+                merged.issues.append(issue.moved(offset))
+            for line, opts in summary["optimizations"].items():
+                merged.optimizations[line + offset] = [
+                    dict(opt, start=opt['start'] + offset, end=opt['end'] + offset) for opt in opts]
+
+            # Replay module-wide state in source order
+            for name, line in summary["declared"].items():
+                declared.setdefault(name, line + offset)
+            loop_bound |= summary["loop_bound"]
+            global_uses |= summary["global_uses"]
+            for line, value in summary["sort_events"]:
+                merged._check_sorted(value, line + offset)
+            for target, value in summary["concat_initial"].items():
+                concat_initial.setdefault(target, value)
+            for target, entries in summary["concats"].items():
+                for line, value in entries:
+                    concat_lines.setdefault(target, []).append(line + offset)
+                    if value is not None:
+                        concat_values.setdefault(target, []).append(value)
+
+        for target, lines in concat_lines.items():
+            augmented = concat_values.get(target, [])
+            if len(lines) < 3 or not augmented:
+                continue
+            pieces = [concat_initial[target]] if target in concat_initial else []
+            merged._report_string_concat(target, lines, pieces + augmented)
+        for name, line in declared.items():
+            if name not in global_uses and name not in loop_bound:
+                merged._report_unused(name, line)
+        return merged.issues, merged.apply_optimizations()
@@ -0,0 +1,90 @@
+import os
+import mmap
+import hashlib
+from array import array
+from typing import List, Union
+
+def read_source(path: str, encoding: str = 'utf-8') -> str:
+    """
+    Read a source file through a memory map, decoding it straight from the
+    mapped pages so no intermediate bytes copy is made. Line endings are
+    normalized to '\\n' as text-mode reads would.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                return decode_source(view, encoding)
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's raw bytes, hashed from a memory map"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+def decode_source(data, encoding: str = 'utf-8') -> str:
+    """Decode source bytes or any buffer, normalizing line endings to '\\n'. Text passes through undecoded."""
+    text = data if isinstance(data, str) else str(data, encoding)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+class LineIndex:
+    """
+    Start offset of every line of a source string. Behaves like the list
+    code.splitlines() would give for '\\n'-terminated lines, but slices the
+    one shared string on demand instead of holding a copy of every line.
+    """
+    __slots__ = ('text', 'starts')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.starts = array('q')
+        if not text:
+            return
+        self.starts.append(0)
+        find = text.find
+        last = len(text) - 1
+        position = find('\n')
+        # A trailing newline ends the last line rather than opening a new one
+        while position != -1 and position < last:
+            self.starts.append(position + 1)
+            position = find('\n', position + 1)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _end(self, index: int) -> int:
+        if index + 1 < len(self.starts):
+            return self.starts[index + 1] - 1
+        text = self.text
+        return len(text) - 1 if text.endswith('\n') else len(text)
+
+    def __getitem__(self, key: Union[int, slice]):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("line index out of range")
+        return self.text[self.starts[key]:self._end(key)]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def joined(self, start: int, stop: int) -> str:
+        """lines[start:stop] joined with '\\n', taken as one slice of the source"""
+        stop = min(stop, len(self))
+        if start >= stop:
+            return ""
+        return self.text[self.starts[start]:self._end(stop - 1)]
+
+def join_lines(lines: Union[LineIndex, List[str]], start: int, stop: int) -> str:
+    """'\\n'.join(lines[start:stop]) without per-line copies when lines is a LineIndex"""
+    if isinstance(lines, LineIndex):
+        return lines.joined(start, stop)
+    return '\n'.join(lines[start:stop])
@@ -0,0 +1,124 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+class Instrumentation:
+    """
+    Opt-in wall time and counters for each detector rule and pipeline phase.
+    Rule statistics are gathered locally during a walk and merged once per
+    analysis, so enabling this adds little overhead beyond the timer calls.
+    """
+    def __init__(self):
+        self.rules = {}
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def wrap_dispatch(self, table: Dict[type, list]):
+        """Return a timed copy of a dispatch table and the stats it fills in"""
+        stats = {}
+        wrapped = {}
+        for node_type, checks in table.items():
+            wrapped[node_type] = [self._timed(check, stats) for check in checks]
+        return wrapped, stats
+
+    @staticmethod
+    def _timed(check, stats):
+        name = type(check.__self__).__name__
+        entry = stats.setdefault(name, [0, 0.0, 0])
+
+        def timed(node, analyzer):
+            before = len(analyzer.issues)
+            start = time.perf_counter()
+            check(node, analyzer)
+            entry[1] += time.perf_counter() - start
+            entry[0] += 1
+            entry[2] += len(analyzer.issues) - before
+        return timed
+
+    def record_rule(self, name: str, calls: int, seconds: float, issues: int):
+        with self._lock:
+            entry = self.rules.setdefault(name, {"calls": 0, "seconds": 0.0, "issues": 0})
+            entry["calls"] += calls
+            entry["seconds"] += seconds
+            entry["issues"] += issues
+
+    def record_rules(self, stats: Dict[str, list]):
+        for name, (calls, seconds, issues) in stats.items():
+            self.record_rule(name, calls, seconds, issues)
+
+    def record_phase(self, name: str, seconds: float, calls: int = 1):
+        with self._lock:
+            entry = self.phases.setdefault(name, {"calls": 0, "seconds": 0.0})
+            entry["calls"] += calls
+            entry["seconds"] += seconds
+
+    def merge(self, report: Dict):
+        """Fold in a report() produced elsewhere, such as by a batch worker"""
+        for name, entry in report.get("rules", {}).items():
+            self.record_rule(name, entry["calls"], entry["seconds"], entry["issues"])
+        for name, entry in report.get("phases", {}).items():
+            self.record_phase(name, entry["seconds"], entry["calls"])
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {"rules": {name: dict(entry) for name, entry in self.rules.items()},
+                    "phases": {name: dict(entry) for name, entry in self.phases.items()}}
+
+    def prometheus(self) -> str:
+        """Render the counters in the Prometheus text exposition format"""
+        report = self.report()
+        series = [
+            ("analyzer_rule_calls_total", "Nodes inspected by each detector rule", "rule", report["rules"], "calls"),
+            ("analyzer_rule_seconds_total", "Wall time spent in each detector rule", "rule", report["rules"], "seconds"),
+            ("analyzer_rule_issues_total", "Issues reported by each detector rule", "rule", report["rules"], "issues"),
+            ("analyzer_phase_calls_total", "Executions of each pipeline phase", "phase", report["phases"], "calls"),
+            ("analyzer_phase_seconds_total", "Wall time spent in each pipeline phase", "phase", report["phases"], "seconds"),
+        ]
+        lines = []
+        for metric, help_text, label, entries, field in series:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for name in sorted(entries):
+                lines.append(f'{metric}{{{label}="{name}"}} {entries[name][field]}')
+        return "\n".join(lines) + "\n"
+
+# Process-wide instrumentation; None means disabled
+_active: Optional[Instrumentation] = None
+
+def enable(instrumentation: Instrumentation = None) -> Instrumentation:
+    global _active
+    _active = instrumentation or Instrumentation()
+    return _active
+
+def disable():
+    global _active
+    _active = None
+
+def active() -> Optional[Instrumentation]:
+    return _active
+
+@contextmanager
+def phase(name: str):
+    """Time a pipeline phase when instrumentation is enabled"""
+    instrumentation = _active
+    if instrumentation is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        instrumentation.record_phase(name, time.perf_counter() - start)
+
+def format_report(report: Dict) -> str:
+    """Plain-text table of a report(), slowest entries first"""
+    lines = ["Profile by rule:", f"{'rule':<24}{'calls':>10}{'issues':>10}{'seconds':>12}"]
+    for name, entry in sorted(report["rules"].items(), key=lambda item: -item[1]["seconds"]):
+        lines.append(f"{name:<24}{entry['calls']:>10}{entry['issues']:>10}{entry['seconds']:>12.6f}")
+    lines.append("")
+    lines.append("Profile by phase:")
+    lines.append(f"{'phase':<24}{'calls':>10}{'seconds':>22}")
+    for name, entry in sorted(report["phases"].items(), key=lambda item: -item[1]["seconds"]):
+        lines.append(f"{name:<24}{entry['calls']:>10}{entry['seconds']:>22.6f}")
+    return "\n".join(lines)
@@ -0,0 +1,246 @@
+import ast
+import copy
+from typing import Dict, List, Optional
+
+from symbols import BUILTIN_NAMES, LoopInfo, SymbolTable
+
+# Expressions with a scope of their own, whose names may not mean what they do in the loop
+NESTED_SCOPES = (ast.Lambda, ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)
+
+# Regex constructors worth compiling once, keyed by module
+REGEX_CONSTRUCTORS = {('re', 'compile')}
+
+def _reference(node: ast.AST):
+    # (root name, attribute depth) of a Name or a.b.c chain, or (None, 0)
+    depth = 0
+    while type(node) is ast.Attribute:
+        node = node.value
+        depth += 1
+    if type(node) is ast.Name:
+        return node.id, depth
+    return None, 0
+
+def _stable_reference(node: ast.AST, info: LoopInfo, private: Optional[set]) -> bool:
+    # A loop that may run other code leaves only its scope's private objects alone
+    root, _ = _reference(node)
+    return root is not None and info.is_stable(root) and (private is None or root in private)
+
+def _unary_operand(node: ast.AST) -> ast.AST:
+    while type(node) is ast.UnaryOp:
+        node = node.operand
+    return node
+
+def _arithmetic(node: ast.AST, info: LoopInfo, private: Optional[set]) -> Optional[bool]:
+    # True for arithmetic involving a stable name or chain, False for constants
+    # alone, None when the expression cannot be hoisted
+    node = _unary_operand(node)
+    if type(node) is ast.Constant:
+        return False
+    if type(node) is not ast.BinOp:
+        return True if _stable_reference(node, info, private) else None
+    left, right = _arithmetic(node.left, info, private), _arithmetic(node.right, info, private)
+    if left is None or right is None:
+        return None
+    # Two bare references could be lists or sets, whose sum is a fresh object every time
+    if left and right and ast.BinOp not in (type(_unary_operand(node.left)), type(_unary_operand(node.right))):
+        return None
+    return left or right
+
+def _regex_argument(node: ast.AST, module: str, info: LoopInfo, private: Optional[set]) -> bool:
+    # Pattern constants, flags such as re.I | re.M, and stable references
+    if type(node) is ast.Constant:
+        return True
+    if type(node) is ast.BinOp and type(node.op) is ast.BitOr:
+        return _regex_argument(node.left, module, info, private) and \
+            _regex_argument(node.right, module, info, private)
+    if type(node) is ast.Attribute and type(node.value) is ast.Name and node.value.id == module:
+        return True
+    return _stable_reference(node, info, private)
+
+def is_invariant(node: ast.AST, info: LoopInfo, private: Optional[set] = None) -> bool:
+    """
+    Whether an expression in a loop computes the same value on every
+    iteration and is worth computing once: len() of a stable value, a regex
+    compiled from constants, an attribute chain at least two lookups deep,
+    or arithmetic with a constant on every operator. A name is stable when
+    the loop neither rebinds it, mutates it, nor hands it to a call that
+    could. private is None for a loop that leaves shared objects alone, and
+    otherwise the names of SymbolTable.private_names that no other code can
+    change; parameters and aliases are never among them.
+    """
+    node_type = type(node)
+    if node_type is ast.Call:
+        func = node.func
+        if type(func) is ast.Name:
+            return (func.id == 'len' and 'len' not in info.stores and len(node.args) == 1 and
+                    not node.keywords and _stable_reference(node.args[0], info, private))
+        if type(func) is ast.Attribute and type(func.value) is ast.Name and \
+           (func.value.id, func.attr) in REGEX_CONSTRUCTORS and func.value.id not in info.stores:
+            arguments = node.args + [keyword.value for keyword in node.keywords]
+            return bool(node.args) and type(node.args[0]) is ast.Constant and all(
+                _regex_argument(argument, func.value.id, info, private) for argument in arguments)
+        return False
+    if node_type is ast.Attribute:
+        _, depth = _reference(node)
+        return depth >= 2 and type(node.ctx) is ast.Load and _stable_reference(node, info, private)
+    if node_type is ast.BinOp:
+        return bool(_arithmetic(node, info, private))
+    return False
+
+def _constant_operands(node: ast.AST, info: LoopInfo, symbols: SymbolTable) -> bool:
+    node = _unary_operand(node)
+    if type(node) is ast.BinOp:
+        return _constant_operands(node.left, info, symbols) and _constant_operands(node.right, info, symbols)
+    if type(node) is ast.Constant:
+        return True
+    return type(node) is ast.Name and symbols.constant_bound(info.scope, node.id)
+
+def hoistable(node: ast.expr, info: LoopInfo, symbols: SymbolTable) -> bool:
+    """
+    Whether an invariant expression can be computed once before its loop
+    without changing what the program does. Arithmetic on a list or array
+    builds a new object every time, which the hoisted version would share
+    across iterations, so it only moves when every operand is a constant or
+    a name bound to nothing but constants.
+    """
+    return type(node) is not ast.BinOp or _constant_operands(node, info, symbols)
+
+def _collect(node: ast.AST, info: LoopInfo, private: Optional[set], found: List[ast.expr]):
+    if is_invariant(node, info, private):
+        found.append(node)
+        return
+    node_type = type(node)
+    if node_type in NESTED_SCOPES:
+        return
+    # Only the parts evaluated on every pass are candidates
+    if node_type is ast.BoolOp:
+        _collect(node.values[0], info, private, found)
+        return
+    if node_type is ast.IfExp:
+        _collect(node.test, info, private, found)
+        return
+    for field, value in ast.iter_fields(node):
+        # A method's lookup goes with its call, which may change the receiver
+        if node_type is ast.Call and field == 'func' and type(value) is ast.Attribute:
+            _collect(value.value, info, private, found)
+            continue
+        for child in value if type(value) is list else (value,):
+            if isinstance(child, ast.expr):
+                _collect(child, info, private, found)
+            elif type(child) is ast.keyword:
+                _collect(child.value, info, private, found)
+
+def _collect_statement(stmt: ast.stmt, info: LoopInfo, private: Optional[set], found: List[ast.expr]):
+    # Compound statements contribute the header evaluated every time they are reached
+    if isinstance(stmt, (ast.If, ast.While)):
+        _collect(stmt.test, info, private, found)
+    elif isinstance(stmt, (ast.For, ast.AsyncFor)):
+        _collect(stmt.iter, info, private, found)
+    elif isinstance(stmt, (ast.With, ast.AsyncWith)):
+        for item in stmt.items:
+            _collect(item.context_expr, info, private, found)
+    elif isinstance(stmt, ast.Match):
+        _collect(stmt.subject, info, private, found)
+    elif not hasattr(stmt, 'body'):
+        for field, value in ast.iter_fields(stmt):
+            # Assignment targets are not computed, and an assert message only on failure
+            if field not in ('targets', 'target', 'msg') and isinstance(value, ast.expr):
+                _collect(value, info, private, found)
+
+def find_invariants(info: LoopInfo, symbols: SymbolTable) -> List[ast.expr]:
+    """
+    Hoistable expressions of a for or while loop, in source order. Only the
+    largest invariant expression is kept where one contains another, and
+    only those evaluated unconditionally on every iteration are considered.
+    """
+    loop = info.node
+    private = None if symbols.isolated(info) else symbols.private_names(info.scope)
+    found = []
+    if type(loop) is ast.While:
+        _collect(loop.test, info, private, found)
+    for stmt in loop.body:
+        _collect_statement(stmt, info, private, found)
+    return found
+
+def loop_invariants(symbols: SymbolTable) -> Dict[ast.AST, List[ast.expr]]:
+    """find_invariants for every for and while loop that has any"""
+    results = {}
+    for loop, info in symbols.loops.items():
+        if type(loop) in (ast.For, ast.While):
+            found = find_invariants(info, symbols)
+            if found:
+                results[loop] = found
+    return results
+
+def _words(node: ast.AST) -> List[str]:
+    # Identifiers of an expression in reading order, for naming the hoisted value
+    if type(node) is ast.Name:
+        return [node.id]
+    if type(node) is ast.Attribute:
+        return _words(node.value) + [node.attr]
+    if type(node) is ast.Constant:
+        return [str(node.value)] if type(node.value) is int and node.value >= 0 else []
+    if type(node) is ast.Call:
+        if type(node.func) is ast.Name:
+            return [word for argument in node.args for word in _words(argument)] + [node.func.id]
+        return ['pattern']
+    return [word for child in ast.iter_child_nodes(node) for word in _words(child)]
+
+def hoisted_name(node: ast.expr, taken: set) -> str:
+    """A fresh variable name for a hoisted expression, added to taken"""
+    words = [word for word in _words(node) if word != 'self'][-3:] or ['hoisted']
+    base = '_'.join(words).strip('_') or 'hoisted'
+    if not base.isidentifier():
+        base = f"hoisted_{base}"
+    name, suffix = base, 2
+    while name in taken:
+        name = f"{base}_{suffix}"
+        suffix += 1
+    taken.add(name)
+    return name
+
+class _Replace(ast.NodeTransformer):
+    def __init__(self, names: Dict[str, str]):
+        self.names = names
+
+    def generic_visit(self, node):
+        if isinstance(node, NESTED_SCOPES) or isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            return node
+        if isinstance(node, ast.expr):
+            name = self.names.get(ast.dump(node))
+            if name is not None:
+                return ast.copy_location(ast.Name(id=name, ctx=ast.Load()), node)
+        return super().generic_visit(node)
+
+def taken_names(symbols: SymbolTable, info: LoopInfo) -> set:
+    """
+    Names a variable hoisted out of a loop must not collide with: the
+    builtins and every name of the top-level function or class around the
+    loop, or of the loop itself at module level. This never reaches past
+    one top-level definition, so chunked and whole-module analysis pick the
+    same names.
+    """
+    names = set(BUILTIN_NAMES)
+    scope = info.scope
+    if scope.parent is None:
+        names.update(node.id for node in ast.walk(info.node) if type(node) is ast.Name)
+        return names
+    while scope.parent.parent is not None:
+        scope = scope.parent
+    names.update(symbols.names_under(scope))
+    return names
+
+def hoist(info: LoopInfo, found: List[ast.expr], taken: set) -> str:
+    """
+    Source for the loop with each distinct invariant expression assigned to
+    a fresh variable just before it, and read from that variable inside.
+    """
+    names = {}
+    lines = []
+    for node in found:
+        key = ast.dump(node)
+        if key not in names:
+            names[key] = hoisted_name(node, taken)
+            lines.append(f"{names[key]} = {ast.unparse(node)}")
+    lines.append(ast.unparse(_Replace(names).visit(copy.deepcopy(info.node))))
+    return '\n'.join(lines)
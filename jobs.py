@@ -0,0 +1,61 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+class QueueFullError(RuntimeError):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+class JobQueue:
+    """
+    Bounded in-process worker pool for analysis jobs. Submitting returns a job
+    id immediately; callers poll status() for progress and the result. At most
+    max_pending jobs may be queued or running, so slow analyses cannot pile up
+    without limit, and finished jobs are forgotten after retention_seconds.
+    """
+    def __init__(self, max_workers: int = 2, max_pending: int = 32, retention_seconds: float = 600):
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+        self._jobs = {}
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable, *args) -> str:
+        with self._lock:
+            self._purge_expired()
+            if self._active >= self.max_pending:
+                raise QueueFullError(f"{self._active} jobs already pending")
+            self._active += 1
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {"id": job_id, "status": "queued", "submitted": time.time(),
+                                  "finished": None, "result": None, "error": None}
+        self._executor.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable, args):
+        with self._lock:
+            self._jobs[job_id]["status"] = "running"
+        try:
+            result, error, status = fn(*args), None, "finished"
+        except Exception as e:
+            result, error, status = None, f"{type(e).__name__}: {e}", "failed"
+        with self._lock:
+            self._jobs[job_id].update(status=status, result=result, error=error, finished=time.time())
+            self._active -= 1
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.retention_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["finished"] is not None and job["finished"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
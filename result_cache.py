@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional
+from concurrent.futures import Executor
+
+from CodeAnalyzer import RULESET_VERSION, analyze_source, schedule_analyses
+
+class ResultCache:
+    """
+    On-disk cache of analysis results keyed by a hash of the source bytes and
+    the analyzer rule-set version. Entries hold the issues list, the optimized
+    code with its unified diff and both emission values, and the least recently used entries are
+    evicted once the cache grows past max_entries.
+    """
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                issues TEXT NOT NULL,
+                optimized_code TEXT NOT NULL,
+                original_emissions REAL NOT NULL,
+                optimized_emissions REAL NOT NULL,
+                last_used REAL NOT NULL,
+                diff TEXT NOT NULL DEFAULT ''
+            )
+        """)
+        # Databases created before diffs were cached lack the column
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(results)")}
+        if 'diff' not in columns:
+            self._conn.execute("ALTER TABLE results ADD COLUMN diff TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key_for(code: str) -> str:
+        digest = hashlib.sha256(code.encode('utf-8')).hexdigest()
+        return f"{RULESET_VERSION}:{digest}"
+
+    def get(self, code: str) -> Optional[Dict]:
+        key = self.key_for(code)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT issues, optimized_code, original_emissions, optimized_emissions, diff "
+                "FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return {
+            "issues": json.loads(row[0]),
+            "optimized_code": row[1],
+            "diff": row[4],
+            "original_emissions": row[2],
+            "optimized_emissions": row[3],
+        }
+
+    def put(self, code: str, result: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(key, issues, optimized_code, original_emissions, optimized_emissions, last_used, diff) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.key_for(code), json.dumps([dict(issue) for issue in result["issues"]]), result["optimized_code"],
+                 result["original_emissions"], result["optimized_emissions"], time.time(),
+                 result.get("diff", "")))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM results WHERE key IN "
+                "(SELECT key FROM results ORDER BY last_used LIMIT ?)", (excess,))
+            self.evictions += excess
+
+    def get_or_analyze(self, code: str, executor: Executor = None) -> Dict:
+        """Return the cached result for this source, analyzing and storing it on a miss"""
+        result = self.get(code)
+        if result is None:
+            result = analyze_source(code, executor)
+            self.put(code, result)
+        return result
+
+    def get_or_analyze_many(self, codes: List[str], executor: Executor) -> List:
+        """
+        get_or_analyze for many sources. Misses are analyzed together through
+        schedule_analyses, each distinct source once. Returns one entry per
+        source: its result, or the exception its analysis raised.
+        """
+        results = [self.get(code) for code in codes]
+        missing = {}
+        for index, result in enumerate(results):
+            if result is None:
+                missing.setdefault(codes[index], []).append(index)
+        sources = list(missing)
+        for position, future in schedule_analyses(sources, executor):
+            code = sources[position]
+            try:
+                result = future.result()
+                self.put(code, result)
+            except Exception as e:
+                result = e
+            for index in missing[code]:
+                results[index] = result
+        return results
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,570 @@
+import ast
+import builtins
+from typing import List, Optional
+
+BUILTIN_NAMES = frozenset(dir(builtins))
+
+# Methods that change the object they are called on
+MUTATING_METHODS = frozenset({
+    'append', 'extend', 'insert', 'pop', 'remove', 'clear', 'sort', 'reverse', 'update', 'add',
+    'discard', 'setdefault', 'popitem', 'difference_update', 'intersection_update',
+    'symmetric_difference_update', 'appendleft', 'extendleft', 'popleft', 'rotate',
+    'write', 'writelines', 'seek', 'truncate', 'send', 'close',
+})
+
+# Builtins that neither keep nor change the arguments they are given
+PURE_FUNCTIONS = frozenset({
+    'len', 'abs', 'min', 'max', 'sum', 'sorted', 'str', 'repr', 'int', 'float', 'bool', 'tuple',
+    'isinstance', 'issubclass', 'hash', 'id', 'type', 'print', 'format', 'round', 'ord', 'chr',
+})
+
+# Builtins whose result is a new object or an immutable value, never one of their arguments
+FRESH_FUNCTIONS = frozenset({
+    'list', 'dict', 'set', 'frozenset', 'tuple', 'bytearray', 'sorted', 'len', 'int', 'float', 'str',
+    'bool', 'repr', 'hash', 'id', 'ord', 'chr', 'format',
+})
+
+# Expressions whose value is fresh when all of their parts are
+FRESH_PARTS = {
+    ast.BinOp: ('left', 'right'),
+    ast.UnaryOp: ('operand',),
+    ast.BoolOp: ('values',),
+    ast.Compare: ('left', 'comparators'),
+    ast.IfExp: ('body', 'orelse'),
+}
+
+# Nodes opening a scope of their own, keyed to the kind of scope
+SCOPE_KINDS = {
+    ast.FunctionDef: 'function',
+    ast.AsyncFunctionDef: 'function',
+    ast.Lambda: 'function',
+    ast.ClassDef: 'class',
+    ast.ListComp: 'comprehension',
+    ast.SetComp: 'comprehension',
+    ast.GeneratorExp: 'comprehension',
+    ast.DictComp: 'comprehension',
+}
+
+class Symbol:
+    """
+    One name in one scope: the nodes binding it, the loads resolved to it
+    from this scope or nested ones, and facts gathered about it in the walk.
+    """
+    __slots__ = ('name', 'scope', 'definitions', 'uses', 'declared_line', 'loop_bound',
+                 'shadows', 'shadows_builtin')
+
+    def __init__(self, name: str, scope: 'Scope'):
+        self.name = name
+        self.scope = scope
+        self.definitions = []
+        self.uses = []
+        # First line of a plain assignment to the name, the declaration unused-variable checks report
+        self.declared_line = None
+        self.loop_bound = False
+        self.shadows = None
+        self.shadows_builtin = False
+
+    @property
+    def unused(self) -> bool:
+        return not self.uses
+
+    def _absorb(self, other: 'Symbol'):
+        self.definitions.extend(other.definitions)
+        self.uses.extend(other.uses)
+        if other.declared_line is not None and (self.declared_line is None or other.declared_line < self.declared_line):
+            self.declared_line = other.declared_line
+        self.loop_bound = self.loop_bound or other.loop_bound
+
+    def __repr__(self):
+        return f"Symbol({self.name!r}, {self.scope.kind})"
+
+class Scope:
+    """A module, function, class or comprehension scope and the names bound in it"""
+    __slots__ = ('kind', 'node', 'parent', 'symbols', 'loads', 'loaded', 'globals', 'nonlocals', 'aliases', 'loops')
+
+    def __init__(self, kind: str, node: ast.AST, parent: Optional['Scope']):
+        self.kind = kind
+        self.node = node
+        self.parent = parent
+        self.symbols = {}
+        self.loads = []
+        # Names read in this scope, kept once the loads are resolved
+        self.loaded = set()
+        self.globals = set()
+        self.nonlocals = set()
+        # Names declared global or nonlocal, mapped to the symbol they bind
+        self.aliases = {}
+        # Loops of this scope enclosing the node being walked, innermost last
+        self.loops = []
+
+    def symbol(self, name: str) -> Symbol:
+        symbol = self.symbols.get(name)
+        if symbol is None:
+            symbol = self.symbols[name] = Symbol(name, self)
+        return symbol
+
+    def lookup(self, name: str) -> Optional[Symbol]:
+        """The symbol a load of name in this scope refers to, or None for builtins and undefined names"""
+        scope = self
+        while scope is not None:
+            symbol = scope.aliases.get(name)
+            if symbol is not None:
+                return symbol
+            symbol = scope.symbols.get(name)
+            # Class bodies are not visible from the scopes nested in them
+            if symbol is not None and (scope is self or scope.kind != 'class'):
+                return symbol
+            scope = scope.parent
+        return None
+
+class LoopInfo:
+    """
+    Names a loop rebinds or mutates in place, and names whose objects it
+    hands to calls that might change them, including in its nested loops.
+    receivers are the names whose methods it calls. calls is set when it
+    calls anything else beyond PURE_FUNCTIONS, or yields or awaits, any of
+    which may run code that changes objects shared with other names.
+    """
+    __slots__ = ('node', 'scope', 'stores', 'mutated', 'escaped', 'receivers', 'calls')
+
+    def __init__(self, node: ast.AST, scope: Scope):
+        self.node = node
+        self.scope = scope
+        self.stores = set()
+        self.mutated = set()
+        self.escaped = set()
+        self.receivers = set()
+        self.calls = False
+
+    def is_invariant(self, name: str) -> bool:
+        return name not in self.stores and name not in self.mutated
+
+    def is_stable(self, name: str) -> bool:
+        """Invariant, and never passed to a call or used as a method receiver"""
+        return name not in self.stores and name not in self.mutated and name not in self.escaped
+
+class Marker:
+    """Stack entry run by the walk between nodes to switch scopes or close a loop"""
+    __slots__ = ('action', 'value')
+
+    def __init__(self, action, value):
+        self.action = action
+        self.value = value
+
+def _root_name(node: ast.AST) -> Optional[str]:
+    # The variable at the bottom of an a.b[c].d chain
+    while isinstance(node, (ast.Attribute, ast.Subscript)):
+        node = node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+def _target_elements(target: ast.AST):
+    # The individual targets of a possibly nested unpacking assignment
+    if isinstance(target, (ast.Tuple, ast.List)):
+        for element in target.elts:
+            yield from _target_elements(element)
+    elif isinstance(target, ast.Starred):
+        yield from _target_elements(target.value)
+    else:
+        yield target
+
+def _constant_value(node: ast.AST) -> bool:
+    # Constants, and signs, arithmetic and tuples made only of them
+    node_type = type(node)
+    if node_type is ast.Constant:
+        return True
+    if node_type is ast.UnaryOp:
+        return _constant_value(node.operand)
+    if node_type is ast.BinOp:
+        return _constant_value(node.left) and _constant_value(node.right)
+    if node_type is ast.Tuple:
+        return all(_constant_value(element) for element in node.elts)
+    return False
+
+class SymbolTable:
+    """
+    Scope-aware symbol table filled in by CodeAnalyzer's dispatcher walk.
+    handlers maps node types to callbacks that record bindings and loads
+    in the current scope; they receive the node's children, reversed as
+    the walk pushes them, and may add Marker entries around them so that
+    scope changes follow the walk exactly. After the walk, resolve() links
+    every load to the symbol it refers to, after which the unused, shadowed
+    and loop-invariant queries are dictionary and set lookups.
+    """
+    def __init__(self, tree: ast.AST = None):
+        self.module = Scope('module', tree, None)
+        self.scope = self.module
+        self.scopes = [self.module]
+        self.scope_of_node = {}
+        self.loops = {}
+        self.unresolved = set()
+        # Values of plain `name = value` bindings, keyed by the stored Name
+        self.values = {}
+        # Loads that cannot hand the object on: method receivers, pure builtin
+        # arguments, item store bases, loop iterables and returned values
+        self.confined = set()
+        # Symbols read from, or declared global or nonlocal in, another scope
+        self.captured = set()
+        self._private = {}
+        self._redirects = {}
+        self.handlers = {node_type: self._enter_scope for node_type in SCOPE_KINDS}
+        self.handlers.update({
+            ast.Name: self._name,
+            ast.arg: self._arg,
+            ast.arguments: self._arguments,
+            ast.comprehension: self._comprehension,
+            ast.alias: self._alias,
+            ast.Global: self._global,
+            ast.Nonlocal: self._nonlocal,
+            ast.Assign: self._assign,
+            ast.AugAssign: self._store_targets,
+            ast.AnnAssign: self._store_targets,
+            ast.Delete: self._store_targets,
+            ast.NamedExpr: self._named_expr,
+            ast.ExceptHandler: self._bound_name,
+            ast.MatchAs: self._bound_name,
+            ast.MatchStar: self._bound_name,
+            ast.MatchMapping: self._match_mapping,
+            ast.For: self._loop,
+            ast.AsyncFor: self._loop,
+            ast.While: self._loop,
+            ast.Call: self._call,
+            ast.Return: self._return,
+            ast.Yield: self._suspend,
+            ast.YieldFrom: self._suspend,
+            ast.Await: self._suspend,
+        })
+
+    # Walk callbacks
+
+    def _switch(self, scope: Scope):
+        self.scope = scope
+
+    def _close_loop(self, info: LoopInfo):
+        loops = info.scope.loops
+        loops.pop()
+        if loops:
+            loops[-1].stores |= info.stores
+            loops[-1].mutated |= info.mutated
+            loops[-1].escaped |= info.escaped
+            loops[-1].receivers |= info.receivers
+            loops[-1].calls |= info.calls
+
+    def _in_scope(self, children: list, outer: List[ast.AST], outer_scope: Scope, inner_scope: Scope):
+        # Wrap the children evaluated in the enclosing scope with switches to it and back
+        outer_ids = {id(node) for node in outer}
+        wrapped = []
+        for child in children:
+            if id(child) in outer_ids:
+                wrapped += (Marker(self._switch, inner_scope), child, Marker(self._switch, outer_scope))
+            else:
+                wrapped.append(child)
+        children[:] = wrapped
+
+    def _bind(self, name: str, node: ast.AST, scope: Scope = None) -> Symbol:
+        scope = scope or self.scope
+        symbol = scope.symbol(name)
+        symbol.definitions.append(node)
+        if scope.loops:
+            scope.loops[-1].stores.add(name)
+        return symbol
+
+    def _enter_scope(self, node, children):
+        outer_scope = self.scope
+        kind = SCOPE_KINDS[type(node)]
+        outer = []
+        if kind != 'comprehension' and not isinstance(node, ast.Lambda):
+            # Decorators, bases and return annotations are evaluated where the definition is
+            outer = list(node.decorator_list)
+            if kind == 'class':
+                outer += node.bases + node.keywords
+            elif node.returns is not None:
+                outer.append(node.returns)
+            self._bind(node.name, node)
+        scope = Scope(kind, node, outer_scope)
+        self.scopes.append(scope)
+        self.scope_of_node[node] = scope
+        if outer:
+            self._in_scope(children, outer, outer_scope, scope)
+        children.insert(0, Marker(self._switch, outer_scope))
+        self.scope = scope
+
+    def _arguments(self, node, children):
+        # Defaults are evaluated where the function is defined
+        outer = node.defaults + [default for default in node.kw_defaults if default is not None]
+        if outer:
+            self._in_scope(children, outer, self.scope.parent, self.scope)
+
+    def _arg(self, node, children):
+        self._bind(node.arg, node)
+        if node.annotation is not None:
+            self._in_scope(children, [node.annotation], self.scope.parent, self.scope)
+
+    def _comprehension(self, node, children):
+        # The first iterable is evaluated in the scope enclosing the comprehension
+        scope = self.scope
+        if scope.kind == 'comprehension' and scope.node.generators[0] is node:
+            self._in_scope(children, [node.iter], scope.parent, scope)
+
+    def _name(self, node, children):
+        if type(node.ctx) is ast.Load:
+            self.scope.loads.append(node)
+        elif self._redirects:
+            self._bind(node.id, node, self._redirects.pop(node, None))
+        else:
+            self._bind(node.id, node)
+
+    def _named_expr(self, node, children):
+        # An assignment expression binds in the nearest enclosing non-comprehension scope
+        scope = self.scope
+        while scope.kind == 'comprehension':
+            scope = scope.parent
+        if scope is not self.scope and isinstance(node.target, ast.Name):
+            self._redirects[node.target] = scope
+
+    def _assign(self, node, children):
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                symbol = self.scope.symbol(target.id)
+                if symbol.declared_line is None:
+                    symbol.declared_line = node.lineno
+        if len(node.targets) == 1 and type(node.targets[0]) is ast.Name:
+            self.values[node.targets[0]] = node.value
+        self._store_targets(node, children)
+
+    def _store_targets(self, node, children):
+        targets = node.targets if hasattr(node, 'targets') else [node.target]
+        if type(node) is ast.AnnAssign and type(node.target) is ast.Name and node.value is not None:
+            self.values[node.target] = node.value
+        for target in targets:
+            if type(target) is ast.Subscript and type(target.value) is ast.Name:
+                self.confined.add(target.value)
+        # Stores into an attribute or item mutate the object they hang off
+        loops = self.scope.loops
+        if not loops:
+            return
+        for target in targets:
+            for element in _target_elements(target):
+                if isinstance(element, (ast.Attribute, ast.Subscript)):
+                    name = _root_name(element.value)
+                    if name is not None:
+                        loops[-1].mutated.add(name)
+
+    def _alias(self, node, children):
+        if node.name != '*':
+            self._bind(node.asname or node.name.partition('.')[0], node)
+
+    def _bound_name(self, node, children):
+        if node.name is not None:
+            self._bind(node.name, node)
+
+    def _match_mapping(self, node, children):
+        if node.rest is not None:
+            self._bind(node.rest, node)
+
+    def _global(self, node, children):
+        self.scope.globals.update(node.names)
+
+    def _nonlocal(self, node, children):
+        self.scope.nonlocals.update(node.names)
+
+    def _loop(self, node, children):
+        scope = self.scope
+        info = self.loops[node] = LoopInfo(node, scope)
+        scope.loops.append(info)
+        if not isinstance(node, ast.While):
+            if type(node.iter) is ast.Name:
+                self.confined.add(node.iter)
+            for target in _target_elements(node.target):
+                if isinstance(target, ast.Name):
+                    scope.symbol(target.id).loop_bound = True
+            self._store_targets(node, children)
+        children.insert(0, Marker(self._close_loop, info))
+
+    def _call(self, node, children):
+        func = node.func
+        pure = type(func) is ast.Name and func.id in PURE_FUNCTIONS
+        # A method given keywords, such as list.sort(key=...), may call back into other code
+        receiver = func.value if type(func) is ast.Attribute and type(func.value) is ast.Name and \
+            not node.keywords else None
+        if pure:
+            self.confined.update(argument for argument in node.args if type(argument) is ast.Name)
+        elif receiver is not None:
+            self.confined.add(receiver)
+        loops = self.scope.loops
+        if not loops or pure:
+            return
+        info = loops[-1]
+        if receiver is not None:
+            info.receivers.add(receiver.id)
+        else:
+            info.calls = True
+        if type(func) is ast.Attribute:
+            # Any method may change its receiver; the mutating ones are known to
+            name = _root_name(func.value)
+            if name is not None:
+                info.escaped.add(name)
+                if func.attr in MUTATING_METHODS:
+                    info.mutated.add(name)
+        for argument in node.args + [keyword.value for keyword in node.keywords]:
+            name = _root_name(argument.value if type(argument) is ast.Starred else argument)
+            if name is not None:
+                info.escaped.add(name)
+
+    def _return(self, node, children):
+        if type(node.value) is ast.Name:
+            self.confined.add(node.value)
+
+    def _suspend(self, node, children):
+        # Other code runs while a generator or coroutine is suspended
+        loops = self.scope.loops
+        if loops:
+            loops[-1].calls = True
+
+    # Resolution and queries
+
+    def resolve(self):
+        """Link declarations and loads to their symbols once the walk is done"""
+        module = self.module
+        # Scopes are listed outermost first, so a nonlocal's target is already settled
+        for scope in self.scopes:
+            for name in scope.globals:
+                self._alias_to(scope, name, module.symbol(name))
+            for name in scope.nonlocals:
+                target = scope.parent
+                while target is not None and (target.kind == 'class' or
+                                              (name not in target.symbols and name not in target.aliases)):
+                    target = target.parent
+                if target is not None and target is not module:
+                    self._alias_to(scope, name, target.aliases.get(name) or target.symbols[name])
+
+        for scope in self.scopes:
+            cache = {}
+            for node in scope.loads:
+                name = node.id
+                if name in cache:
+                    symbol = cache[name]
+                else:
+                    symbol = cache[name] = scope.lookup(name)
+                    if symbol is not None and symbol.scope is not scope:
+                        self.captured.add(symbol)
+                if symbol is None:
+                    self.unresolved.add(name)
+                else:
+                    symbol.uses.append(node)
+            scope.loaded = set(cache)
+            scope.loads = []
+
+        for scope in self.scopes:
+            if scope.kind == 'class':
+                continue
+            outer = scope.parent
+            while outer is not None and outer.kind == 'class':
+                outer = outer.parent
+            for name, symbol in scope.symbols.items():
+                if outer is not None:
+                    symbol.shadows = outer.lookup(name)
+                symbol.shadows_builtin = symbol.shadows is None and name in BUILTIN_NAMES
+
+    def _alias_to(self, scope: Scope, name: str, target: Symbol):
+        local = scope.symbols.pop(name, None)
+        if local is not None:
+            target._absorb(local)
+        scope.aliases[name] = target
+        self.captured.add(target)
+
+    def unused(self) -> List[Symbol]:
+        """Plainly assigned module and function names that are never read, excluding loop variables"""
+        return [symbol for scope in self.scopes if scope.kind in ('module', 'function')
+                for symbol in scope.symbols.values()
+                if symbol.declared_line is not None and not symbol.uses and not symbol.loop_bound]
+
+    def shadowed(self) -> List[Symbol]:
+        """Names bound in a scope that hide a name of an enclosing scope or a builtin"""
+        return [symbol for scope in self.scopes for symbol in scope.symbols.values()
+                if symbol.shadows is not None or symbol.shadows_builtin]
+
+    def is_loop_invariant(self, loop: ast.AST, name: str) -> bool:
+        """Whether a loop leaves name bound to the same, unmutated object on every iteration"""
+        return self.loops[loop].is_invariant(name)
+
+    def _fresh(self, node: ast.AST, scope: Scope) -> bool:
+        # Whether an expression always evaluates to a new object or an immutable value
+        node_type = type(node)
+        if node_type in (ast.Constant, ast.JoinedStr, ast.List, ast.Tuple, ast.Set, ast.Dict,
+                         ast.ListComp, ast.SetComp, ast.DictComp):
+            return True
+        if node_type is ast.Call:
+            func = node.func
+            return type(func) is ast.Name and func.id in FRESH_FUNCTIONS and scope.lookup(func.id) is None
+        fields = FRESH_PARTS.get(node_type)
+        if fields is None:
+            return False
+        for field in fields:
+            value = getattr(node, field)
+            if not all(self._fresh(part, scope) for part in (value if type(value) is list else (value,))):
+                return False
+        return True
+
+    def private_names(self, scope: Scope) -> set:
+        """
+        Names of scope holding objects no other code can reach: every binding
+        assigns a fresh value, such as a literal, a display or a builtin
+        constructor's result, and the name is only read in scope itself to
+        call a method, subscript a store, iterate, return or pass to a pure
+        builtin. Names only ever bound to constants need not be confined.
+        """
+        private = self._private.get(scope)
+        if private is None:
+            private = self._private[scope] = set()
+            values, confined, captured = self.values, self.confined, self.captured
+            for name, symbol in scope.symbols.items():
+                if symbol in captured or not symbol.definitions or not all(
+                        definition in values and self._fresh(values[definition], scope)
+                        for definition in symbol.definitions):
+                    continue
+                if all(type(values[definition]) is ast.Constant for definition in symbol.definitions) or \
+                   all(use in confined for use in symbol.uses):
+                    private.add(name)
+        return private
+
+    def constant_bound(self, scope: Scope, name: str) -> bool:
+        """
+        Whether a load of name in scope can only see a constant: every
+        binding of the symbol it refers to plainly assigns a number, string
+        or other constant, or a tuple of or arithmetic on constants
+        """
+        symbol = scope.lookup(name)
+        return symbol is not None and bool(symbol.definitions) and all(
+            definition in self.values and _constant_value(self.values[definition])
+            for definition in symbol.definitions)
+
+    def isolated(self, info: LoopInfo) -> bool:
+        """Whether a loop leaves alone every object reachable from outside its scope's private names"""
+        if info.calls:
+            return False
+        private = None
+        for name in (info.receivers | info.mutated):
+            if private is None:
+                private = self.private_names(info.scope)
+            if name not in private:
+                return False
+        return True
+
+    def names_under(self, scope: Scope) -> set:
+        """Every name bound, declared or read in scope or the scopes nested in it"""
+        names = set()
+        for inner in self.scopes:
+            outer = inner
+            while outer is not None and outer is not scope:
+                outer = outer.parent
+            if outer is not None:
+                names.update(inner.symbols, inner.aliases, inner.loaded)
+        return names
+
+    def scope_of(self, node: ast.AST) -> Optional[Scope]:
+        """The scope a function, lambda, class or comprehension node opens"""
+        return self.scope_of_node.get(node)
+
+    def global_uses(self) -> set:
+        """Names read from module scope anywhere, including names not bound in this tree"""
+        return {name for name, symbol in self.module.symbols.items() if symbol.uses} | self.unresolved
@@ -1,6 +1,46 @@
+import ast
+import difflib
+import importlib
+import io
+import json
+import os
+import pickle
+import re
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import redirect_stdout
+from xml.etree import ElementTree
 from unittest.mock import patch
-from CodeAnalyzer import CodeMetricsCalculator, CodeAnalyzer, calculate_emissions
+from CodeAnalyzer import CodeMetricsCalculator, CodeAnalyzer, ParsedModule, calculate_emissions, \
+    Rule, RULE_REGISTRY, build_dispatch_table, METRIC_NODE_TYPES, count_metrics, scan_metrics, estimate_emissions, resolve_edits, splice, unified_diff, Issue, IssueKind, \
+    analyze_batch, analyze_file, lint_source, summarize_batch, run_batch, main, analyze_source, schedule_analyses, run_source_with_tracking, run_code_with_tracking
+from result_cache import ResultCache
+from incremental import IncrementalAnalyzer, split_chunks
+from jobs import JobQueue, QueueFullError
+from charts import emissions_svg, emissions_svg_data_url
+from downloads import DownloadStore
+import instrumentation
+import benchmark
+import emission_batch
+from ingest import LineIndex, read_source
+from git_changes import analyze_changes
+from emission_index import EmissionIndex
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import flask
+except ImportError:
+    flask = None
 
 # Assuming the provided code is saved in a file named `code_analyzer.py` and imported here
 # from code_analyzer import CodeMetricsCalculator, CodeAnalyzer, calculate_emissions
@@ -24,6 +64,104 @@ for i in range(10):
         emission_factor = calculator.calculate_emission_factor()
         self.assertAlmostEqual(emission_factor, 0.000101, places=6)  # Verify emission factor
 
+class TestIngest(unittest.TestCase):
+    def test_line_index_matches_splitlines(self):
+        for text in ("", "\n", "a", "a\n", "a\nb", "a\n\nb\n\n", "x = 1\n    y\n"):
+            index = LineIndex(text)
+            self.assertEqual(list(index), text.splitlines(), repr(text))
+            self.assertEqual(len(index), len(text.splitlines()))
+            self.assertEqual(index[1:], text.splitlines()[1:])
+            self.assertEqual(index.joined(0, len(index)), "\n".join(text.splitlines()))
+
+    def test_read_source_normalizes_newlines(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "crlf.py")
+            with open(path, "wb") as f:
+                f.write("s = 'caf\u00e9'\r\nprint(s)\r".encode("utf-8"))
+            empty = os.path.join(tmp, "empty.py")
+            open(empty, "w").close()
+            self.assertEqual(read_source(path), "s = 'caf\u00e9'\nprint(s)\n")
+            self.assertEqual(read_source(empty), "")
+            parsed = ParsedModule.from_file(path)
+        self.assertEqual(parsed.line_count, 2)
+        self.assertEqual(parsed.lines[1], "print(s)")
+
+class TestParsedModule(unittest.TestCase):
+    def test_shared_parse(self):
+        code = """
+for i in range(len(my_list)):
+    print(my_list[i])
+"""
+        parsed = ParsedModule(code)
+        with patch("CodeAnalyzer.ast.parse", wraps=ast.parse) as mock_parse:
+            CodeAnalyzer(code, parsed).analyze()
+            calculate_emissions(code, parsed=parsed)
+            mock_parse.assert_called_once()
+
+    def test_metrics_match_calculator(self):
+        code = """
+x = [1, 2]
+while x:
+    x.pop()
+y = 1 + 2
+"""
+        parsed = ParsedModule(code)
+        self.assertEqual(parsed.metrics, {
+            'loop_count': 1, 'operation_count': 1, 'memory_operations': 1, 'function_calls': 1,
+            'invariant_computations': 0
+        })
+        self.assertEqual(calculate_emissions(code, parsed=parsed), calculate_emissions(code))
+
+class TestMetricsScanner(unittest.TestCase):
+    snippets = [
+        "for i in range(10):\n    while i:\n        i -= 1\n",
+        "result = [x * 2 for x in data if x % 2]\nnested = [[1, 2], [3, -4]]\n",
+        "def f(*args, **kwargs) -> int:\n    return g(*args, **{**kwargs, 'a': [1]}) @ m\n",
+        "value = f'{a + b!r:>{width * 2}}' + str(len(items))\n",
+        "match command:\n    case [x, *rest] if x > 1 + 2:\n        go(x)\n    case Point(x=0) | {'k': [1]}:\n        pass\n",
+        "import os, sys as system\nfrom a.b import (c, d)\nglobal g\nx: list[int] = [] or None\n",
+        "class C(Base, metaclass=M):\n    @dec(1)\n    async def run(self):\n        async for x in y: await z(x)\n",
+        "lambda a, *b, c=[1, 2]: (a + c[0], b[1:-1])\ntry:\n    pass\nexcept (E, F) as e:\n    raise G(e) from e\n",
+    ]
+
+    @staticmethod
+    def reference_counts(code):
+        # The original ast.walk visitor the pruned walk must agree with; invariants need the analyzer walk
+        counts = dict.fromkeys(METRIC_NODE_TYPES.values(), 0)
+        for node in ast.walk(ast.parse(code)):
+            metric = METRIC_NODE_TYPES.get(type(node))
+            if metric is not None:
+                counts[metric] += 1
+        counts['invariant_computations'] = CodeAnalyzer(code).run_rules(ast.parse(code))['invariant_computations']
+        return counts
+
+    def test_matches_full_walk(self):
+        corpus = self.snippets + benchmark.generate_corpus(3, 300, 0.7, seed=4)
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in ("CodeAnalyzer.py", "app.py", "incremental.py", "benchmark.py"):
+            with open(os.path.join(here, name), encoding="utf-8") as f:
+                corpus.append(f.read())
+        for code in corpus:
+            self.assertEqual(scan_metrics(code), self.reference_counts(code), code[:60])
+
+    def test_estimate_matches_full_emissions(self):
+        code = "for i in range(len(items)):\n    print(items[i] + 1)\n"
+        with patch("CodeAnalyzer.count_metrics", wraps=count_metrics) as mock_count:
+            self.assertAlmostEqual(estimate_emissions(code), calculate_emissions(code))
+        mock_count.assert_called_once()
+
+    def test_estimate_counts_invariants(self):
+        code = "def f(items, cfg):\n    for x in items:\n        print(x * cfg.scale.factor)\n"
+        parsed = ParsedModule(code)
+        self.assertEqual(parsed.metrics['invariant_computations'], 1)
+        self.assertEqual(scan_metrics(code), parsed.metrics)
+        self.assertEqual(estimate_emissions(code), calculate_emissions(code))
+
+    def test_loop_free_scan_skips_analyzer_walk(self):
+        with patch("CodeAnalyzer.walk_metrics") as mock_walk:
+            self.assertEqual(scan_metrics("x = [f(1) + 2]\n")['function_calls'], 1)
+        mock_walk.assert_not_called()
+
 class TestCodeAnalyzer(unittest.TestCase):
     def test_detect_issues(self):
         code = """
@@ -43,6 +181,442 @@ for i in range(len(my_list)):
         _, optimized_code = analyzer.analyze()
         self.assertIn("enumerate", optimized_code)  # Check if `enumerate` is used in optimized code
 
+    def test_string_concats_reported_once(self):
+        code = 'message = ""\n' + "".join(f'message += "part{i}"\n' for i in range(50))
+        analyzer = CodeAnalyzer(code)
+        issues, optimized_code = analyzer.analyze()
+        concat_issues = [i for i in issues if i["issue"] == "Multiple string concatenations"]
+        self.assertEqual(len(concat_issues), 1)
+        self.assertEqual(concat_issues[0]["line"], 2)
+        self.assertIn('message = "".join([\'\', \'part0\'', optimized_code)
+        self.assertIn("'part49'])", optimized_code)
+
+    def test_append_runs_grouped_by_adjacency(self):
+        code = """
+items = []
+items.append(1)
+items.append(2)
+items.append(3)
+items.append(4)
+print(items)
+items.append(5)
+items.append(6)
+def build():
+    out = []
+    out.append('a')
+    out.append('b')
+    out.append('c')
+    return out
+"""
+        analyzer = CodeAnalyzer(code)
+        issues, optimized_code = analyzer.analyze()
+        append_issues = [i for i in issues if i["issue"] == "Multiple list append operations"]
+        self.assertEqual([i["line"] for i in append_issues], [3, 12])
+        self.assertIn("items.extend([1, 2, 3, 4])", optimized_code)
+        self.assertIn("items.append(5)", optimized_code)
+        self.assertIn("    out.extend(['a', 'b', 'c'])", optimized_code)
+
+    def test_append_run_keeps_tab_indentation(self):
+        code = "def f():\n\tout = []\n\tout.append(1)\n\tout.append(2)\n\tout.append(3)\n\treturn out\n"
+        _, optimized_code = CodeAnalyzer(code).analyze()
+        self.assertIn("\n\tout.extend([1, 2, 3])\n", optimized_code)
+        compile(optimized_code, "<optimized>", "exec")
+
+    def test_overlapping_edits_resolved_deterministically(self):
+        optimizations = {
+            5: [{'start': 3, 'end': 4, 'new_code': 'inner'}],
+            1: [{'start': 1, 'end': 4, 'new_code': 'outer'}, {'start': 1, 'end': 4, 'new_code': 'same span'}],
+            7: [{'start': 6, 'end': 9, 'new_code': 'out of range'}],
+        }
+        edits, skipped = resolve_edits(optimizations, 6)
+        self.assertEqual(edits, [(1, 4, 'outer')])
+        self.assertEqual([edit['new_code'] for edit in skipped], ['same span', 'inner', 'out of range'])
+
+    def test_rewrites_of_one_line_are_all_resolved(self):
+        code = "for i in range(len(rows)):\n    for x in rows[i]:\n        if x:\n            out.append(x)\n"
+        analyzer = CodeAnalyzer(code)
+        issues, optimized_code = analyzer.analyze()
+        self.assertEqual([issue.issue for issue in issues if issue.line == 1],
+                         ["Nested loops with conditional append", "range(len()) antipattern"])
+        self.assertTrue(optimized_code.startswith("result = ["))
+        [skipped] = analyzer.skipped_optimizations
+        self.assertIn("enumerate(rows)", skipped['new_code'])
+
+    def test_rewrite_keeps_function_indentation(self):
+        code = """
+def show(items):
+    for i in range(len(items)):
+        print(items[i])
+    return items
+"""
+        analyzer = CodeAnalyzer(code)
+        _, optimized_code = analyzer.analyze()
+        compile(optimized_code, "<optimized>", "exec")
+        self.assertIn("enumerate(items):\n        print(items[i])\n    return items", optimized_code)
+        self.assertEqual(analyzer.skipped_optimizations, [])
+
+    def test_splice_and_diff_match_difflib(self):
+        lines = [f"line{i}" for i in range(1, 21)]
+        edits = [(2, 3, "two\nthree\nextra"), (15, 15, "fifteen")]
+        new_lines = splice(lines, edits).split("\n")
+        self.assertEqual(new_lines[:5], ["line1", "two", "three", "extra", "line4"])
+        self.assertEqual(len(new_lines), 21)
+        expected = "\n".join(difflib.unified_diff(lines, new_lines, "original.py", "optimized.py", lineterm=""))
+        self.assertEqual(unified_diff(lines, edits), expected + "\n")
+
+    def test_optimization_rendered_on_access(self):
+        code = "for i in range(len(items)):\n    print(items[i])\n"
+        with patch("CodeAnalyzer.unparse", wraps=ast.unparse) as mock_unparse:
+            issues, optimized_code = CodeAnalyzer(code).analyze(rewrite=False)
+            mock_unparse.assert_not_called()
+            self.assertIsNone(optimized_code)
+            self.assertEqual(issues[0]["issue"], "range(len()) antipattern")
+            self.assertIn("enumerate(items)", issues[0]["optimization"])
+            mock_unparse.assert_called()
+        self.assertEqual(json.loads(json.dumps([issue.to_dict() for issue in issues]))[0], dict(issues[0]))
+
+    def test_issue_records(self):
+        code = "for i in range(len(items)):\n    print(items[i])\nunused = 1\n"
+        issues, _ = CodeAnalyzer(code).analyze()
+        loop_issue, unused_issue = sorted(issues, key=lambda x: x.line)
+        self.assertFalse(hasattr(loop_issue, "__dict__"))
+        self.assertIs(loop_issue.kind, IssueKind.RANGE_LEN)
+        self.assertEqual(dict(unused_issue), {"line": 3, "issue": "Unused variable",
+                                              "recommendation": "Remove unused variable 'unused'",
+                                              "optimization": "# Remove declaration of 'unused'"})
+        self.assertEqual(pickle.loads(pickle.dumps(loop_issue)), loop_issue.to_dict())
+        self.assertEqual(Issue(5, "Custom check", "Fix it").kind, "Custom check")
+
+class TestSymbolTable(unittest.TestCase):
+    def symbols(self, code):
+        analyzer = CodeAnalyzer(code)
+        analyzer.run_rules(ast.parse(code))
+        return analyzer.symbols
+
+    def test_unused_is_scope_aware(self):
+        code = """
+def first():
+    value = 1
+    return 2
+
+def second():
+    value = 3
+    return value
+
+def show():
+    print(config)
+
+config = 1
+"""
+        issues, _ = CodeAnalyzer(code).analyze()
+        self.assertEqual([(i.line, i.recommendation) for i in issues if i.issue == "Unused variable"],
+                         [(3, "Remove unused variable 'value'")])
+
+    def test_resolution_skips_class_scope(self):
+        code = "x = 1\nclass C:\n    x = 2\n    def m(self):\n        return x\n"
+        symbols = self.symbols(code)
+        [method] = [node for node in ast.walk(symbols.module.node) if isinstance(node, ast.FunctionDef)]
+        self.assertIs(symbols.scope_of(method).lookup("x"), symbols.module.symbols["x"])
+        self.assertEqual(len(symbols.module.symbols["x"].uses), 1)
+
+    def test_shadowed(self):
+        code = """
+def outer(list):
+    x = 1
+    def inner():
+        x = 2
+        return x
+    return inner, x, [x for x in list]
+"""
+        shadowed = {(symbol.name, symbol.scope.kind, symbol.shadows_builtin) for symbol in self.symbols(code).shadowed()}
+        self.assertEqual(shadowed, {("list", "function", True), ("x", "function", False),
+                                    ("x", "comprehension", False)})
+
+    def test_global_and_walrus_bindings(self):
+        code = "def f(items):\n    global count\n    count = 1\n    return [y for x in items if (y := x)]\n"
+        symbols = self.symbols(code)
+        self.assertEqual(symbols.module.symbols["count"].declared_line, 3)
+        [function] = [scope for scope in symbols.scopes if scope.kind == "function"]
+        self.assertEqual(set(function.symbols), {"items", "y"})
+
+    def test_loop_invariant(self):
+        code = """
+def f(items, limit):
+    out = []
+    for item in items:
+        while limit:
+            limit -= 1
+        n = len(items)
+        out.append(item)
+    return out, n
+"""
+        symbols = self.symbols(code)
+        outer, inner = sorted(symbols.loops, key=lambda loop: loop.lineno)
+        self.assertTrue(symbols.is_loop_invariant(outer, "items"))
+        for name in ("item", "n", "out", "limit"):
+            self.assertFalse(symbols.is_loop_invariant(outer, name), name)
+        self.assertTrue(symbols.is_loop_invariant(inner, "items"))
+
+    def test_constant_bound(self):
+        code = "SCALE = 2\ndef f(rows, step):\n    offset = -1\n    shape = (3, SCALE * 4)\n    base = []\n    step = 1\n"
+        symbols = self.symbols(code)
+        [function] = [scope for scope in symbols.scopes if scope.kind == "function"]
+        bound = {name for name in ("SCALE", "offset", "shape", "base", "rows", "step", "missing")
+                 if symbols.constant_bound(function, name)}
+        self.assertEqual(bound, {"SCALE", "offset"})
+
+class TestLoopInvariants(unittest.TestCase):
+    code = """
+import re
+
+def scan(self, items, lines):
+    found = []
+    for line in lines:
+        if len(line) > self.config.limit:
+            found.append(line)
+        found.append(len(items))
+    for line in lines:
+        match = re.compile(r"\\d+", re.I).match(line)
+        found.append(len(items) + match.end())
+    return found
+"""
+
+    def invariant_issues(self, code):
+        issues, optimized_code = CodeAnalyzer(code).analyze()
+        return [issue for issue in issues if issue.issue == "Loop-invariant computation"], optimized_code
+
+    def test_hoisted_rewrite(self):
+        issues, optimized_code = self.invariant_issues(self.code)
+        self.assertEqual([(issue.line, issue.span) for issue in issues], [(6, (6, 9)), (10, (10, 12))])
+        self.assertEqual(issues[0].recommendation, "Hoist invariant work out of the loop")
+        # The second loop calls methods of objects it knows nothing about, which
+        # could change items, so only the regex built from constants moves
+        self.assertIn("""
+    found = []
+    config_limit = self.config.limit
+    items_len = len(items)
+    for line in lines:
+        if len(line) > config_limit:
+            found.append(line)
+        found.append(items_len)
+    pattern = re.compile('\\\\d+', re.I)
+    for line in lines:
+        match = pattern.match(line)
+        found.append(len(items) + match.end())
+""", optimized_code)
+        compile(optimized_code, "<optimized>", "exec")
+
+    def test_changed_inputs_are_not_hoisted(self):
+        code = """
+def run(queue, config, total, helper):
+    while len(queue) > 0:
+        queue.pop()
+    for x in range(10):
+        helper(config)
+        total = total + config.options.size
+    for x in range(10):
+        config.options.size = x
+        print(config.options.size)
+"""
+        issues, _ = self.invariant_issues(code)
+        self.assertEqual(issues, [])
+
+    def test_shared_objects_are_not_hoisted_past_calls(self):
+        code = """
+def run(xs, out, items, helper):
+    for it in items:
+        helper(it)
+        n = len(xs)
+    ys = xs
+    for it in items:
+        ys.append(it)
+        print(len(xs), xs.options.size)
+    for it in items:
+        out[it] = len(xs)
+    for it in items:
+        yield len(xs)
+"""
+        issues, _ = self.invariant_issues(code)
+        self.assertEqual(issues, [])
+
+    def test_private_objects_are_hoisted_past_calls(self):
+        code = """
+def run(items, helper):
+    seen = []
+    limit = 10
+    for it in items:
+        helper(it)
+        seen.append(len(seen) + limit * 2)
+    total = [0]
+    for it in items:
+        total.append(it)
+        print(len(items))
+    print(seen, total)
+"""
+        issues, optimized_code = self.invariant_issues(code)
+        self.assertEqual([issue.line for issue in issues], [5, 9])
+        self.assertIn("    limit_2 = limit * 2\n    for it in items:\n", optimized_code)
+        self.assertIn("    items_len = len(items)\n    for it in items:\n        total.append(it)\n", optimized_code)
+
+    def test_arithmetic_on_shared_objects_is_not_rewritten(self):
+        code = """
+def run(row, base, items):
+    rows = []
+    for it in items:
+        rows.append(row * 2)
+    for x in items:
+        tmp = base * 1
+        tmp += [x]
+        print(tmp)
+    return rows
+"""
+        issues, optimized_code = self.invariant_issues(code)
+        # Hoisting would make every appended row, and every tmp, one shared list
+        self.assertEqual([(issue.line, issue.span) for issue in issues], [(4, None), (6, None)])
+        self.assertNotIn("optimization", issues[0])
+        outputs = []
+        for source in (code, optimized_code):
+            namespace = {}
+            exec(source, namespace)
+            with patch("builtins.print") as mock_print:
+                rows = namespace["run"]([1], [2], [2, 3, 4])
+            outputs.append((rows, [call.args for call in mock_print.call_args_list]))
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertEqual(outputs[0][1], [([2, 2],), ([2, 3],), ([2, 4],)])
+        rows[0].append(0)
+        self.assertEqual(rows[1], [1, 1])
+
+    def test_only_unconditional_work(self):
+        code = "def f(a, b, flag):\n    for x in b:\n        print(flag and a.b.c, a.b.d if x else 0)\n"
+        issues, _ = self.invariant_issues(code)
+        self.assertEqual(issues, [])
+
+    def test_module_level_loop_is_not_rewritten(self):
+        code = "for x in data:\n    print(x * cfg.scale.factor)\n"
+        [issue], optimized_code = self.invariant_issues(code)
+        self.assertIsNone(issue.span)
+        self.assertEqual(issue.optimization,
+                         "cfg_scale_factor = cfg.scale.factor\nfor x in data:\n    print(x * cfg_scale_factor)")
+        self.assertNotIn("cfg_scale_factor", optimized_code)
+
+    def test_weighted_in_complexity_score(self):
+        _, optimized_code = self.invariant_issues(self.code)
+        before, after = ParsedModule(self.code), ParsedModule(optimized_code)
+        self.assertEqual((before.metrics['invariant_computations'], after.metrics['invariant_computations']), (3, 0))
+        self.assertAlmostEqual(CodeMetricsCalculator(self.code, before).calculate_complexity_score() -
+                               CodeMetricsCalculator(optimized_code, after).calculate_complexity_score(), 9.0)
+
+class TestRuleDispatch(unittest.TestCase):
+    def test_custom_rule_sees_nodes_in_source_order(self):
+        class GlobalUseRule(Rule):
+            node_types = (ast.Global,)
+
+            def check(self, node, analyzer):
+                analyzer.report(node.lineno, "Global statement", "Pass state explicitly", "")
+
+        code = "def f():\n    global a\n\ndef g():\n    global b\n"
+        rules = [rule_class() for rule_class in RULE_REGISTRY] + [GlobalUseRule()]
+        issues, _ = CodeAnalyzer(code, rules=rules).analyze()
+        self.assertEqual([i["line"] for i in issues if i["issue"] == "Global statement"], [2, 5])
+
+    def test_dispatch_table(self):
+        table = build_dispatch_table([rule_class() for rule_class in RULE_REGISTRY])
+        self.assertIn(ast.For, table)
+        self.assertNotIn(ast.Constant, table)
+
+    def test_metrics_counted_in_analysis_walk(self):
+        code = "for i in range(10):\n    print(i)\n"
+        parsed = ParsedModule(code)
+        CodeAnalyzer(code, parsed).analyze()
+        with patch("CodeAnalyzer.count_metrics") as mock_count:
+            self.assertEqual(parsed.metrics["loop_count"], 1)
+            self.assertEqual(parsed.metrics["function_calls"], 2)
+            mock_count.assert_not_called()
+
+class TestInstrumentation(unittest.TestCase):
+    def tearDown(self):
+        instrumentation.disable()
+
+    def test_rule_and_phase_timings(self):
+        code = """
+for i in range(len(items)):
+    print(items[i])
+message = ""
+message += "a"
+message += "b"
+message += "c"
+"""
+        active = instrumentation.enable()
+        calculate_emissions(code)
+        CodeAnalyzer(code).analyze()
+        report = active.report()
+
+        self.assertEqual(report["rules"]["LoopRule"]["calls"], 1)
+        self.assertEqual(report["rules"]["LoopRule"]["issues"], 1)
+        self.assertEqual(report["rules"]["StringConcatRule"]["calls"], 3)
+        self.assertEqual(report["rules"]["StringConcatRule"]["issues"], 1)
+        for phase in ("parse", "walk", "unparse", "apply", "emission"):
+            self.assertGreater(report["phases"][phase]["calls"], 0)
+
+        text = active.prometheus()
+        self.assertIn('analyzer_rule_calls_total{rule="LoopRule"} 1', text)
+        self.assertIn("# TYPE analyzer_phase_seconds_total counter", text)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(instrumentation.active())
+        CodeAnalyzer("x = 1").analyze()
+        self.assertIsNone(instrumentation.active())
+
+class TestBenchmark(unittest.TestCase):
+    def test_generated_source_has_requested_patterns(self):
+        source = benchmark.generate_source(300, density=1.0, patterns=["appends", "concats"], pattern_size=5)
+        issues, _ = CodeAnalyzer(source).analyze()
+        kinds = {issue["issue"] for issue in issues}
+        self.assertEqual(kinds - {"Unused variable"},
+                         {"Multiple list append operations", "Multiple string concatenations"})
+        self.assertGreaterEqual(source.count("\n"), 300)
+
+    def test_compare_to_baseline(self):
+        baseline = [{"name": "analyze", "lines_per_sec": 1000.0}]
+        self.assertEqual(benchmark.compare_to_baseline([{"name": "analyze", "lines_per_sec": 900.0}], baseline, 0.2), [])
+        regressions = benchmark.compare_to_baseline([{"name": "analyze", "lines_per_sec": 500.0}], baseline, 0.2)
+        self.assertEqual(len(regressions), 1)
+
+    def test_failing_target_records_error(self):
+        def fail(source):
+            raise RuntimeError("index() returned 500")
+        entry = benchmark.measure("flask_index", ["x = 1\n"], fail)
+        self.assertEqual(entry["error"], "RuntimeError: index() returned 500")
+        self.assertNotIn("lines_per_sec", entry)
+        baseline = [{"name": "flask_index", "lines_per_sec": 1000.0}]
+        self.assertEqual(len(benchmark.compare_to_baseline([entry], baseline, 0.2)), 1)
+
+    @unittest.skipUnless(flask, "flask is not installed")
+    def test_run_benchmarks_with_flask(self):
+        corpus = benchmark.generate_corpus(2, 40, density=1.0, pattern_size=4)
+        directories = []
+        mkdtemp = tempfile.mkdtemp
+        def make_directory(*args, **kwargs):
+            directories.append(mkdtemp(*args, **kwargs))
+            return directories[-1]
+        with patch.dict(os.environ, {"SCORING_WORKERS": "1"}), \
+             patch("benchmark.tempfile.mkdtemp", side_effect=make_directory), \
+             patch("result_cache.analyze_source", wraps=analyze_source) as mock_analyze:
+            results = benchmark.run_benchmarks(corpus)
+        self.assertEqual([entry["name"] for entry in results],
+                         ["analyze", "calculate_emissions", "scan_metrics", "flask_index"])
+        for entry in results:
+            self.assertNotIn("error", entry)
+            self.assertGreater(entry["lines_per_sec"], 0)
+        # Both passes analyze every file: in a pool for timing, here for memory
+        executors = [call.args[1] for call in mock_analyze.call_args_list]
+        self.assertEqual(len(executors), 4)
+        self.assertIsInstance(executors[0], ProcessPoolExecutor)
+        self.assertEqual(executors[2:], [None, None])
+        self.assertTrue(executors[0]._shutdown_thread)
+        self.assertEqual(len(directories), 2)
+        self.assertFalse(any(os.path.exists(directory) for directory in directories))
+
 class TestEmissions(unittest.TestCase):
     def test_calculate_emissions(self):
         code = """
@@ -61,5 +635,617 @@ for i in range(10):
         emissions_non_optimized = calculate_emissions(code, is_optimized=False)
         self.assertLess(emissions_optimized, emissions_non_optimized)  # Optimized emissions should be lower
 
+    def test_source_and_file_tracking_agree(self):
+        code = "for i in range(10):\n    print(i)\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "code.py")
+            with open(path, "w") as f:
+                f.write(code)
+            self.assertEqual(run_code_with_tracking(path, True), run_source_with_tracking(code, True))
+        self.assertEqual(run_source_with_tracking("def broken(:"), 0.0)
+
+    def test_unparseable_rewrite_scores_zero(self):
+        # The if-chain rewrite does not parse inside a function body
+        code = "def f(x):\n" + "".join(f"    {'if' if i == 0 else 'elif'} x == {i}:\n        return {i}\n"
+                                       for i in range(4))
+        with ThreadPoolExecutor(1) as executor:
+            for result in (analyze_source(code), analyze_source(code, executor)):
+                self.assertIn("Long if-elif chain", [issue.issue for issue in result["issues"]])
+                self.assertGreater(result["original_emissions"], 0)
+                self.assertEqual(result["optimized_emissions"], 0.0)
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestEmissionBatch(unittest.TestCase):
+    sources = [
+        "x = 1\n",
+        "for i in range(len(items)):\n    print(items[i])\n",
+        "def f(a, b):\n    return [a + b for _ in range(10)]\n",
+    ]
+
+    def test_matches_scalar_emissions(self):
+        parsed = [ParsedModule(source) for source in self.sources]
+        arrays = emission_batch.metric_arrays([p.metrics for p in parsed], [p.line_count for p in parsed])
+        flags = [False, True, False]
+        scored = emission_batch.score_metric_arrays(arrays, is_optimized=flags)
+        expected = [calculate_emissions(source, flag) for source, flag in zip(self.sources, flags)]
+        numpy.testing.assert_allclose(scored["emissions"], expected, rtol=1e-12)
+        self.assertEqual(scored["files"], 3)
+        self.assertAlmostEqual(scored["total_emissions"], sum(expected))
+
+    def test_missing_metrics_count_as_zero(self):
+        metrics = {"loop_count": 1, "operation_count": 2, "memory_operations": 0, "function_calls": 3}
+        arrays = emission_batch.metric_arrays([metrics], [10])
+        numpy.testing.assert_array_equal(arrays["invariant_computations"], [0.0])
+        self.assertAlmostEqual(emission_batch.score_metric_arrays(arrays)["total_emissions"],
+                               emission_batch.score_emissions([1], [2], [0], [3], [10])["total_emissions"])
+
+    def test_weight_override(self):
+        scored = emission_batch.score_emissions([1, 0], [0, 2], [0, 0], [0, 0], [10, 10],
+                                                weights={"loop_count": 0.0})
+        numpy.testing.assert_array_equal(scored["complexity_score"], [0.0, 2.0])
+
+class TestDownloadStore(unittest.TestCase):
+    def test_persists_only_on_request(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = DownloadStore(tmp, retention_seconds=60)
+            digest = store.register("x = 1\n")
+            self.assertEqual(os.listdir(tmp), [])
+            path = store.path_for(digest)
+            self.assertEqual(os.path.basename(path), f"{digest}.py")
+            with open(path) as f:
+                self.assertEqual(f.read(), "x = 1\n")
+            self.assertIsNone(store.path_for("../../etc/passwd"))
+            self.assertIsNone(store.path_for("0" * 64))
+
+    def test_cleanup_removes_expired(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = DownloadStore(tmp, retention_seconds=60)
+            path = store.path_for(store.register("x = 1\n"))
+            os.utime(path, (0, 0))
+            store.cleanup()
+            self.assertFalse(os.path.exists(path))
+
+    def test_expired_download_is_not_served(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = DownloadStore(tmp, retention_seconds=60)
+            digest = store.register("x = 1\n")
+            path = store.path_for(digest)
+            self.assertTrue(os.path.isabs(path))
+            os.utime(path, (0, 0))
+            with patch("downloads.time.time", return_value=time.time() + 120):
+                self.assertIsNone(store.path_for(digest))
+            self.assertFalse(os.path.exists(path))
+            # Registering the source again starts a new retention period
+            self.assertEqual(store.path_for(store.register("x = 1\n")), path)
+
+class TestBatchAnalysis(unittest.TestCase):
+    def test_analyze_batch_directory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "good.py"), "w") as f:
+                f.write("for i in range(len(items)):\n    print(items[i])\n")
+            with open(os.path.join(tmp, "broken.py"), "w") as f:
+                f.write("def broken(:\n")
+            with open(os.path.join(tmp, "notes.txt"), "w") as f:
+                f.write("not python")
+
+            results = {os.path.basename(r["path"]): r for r in analyze_batch([tmp], max_workers=2)}
+
+        self.assertEqual(set(results), {"good.py", "broken.py"})
+        self.assertIsNone(results["good.py"]["error"])
+        self.assertGreater(results["good.py"]["original_emissions"], 0)
+        self.assertIn("SyntaxError", results["broken.py"]["error"])
+
+        summary = summarize_batch(results.values())
+        self.assertEqual(summary["files"], 2)
+        self.assertEqual(summary["failed"], 1)
+        self.assertEqual(summary["issues"], len(results["good.py"]["issues"]))
+
+    def test_missing_target(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            missing = os.path.join(tmp, "missing")
+            with self.assertRaises(FileNotFoundError):
+                next(analyze_batch([tmp, missing], max_workers=1))
+            out = io.StringIO()
+            with redirect_stdout(out), self.assertRaises(SystemExit) as exit_info:
+                main([missing])
+        self.assertEqual(exit_info.exception.code, 1)
+        self.assertIn(f"File '{missing}' does not exist.", out.getvalue())
+
+    def test_ndjson_output(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "good.py")
+            with open(path, "w") as f:
+                f.write("for i in range(len(items)):\n    print(items[i])\n")
+            out = io.StringIO()
+            with redirect_stdout(out):
+                run_batch([tmp], max_workers=1, output_format="ndjson")
+
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r["type"] for r in records], ["issue", "file", "summary"])
+        self.assertEqual(records[0]["line"], 1)
+        self.assertIn("enumerate", records[0]["optimization"])
+        self.assertEqual(records[0]["original_emissions"], records[1]["original_emissions"])
+        self.assertEqual(records[2]["files"], 1)
+
+    def test_lint_only(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "good.py"), "w") as f:
+                f.write("for i in range(len(items)):\n    print(items[i])\n")
+            [result] = analyze_batch([tmp], max_workers=1, mode="lint")
+
+        self.assertEqual(result["issues"][0]["issue"], "range(len()) antipattern")
+        self.assertNotIn("optimization", result["issues"][0])
+        self.assertEqual(result["original_emissions"], result["optimized_emissions"])
+
+    def test_lint_ignores_full_analysis_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "good.py")
+            with open(path, "w") as f:
+                f.write("for i in range(len(items)):\n    print(items[i])\n")
+            cache_path = os.path.join(tmp, "cache.sqlite3")
+            full = analyze_file(path, cache_path=cache_path)
+            for mode in ("lint", "metrics", "full"):
+                result = analyze_file(path, cache_path=cache_path, mode=mode)
+                self.assertEqual(result["cached"], mode == "full")
+            lint = analyze_file(path, cache_path=cache_path, mode="lint")
+
+        self.assertLess(full["optimized_emissions"], full["original_emissions"])
+        self.assertEqual(lint["original_emissions"], lint["optimized_emissions"])
+        self.assertNotIn("optimization", lint["issues"][0])
+
+    def test_lint_does_not_unparse(self):
+        code = ("self.items.append(1)\nself.items.append(2)\nself.items.append(3)\n"
+                "a = sorted(self.data[0])\nb = sorted(self.data[0])\nprint(a, b)\n"
+                "self.text = ''\nself.text += 'a'\nself.text += 'b'\nself.text += 'c'\n")
+        with patch("ast.unparse", side_effect=AssertionError("unparsed")):
+            issues = lint_source(code)["issues"]
+        self.assertEqual({issue["issue"] for issue in issues},
+                         {"Multiple list append operations", "Redundant sort operation",
+                          "Multiple string concatenations"})
+        optimizations = {issue["issue"]: issue["optimization"] for issue in CodeAnalyzer(code).analyze()[0]}
+        self.assertEqual(optimizations["Multiple list append operations"], "self.items.extend([1, 2, 3])")
+        self.assertEqual(optimizations["Redundant sort operation"], "self.data[0].sort(reverse=True)")
+        self.assertEqual(optimizations["Multiple string concatenations"],
+                         "self.text = \"\".join(['', 'a', 'b', 'c'])")
+        self.assertEqual(IncrementalAnalyzer().analyze(code)[0], CodeAnalyzer(code).analyze()[0])
+
+    def test_schedule_analyses(self):
+        codes = ["for i in range(len(items)):\n    print(items[i])\n", "def broken(:\n", "x = 1\n"]
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            outcomes = dict(schedule_analyses(codes, executor))
+            single = analyze_source(codes[0], executor)
+
+        self.assertEqual(sorted(outcomes), [0, 1, 2])
+        self.assertRaises(SyntaxError, outcomes[1].result)
+        for index in (0, 2):
+            self.assertEqual(outcomes[index].result(), analyze_source(codes[index]))
+        self.assertEqual(single, analyze_source(codes[0]))
+
+@unittest.skipIf(shutil.which("git") is None, "git is not installed")
+class TestGitChanges(unittest.TestCase):
+    def git(self, *args):
+        subprocess.run(["git", "-C", self.repo, "-c", "user.name=test", "-c", "user.email=test@example.com",
+                        *args], check=True, capture_output=True)
+
+    def write(self, name, text):
+        with open(os.path.join(self.repo, name), "w") as f:
+            f.write(text)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = self.tmp.name
+        self.git("init", "-q")
+        self.write("a.py", "def f(items):\n    for i in range(len(items)):\n        print(items[i])\n")
+        self.write("gone.py", "y = 2\n")
+        self.git("add", ".")
+        self.git("commit", "-qm", "base")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_only_issues_in_changed_hunks(self):
+        self.write("a.py", "def f(items):\n    for i in range(len(items)):\n        print(items[i])\n"
+                           "\ndef g(data):\n    for j in range(len(data)):\n        print(data[j])\n")
+        self.write("notes.txt", "not python")
+        self.git("rm", "-q", "gone.py")
+        self.git("add", ".")
+        self.git("commit", "-qm", "change")
+
+        report = analyze_changes(self.repo, "HEAD~1..HEAD")
+        files = {result["path"]: result for result in report["files"]}
+        self.assertEqual(set(files), {"a.py", "gone.py"})
+        self.assertEqual([issue.line for issue in files["a.py"]["issues"]], [6])
+        self.assertGreater(files["a.py"]["delta"], 0)
+        self.assertEqual(files["gone.py"]["changed_emissions"], 0.0)
+        self.assertAlmostEqual(report["delta"], sum(f["delta"] for f in report["files"]))
+
+    def test_working_tree(self):
+        self.write("a.py", "def f(items):\n    for i in range(len(items)):\n        print(items[i])\nz = list(w)\n")
+        report = analyze_changes(self.repo, "HEAD")
+        self.assertIsNone(report["head"])
+        [result] = report["files"]
+        self.assertEqual(sorted(issue.issue for issue in result["issues"]),
+                         ["Inefficient list copy", "Unused variable"])
+
+    def test_diff_prefix_config(self):
+        self.write("a.py", "def f(items):\n    for i in range(len(items)):\n        print(items[i])\nz = list(w)\n")
+        for key in ("diff.mnemonicPrefix", "diff.noprefix"):
+            self.git("config", key, "true")
+            [result] = analyze_changes(self.repo, "HEAD")["files"]
+            self.assertEqual(len(result["issues"]), 2, key)
+            self.git("config", "--unset", key)
+
+    def test_path_with_spaces(self):
+        self.write("my file.py", "x = 1\n")
+        self.git("add", ".")
+        self.git("commit", "-qm", "add")
+        self.write("my file.py", "x = 1\nz = list(w)\n")
+        [result] = analyze_changes(self.repo, "HEAD")["files"]
+        self.assertEqual(result["path"], "my file.py")
+        self.assertEqual([(issue.line, issue.issue) for issue in result["issues"]],
+                         [(2, "Inefficient list copy"), (2, "Unused variable")])
+
+    def test_per_file_errors(self):
+        self.write("a.py", "def broken(:\n")
+        self.write("b.py", "unscorable = 1\n")
+        self.write("c.py", "for i in range(len(items)):\n    print(items[i])\n")
+        self.git("add", ".")
+        self.git("commit", "-qm", "change")
+
+        def calculate(code, *args, **kwargs):
+            if "unscorable" in code:
+                raise ValueError("cannot score")
+            return calculate_emissions(code, *args, **kwargs)
+        with patch("git_changes.calculate_emissions", side_effect=calculate):
+            files = {result["path"]: result for result in analyze_changes(self.repo, "HEAD~1..HEAD")["files"]}
+        self.assertIn("SyntaxError", files["a.py"]["error"])
+        self.assertEqual(files["b.py"]["error"], "ValueError: cannot score")
+        self.assertIsNone(files["c.py"]["error"])
+        self.assertEqual(len(files["c.py"]["issues"]), 1)
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(os.path.join(self.tmp.name, "results.sqlite3"), max_entries=2)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_hit_skips_analysis(self):
+        code = "for i in range(len(items)):\n    print(items[i])\n"
+        first = self.cache.get_or_analyze(code)
+        with patch("result_cache.analyze_source") as mock_analyze:
+            second = self.cache.get_or_analyze(code)
+            mock_analyze.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_lru_eviction(self):
+        for code in ("a = 1\n", "b = 2\n"):
+            self.cache.get_or_analyze(code)
+        self.cache.get("a = 1\n")  # refresh a so b becomes least recently used
+        self.cache.get_or_analyze("c = 3\n")
+        self.assertIsNone(self.cache.get("b = 2\n"))
+        self.assertIsNotNone(self.cache.get("a = 1\n"))
+        self.assertEqual(self.cache.stats()["entries"], 2)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_get_or_analyze_many(self):
+        code = "for i in range(len(items)):\n    print(items[i])\n"
+        self.cache.get_or_analyze("a = 1\n")
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            results = self.cache.get_or_analyze_many(["a = 1\n", code, "def broken(:\n", code], executor)
+
+        self.assertEqual(results[1], analyze_source(code))
+        self.assertIs(results[1], results[3])
+        self.assertIsInstance(results[2], SyntaxError)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 4))
+        self.assertEqual(self.cache.get(code), results[1])
+
+    def test_key_includes_ruleset_version(self):
+        current = ResultCache.key_for("x = 1")
+        with patch("result_cache.RULESET_VERSION", "999"):
+            self.assertNotEqual(ResultCache.key_for("x = 1"), current)
+
+class TestEmissionIndex(unittest.TestCase):
+    def write(self, name, text):
+        with open(os.path.join(self.root, name), "w") as f:
+            f.write(text)
+
+    def test_incremental_snapshots_and_queries(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.root = os.path.join(tmp, "repo")
+            os.makedirs(self.root)
+            self.write("a.py", "for i in range(10):\n    print(i * 2)\n")
+            self.write("b.py", "x = 1\n")
+            self.write("c.py", "x = 1\n")
+            with EmissionIndex(os.path.join(tmp, "index.sqlite3")) as index:
+                first = index.update(self.root, label="first")
+                self.assertEqual((first["files"], first["scanned"], first["reused"]), (3, 2, 1))
+                self.assertAlmostEqual(index.total(), calculate_emissions("for i in range(10):\n    print(i * 2)\n")
+                                       + 2 * calculate_emissions("x = 1\n"))
+
+                self.write("b.py", "values = [1, 2, 3]\nprint(sorted(values))\n")
+                os.remove(os.path.join(self.root, "c.py"))
+                second = index.update(self.root)
+                self.assertEqual((second["files"], second["scanned"], second["reused"]), (2, 1, 1))
+
+                self.assertEqual([entry["path"] for entry in index.top(1)], ["a.py"])
+                delta = index.delta(first["snapshot"])
+                self.assertEqual({change["path"]: change["status"] for change in delta["files"]},
+                                 {"b.py": "modified", "c.py": "removed"})
+                self.assertAlmostEqual(delta["delta"], index.total() - index.total(first["snapshot"]))
+
+    def test_migrates_unversioned_index(self):
+        looped = "def f(items, cfg):\n    for x in items:\n        print(x * cfg.scale.factor)\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            self.root = os.path.join(tmp, "repo")
+            os.makedirs(self.root)
+            self.write("a.py", looped)
+            self.write("b.py", "x = [1, 2]\n")
+            path = os.path.join(tmp, "index.sqlite3")
+            with EmissionIndex(path) as index:
+                index.update(self.root)
+            # Rewrite the database in the layout used before contents were versioned
+            conn = sqlite3.connect(path)
+            conn.executescript("""
+                CREATE TABLE old_contents AS SELECT hash, loop_count, operation_count, memory_operations,
+                    function_calls, line_count, complexity_score, emissions FROM contents;
+                DROP TABLE contents;
+                ALTER TABLE old_contents RENAME TO contents;
+                CREATE TABLE old_snapshots (id INTEGER PRIMARY KEY AUTOINCREMENT, label TEXT, root TEXT NOT NULL,
+                    created REAL NOT NULL, files INTEGER NOT NULL, total_emissions REAL NOT NULL);
+                INSERT INTO old_snapshots SELECT id, label, root, created, files, total_emissions FROM snapshots;
+                DROP TABLE snapshots;
+                ALTER TABLE old_snapshots RENAME TO snapshots;
+                UPDATE contents SET emissions = 1.0 WHERE loop_count > 0;
+            """)
+            conn.close()
+
+            with EmissionIndex(path) as index:
+                self.assertEqual(index.top(1)[0]["emissions"], 1.0)
+                # Only content with loops can score differently now
+                second = index.update(self.root)
+                self.assertEqual((second["scanned"], second["reused"]), (1, 1))
+                self.assertEqual(index.top(1)[0]["emissions"], calculate_emissions(looped))
+                self.assertEqual(index.top(1, snapshot=1)[0]["emissions"], 1.0)
+                [change] = index.delta(1)["files"]
+                self.assertEqual((change["path"], change["status"]), ("a.py", "modified"))
+                self.assertEqual(index.update(self.root)["reused"], 2)
+            conn = sqlite3.connect(path)
+            self.assertEqual(conn.execute("SELECT version, loop_count, invariant_computations FROM contents "
+                                          "ORDER BY version, loop_count").fetchall(),
+                             [("1", 0, 0), ("1", 1, 0), ("2", 0, 0), ("2", 1, 1)])
+            conn.close()
+
+class TestIncrementalAnalyzer(unittest.TestCase):
+    code = """
+import os
+data = []
+message = ""
+message += "a"
+
+def first(items):
+    for i in range(len(items)):
+        print(items[i])
+
+@staticmethod
+def second():
+    return sorted(data)
+
+message += "b"
+message += "c"
+sorted(data)
+"""
+
+    def test_split_chunks(self):
+        starts = [start for start, _ in split_chunks(self.code.splitlines())]
+        self.assertEqual(starts, [1, 7, 11, 15])
+
+    def test_matches_full_analysis(self):
+        full_issues, full_code = CodeAnalyzer(self.code).analyze()
+        issues, optimized_code = IncrementalAnalyzer().analyze(self.code)
+        key = lambda i: (i["line"], i["issue"])
+        self.assertEqual(sorted(issues, key=key), sorted(full_issues, key=key))
+        self.assertEqual(optimized_code, full_code)
+
+    def test_only_changed_chunks_reanalyzed(self):
+        analyzer = IncrementalAnalyzer()
+        analyzer.analyze(self.code)
+        # Growing one function shifts every later chunk down a line
+        edited = self.code.replace("print(items[i])", "print(items[i])\n        print(i)")
+        issues, _ = analyzer.analyze(edited)
+        self.assertEqual((analyzer.chunks_analyzed, analyzer.chunks_reused), (1, 3))
+        full_issues, _ = CodeAnalyzer(edited).analyze()
+        key = lambda i: (i["line"], i["issue"])
+        self.assertEqual(sorted(issues, key=key), sorted(full_issues, key=key))
+
+class TestJobQueue(unittest.TestCase):
+    def wait_for(self, queue, job_id):
+        for _ in range(200):
+            job = queue.status(job_id)
+            if job["status"] in ("finished", "failed"):
+                return job
+            time.sleep(0.01)
+        self.fail("job did not finish")
+
+    def test_job_lifecycle(self):
+        queue = JobQueue(max_workers=1)
+        job_id = queue.submit(calculate_emissions, "for i in range(10):\n    print(i)\n")
+        job = self.wait_for(queue, job_id)
+        self.assertEqual(job["status"], "finished")
+        self.assertGreater(job["result"], 0)
+
+        failed = self.wait_for(queue, queue.submit(calculate_emissions, "def broken(:"))
+        self.assertEqual(failed["status"], "failed")
+        self.assertIn("SyntaxError", failed["error"])
+        self.assertIsNone(queue.status("missing"))
+        queue.shutdown()
+
+    def test_rejects_when_full(self):
+        queue = JobQueue(max_workers=1, max_pending=1)
+        release = threading.Event()
+        queue.submit(release.wait)
+        with self.assertRaises(QueueFullError):
+            queue.submit(release.wait)
+        release.set()
+        queue.shutdown()
+
+@unittest.skipUnless(flask, "flask is not installed")
+class TestWebApp(unittest.TestCase):
+    range_len = "for i in range(len(items)):\n    print(items[i])\n"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.web = cls.load_app()
+        cls.client = cls.web.app.test_client()
+
+    @classmethod
+    def load_app(cls, **env):
+        # The app builds its cache and pools on import; keep them out of the working tree
+        env = {"RESULT_CACHE_PATH": os.path.join(cls.tmp.name, "results.sqlite3"), "SCORING_WORKERS": "1", **env}
+        with patch.dict(os.environ, env):
+            import app as web
+            return importlib.reload(web)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp(dir=self.tmp.name)
+        for name, value in (("result_cache", ResultCache(os.path.join(tmp, "results.sqlite3"))),
+                            ("download_store", DownloadStore(os.path.join(tmp, "optimized")))):
+            patcher = patch.object(self.web, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_index(self):
+        self.assertEqual(self.client.get("/").status_code, 200)
+        response = self.client.post("/", data={"code_input": self.range_len})
+        self.assertEqual(response.status_code, 200)
+        page = response.get_data(as_text=True)
+        self.assertIn("range(len()) antipattern", page)
+        self.assertIn("data:image/svg+xml;base64,", page)
+
+    def test_index_with_unparseable_rewrite(self):
+        code = "def f(x):\n" + "".join(f"    {'if' if i == 0 else 'elif'} x == {i}:\n        return {i}\n"
+                                       for i in range(4))
+        response = self.client.post("/", data={"code_input": code})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Long if-elif chain", response.get_data(as_text=True))
+
+    def test_api_analyze(self):
+        response = self.client.post("/api/analyze", json={"code": self.range_len})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["issues"][0]["issue"], "range(len()) antipattern")
+
+        response = self.client.post("/api/analyze", json={"files": [{"path": "good.py", "code": self.range_len},
+                                                                   {"path": "broken.py", "code": "def broken(:"}]})
+        self.assertEqual(response.status_code, 200)
+        good, broken = response.get_json()["results"]
+        self.assertEqual((good["path"], good["error"]), ("good.py", None))
+        self.assertIn("SyntaxError", broken["error"])
+
+        self.assertEqual(self.client.post("/api/analyze", json={"code": "def broken(:"}).status_code, 422)
+        self.assertEqual(self.client.post("/api/analyze", data=b"").status_code, 400)
+
+    def test_api_analyze_reports_bad_input(self):
+        response = self.client.post("/api/analyze", json={"files": [{"path": "null.py", "code": "x = 1\0"},
+                                                                   {"path": "good.py", "code": self.range_len}]})
+        self.assertEqual(response.status_code, 200)
+        failed, good = response.get_json()["results"]
+        self.assertEqual(failed["path"], "null.py")
+        self.assertTrue(failed["error"])
+        self.assertIsNone(good["error"])
+
+        for payload in ({"files": ["print(1)"]}, {"files": [{"path": "a.py", "code": 1}]},
+                        {"files": [{"path": None, "code": "x = 1"}]}, {"code": 123}, {"code": None},
+                        {"code": "x = 1", "path": ["a.py"]}):
+            response = self.client.post("/api/analyze", json=payload)
+            self.assertEqual(response.status_code, 400, payload)
+            self.assertIn("error", response.get_json())
+        for field in ("files", "file"):
+            upload = {field: (io.BytesIO(b"name = '\xff'\n"), "latin1.py")}
+            response = self.client.post("/api/analyze", data=upload, content_type="multipart/form-data")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("UTF-8", response.get_json()["error"])
+
+    def test_crlf_sources_match_lf(self):
+        crlf = self.range_len.replace("\n", "\r\n")
+        expected = self.client.post("/api/analyze", json={"code": self.range_len}).get_json()
+        for response in (self.client.post("/api/analyze", json={"code": crlf}),
+                         self.client.post("/api/analyze", json={"files": [{"path": "input_code.py", "code": crlf}]}),
+                         self.client.post("/api/analyze", data=crlf.encode(), content_type="text/plain"),
+                         self.client.post("/api/analyze", data={"file": (io.BytesIO(crlf.encode()), "crlf.py")},
+                                          content_type="multipart/form-data")):
+            result = response.get_json()
+            result = result["results"][0] if "results" in result else result
+            result["path"] = expected["path"]
+            self.assertEqual(result, expected)
+        self.assertEqual(self.client.post("/", data={"code_input": crlf}).status_code, 200)
+        self.assertEqual(self.client.get("/cache/stats").get_json()["misses"], 1)
+
+    def test_job_lifecycle(self):
+        response = self.client.post("/jobs", data={"code_input": self.range_len})
+        self.assertEqual(response.status_code, 202)
+        urls = response.get_json()
+        for _ in range(500):
+            result = self.client.get(urls["result_url"])
+            if result.status_code != 409:
+                break
+            time.sleep(0.01)
+        self.assertEqual(result.status_code, 200, result.get_json())
+        self.assertEqual(result.get_json()["issues"][0]["issue"], "range(len()) antipattern")
+        self.assertEqual(self.client.get(urls["status_url"]).get_json()["status"], "finished")
+        self.assertEqual(self.client.get("/jobs/unknown/result").status_code, 404)
+
+    def test_download_and_cache_stats(self):
+        page = self.client.post("/", data={"code_input": self.range_len}).get_data(as_text=True)
+        [url] = re.findall(r'href="(/download/[^"]+)"', page)
+        response = self.client.get(url.replace("&amp;", "&"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"enumerate", response.data)
+        self.assertEqual(self.client.get("/download/" + "0" * 64).status_code, 404)
+        self.assertEqual(self.client.get("/cache/stats").get_json()["misses"], 1)
+
+    def test_download_outside_app_directory(self):
+        cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp(dir=self.tmp.name))
+        self.addCleanup(os.chdir, cwd)
+        with patch.object(self.web, "download_store", DownloadStore("optimized")):
+            page = self.client.post("/", data={"code_input": self.range_len}).get_data(as_text=True)
+            [url] = re.findall(r'href="(/download/[^"]+)"', page)
+            self.assertEqual(self.client.get(url.replace("&amp;", "&")).status_code, 200)
+
+    def test_chart_requires_emissions(self):
+        self.assertEqual(self.client.get("/chart.png").status_code, 400)
+
+    def test_metrics_include_analysis_timings(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        self.addCleanup(self.load_app)
+        self.addCleanup(instrumentation.disable)
+        client = self.load_app(ANALYZER_INSTRUMENTATION="1").app.test_client()
+        self.assertEqual(client.post("/", data={"code_input": self.range_len}).status_code, 200)
+        body = client.get("/metrics").get_data(as_text=True)
+        self.assertIn('analyzer_rule_issues_total{rule="LoopRule"} 1', body)
+        self.assertIn('analyzer_phase_calls_total{phase="emission"}', body)
+
+class TestCharts(unittest.TestCase):
+    def test_emissions_svg(self):
+        svg = emissions_svg(0.004, 0.002)
+        root = ElementTree.fromstring(svg)
+        heights = [float(rect.get("height")) for rect in root.iter("{http://www.w3.org/2000/svg}rect")]
+        self.assertEqual(len(heights), 2)
+        self.assertAlmostEqual(heights[0], heights[1] * 2, places=0)
+        self.assertIn("0.004000", svg)
+        self.assertTrue(emissions_svg_data_url(0.004, 0.002).startswith("data:image/svg+xml;base64,"))
+
+    def test_zero_emissions(self):
+        root = ElementTree.fromstring(emissions_svg(0.0, 0.0))
+        self.assertTrue(all(float(r.get("height")) == 0 for r in root.iter("{http://www.w3.org/2000/svg}rect")))
+
 if __name__ == "__main__":
     unittest.main()